@@ -0,0 +1,67 @@
+"""Compare compact druid arrays with JSON text on stored size and decode time.
+
+Run from the repository root, with henge installed:
+
+    python benchmarks/bench_compact.py [array_width]
+"""
+
+import sys
+import time
+
+from henge import Henge, md5, sha512t24u_digest
+from henge.henge import _decode_druid_array, _encode_druid_array
+from henge.serializer import get_serializer
+
+SCHEMAS = ["tests/data/family.yaml"]
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    serializer = get_serializer()
+    print(
+        "{:<22}{:>14}{:>14}{:>16}{:>16}".format(
+            "druids", "JSON bytes", "compact bytes", "JSON decode ms", "compact ms"
+        )
+    )
+    for name, digest in [("md5", md5), ("sha512t24u", sha512t24u_digest)]:
+        druids = [digest(str(i)) for i in range(width)]
+        text = serializer.dumps(druids)
+        compact = _encode_druid_array(druids)
+        assert _decode_druid_array(compact) == druids
+        print(
+            "{:<22}{:>14}{:>14}{:>16.3f}{:>16.3f}".format(
+                "{} x {}".format(width, name),
+                len(text),
+                len(compact),
+                timed(lambda: serializer.loads(text), 50) * 1000,
+                timed(lambda: _decode_druid_array(compact), 50) * 1000,
+            )
+        )
+
+    family = {
+        "domicile": {"address": "1 Main St"},
+        "parents": [{"name": "Pat", "age": 38}],
+        "children": [{"name": "Kid{}".format(i), "age": i % 18} for i in range(width)],
+    }
+    print("\n{:<22}{:>14}{:>16}".format("family retrieval", "stored bytes", "ms"))
+    for compact_arrays in [False, True]:
+        h = Henge({}, SCHEMAS, compact_arrays=compact_arrays)
+        druid = h.insert(family, "family")
+        print(
+            "{:<22}{:>14}{:>16.1f}".format(
+                "compact" if compact_arrays else "JSON",
+                h.stats()["bytes"],
+                timed(lambda: h.retrieve(druid), 5) * 1000,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare inserts with and without memoized subtrees, with and without repeats.
+
+Run from the repository root, with henge installed:
+
+    python benchmarks/bench_insert_memo.py [families]
+"""
+
+import sys
+import time
+
+from henge import Henge
+
+SCHEMAS = ["tests/data/family.yaml"]
+
+
+def families(n, repeated):
+    """Families of 50 children; with repeats, all families are alike"""
+    return [
+        {
+            "domicile": {"address": "{} Main St".format(0 if repeated else i)},
+            "parents": [{"name": "Pat{}".format(0 if repeated else i), "age": 38}],
+            "children": [
+                {"name": "Kid{}".format(j if repeated else i * 50 + j), "age": j % 18}
+                for j in range(50)
+            ],
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print("{:<30}{:>12}{:>10}{:>10}".format("inserts", "ms", "hits", "misses"))
+    for repeated in [False, True]:
+        items = families(n, repeated)
+        runs = [
+            ("insert", False, False),
+            ("insert, memoized", True, False),
+            ("insert, session", True, True),
+        ]
+        for name, memoize, session in runs:
+            h = Henge({}, SCHEMAS, memoize_inserts=memoize)
+            start = time.perf_counter()
+            if session:
+                with h.insert_session():
+                    for item in items:
+                        h.insert(item, "family")
+            else:
+                for item in items:
+                    h.insert(item, "family")
+            elapsed = time.perf_counter() - start
+            info = h.memo_info()
+            print(
+                "{:<30}{:>12.1f}{:>10}{:>10}".format(
+                    "{}{}".format(name, " (repeats)" if repeated else ""),
+                    elapsed * 1000,
+                    info["hits"],
+                    info["misses"],
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
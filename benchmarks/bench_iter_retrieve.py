@@ -0,0 +1,56 @@
+"""Compare retrieving a wide array whole and streaming it, on time and memory.
+
+Run from the repository root, with henge installed:
+
+    python benchmarks/bench_iter_retrieve.py [array_width]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from henge import Henge
+
+SCHEMAS = ["tests/data/family.yaml"]
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def consume(iterator):
+    for _ in iterator:
+        pass
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    h = Henge({}, SCHEMAS)
+    parents = [{"name": "Person{}".format(i), "age": i % 90} for i in range(width)]
+    druid = h.insert({"parents": parents}, "family")
+    array = h.retrieve(druid, reclimit=0)["parents"]
+    print("{:<34}{:>12}{:>16}".format("{} elements".format(width), "ms", "peak MiB"))
+    runs = [("retrieve", lambda: h.retrieve(array))]
+    for chunk_size in [100, 1000, 10000]:
+        for prefetch in [0, 1]:
+            runs.append(
+                (
+                    "iter_retrieve {} prefetch {}".format(chunk_size, prefetch),
+                    lambda c=chunk_size, p=prefetch: consume(
+                        h.iter_retrieve(array, chunk_size=c, prefetch=p)
+                    ),
+                )
+            )
+    for name, function in runs:
+        elapsed, peak = measure(function)
+        print("{:<34}{:>12.1f}{:>16.1f}".format(name, elapsed * 1000, peak / 2**20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compare the canonical serializers on encoding, decoding, and a henge.
+
+Run from the repository root, with henge installed:
+
+    python benchmarks/bench_serializer.py [array_width]
+"""
+
+import sys
+import time
+
+from henge import Henge, md5
+from henge.serializer import SERIALIZERS, get_serializer
+
+SCHEMAS = ["tests/data/family.yaml"]
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def families(n, width):
+    return [
+        {
+            "domicile": {"address": "{} Main St".format(i)},
+            "parents": [{"name": "Pat", "age": 30 + i % 40}],
+            "children": [
+                {"name": "Kid{}".format(j), "age": j % 18} for j in range(width)
+            ],
+        }
+        for i in range(n)
+    ]
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    druids = [md5(str(i)) for i in range(width)]
+    person = {"name": "Pat", "age": 38, "address": "123 Main St"}
+    items = families(20, width // 100)
+    print(
+        "{:<10}{:>16}{:>16}{:>14}{:>14}{:>12}{:>12}".format(
+            "engine",
+            "dumps array/s",
+            "loads array/s",
+            "dumps obj/s",
+            "loads obj/s",
+            "insert/s",
+            "retrieve/s",
+        )
+    )
+    for name in SERIALIZERS:
+        try:
+            serializer = get_serializer(name)
+        except ImportError:
+            print("{:<10}not installed".format(name))
+            continue
+        array_string = serializer.dumps(druids)
+        person_string = serializer.dumps(person)
+        h = Henge({}, SCHEMAS, serializer=serializer)
+        start = time.perf_counter()
+        stored = h.insert_many(items, "family")
+        insert_time = time.perf_counter() - start
+        retrieve_time = timed(lambda: h.retrieve_many(stored), 3)
+        print(
+            "{:<10}{:>16.0f}{:>16.0f}{:>14.0f}{:>14.0f}{:>12.0f}{:>12.0f}".format(
+                name,
+                1 / timed(lambda: serializer.dumps(druids), 50),
+                1 / timed(lambda: serializer.loads(array_string), 50),
+                1 / timed(lambda: serializer.dumps(person), 20000),
+                1 / timed(lambda: serializer.loads(person_string), 20000),
+                len(items) / insert_time,
+                len(items) / retrieve_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
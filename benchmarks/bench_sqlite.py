@@ -0,0 +1,75 @@
+"""Compare the SQLite backend with the dict backend on insert and retrieve.
+
+Run from the repository root, with henge installed:
+
+    python benchmarks/bench_sqlite.py [n_families]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from henge import Henge
+from henge.sqlite import SQLiteDict
+
+SCHEMAS = ["tests/data/family.yaml"]
+
+
+def families(n):
+    return [
+        {
+            "domicile": {"address": "{} Main St".format(i)},
+            "parents": [
+                {"name": "Pat", "age": 30 + i % 40},
+                {"name": "Kim{}".format(i), "age": 40},
+            ],
+            "children": [{"name": "Sam{}".format(i % 100), "age": i % 18}],
+        }
+        for i in range(n)
+    ]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(name, database, items, batch_size=1000):
+    h = Henge(database, SCHEMAS)
+    druids = []
+    insert_time = 0
+    for start in range(0, len(items), batch_size):
+        batch, elapsed = timed(
+            h.insert_many, items[start : start + batch_size], "family"
+        )
+        druids.extend(batch)
+        insert_time += elapsed
+    retrieved, retrieve_time = timed(h.retrieve_many, druids)
+    assert retrieved == items
+    _, single_time = timed(lambda: [h.retrieve(d) for d in druids[:1000]])
+    print(
+        "{:<10}{:>12.0f}{:>14.0f}{:>14.0f}".format(
+            name,
+            len(items) / insert_time,
+            len(items) / retrieve_time,
+            min(len(druids), 1000) / single_time,
+        )
+    )
+
+
+def main(n=20000):
+    items = families(n)
+    print("{} families; items per second".format(n))
+    print(
+        "{:<10}{:>12}{:>14}{:>14}".format("backend", "insert", "retrieve", "retrieve 1")
+    )
+    run("dict", {}, items)
+    with tempfile.TemporaryDirectory() as tmp:
+        with SQLiteDict(os.path.join(tmp, "henge.db")) as database:
+            run("sqlite", database, items)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,53 @@
+"""Measure startup: `import henge`, and constructing a Henge, in fresh processes.
+
+Construction is timed without a schema cache, and with a warm one. Run from
+the repository root, with henge installed:
+
+    python benchmarks/bench_startup.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SCHEMAS = ["tests/data/family.yaml", "tests/data/annotated_sequence_digest.yaml"]
+
+SCRIPT = """
+import time
+start = time.perf_counter()
+import henge
+imported = time.perf_counter()
+henge.Henge({{}}, {schemas!r}, schema_cache={cache!r})
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def measure(cache, runs):
+    """Median import and construction times, in ms, over fresh interpreters"""
+    code = SCRIPT.format(schemas=SCHEMAS, cache=cache)
+    imports, constructions = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        import_time, construct_time = map(float, output.split())
+        imports.append(import_time * 1000)
+        constructions.append(construct_time * 1000)
+    return statistics.median(imports), statistics.median(constructions)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print("{:<20}{:>12}{:>16}".format("schema cache", "import ms", "construct ms"))
+    with tempfile.TemporaryDirectory() as cache:
+        measure(cache, 1)  # Warm the cache
+        for name, path in [("none", None), ("warm", cache)]:
+            import_ms, construct_ms = measure(path, runs)
+            print("{:<20}{:>12.1f}{:>16.1f}".format(name, import_ms, construct_ms))
+
+
+if __name__ == "__main__":
+    os.environ.pop("HENGE_SCHEMA_CACHE", None)
+    main()
@@ -0,0 +1,45 @@
+"""Compare per-call jsonschema.validate with Henge's cached validators.
+
+Run from the repository root, with henge installed:
+
+    python benchmarks/bench_validation.py
+"""
+
+import timeit
+
+import jsonschema
+
+from henge import Henge
+
+ITEMS = {
+    "tests/data/person.yaml": ("person", {"name": "Pat", "age": 38}),
+    "tests/data/string.yaml": ("mystring", "TCGATCGA"),
+    "tests/data/simple_array.yaml": ("array", ["a", "b", "c", "d"]),
+    "tests/data/annotated_sequence_digest.yaml": (
+        "annotated_sequence_digest",
+        {"name": "chr1", "length": 10, "topology": "linear", "sequence_digest": "x"},
+    ),
+}
+
+
+def main(number=20000):
+    print(
+        "{:<28}{:>14}{:>14}{:>14}".format("item type", "validate", "compiled", "fast")
+    )
+    for path, (item_type, item) in ITEMS.items():
+        fast = Henge(database={}, schemas=[path])
+        slow = Henge(database={}, schemas=[path], fast_validation=False)
+        schema = fast.schemas[item_type]
+        timings = [
+            timeit.timeit(lambda: jsonschema.validate(item, schema), number=number),
+            timeit.timeit(lambda: slow.validate(item, item_type), number=number),
+            timeit.timeit(lambda: fast.validate(item, item_type), number=number),
+        ]
+        print(
+            "{:<28}".format(item_type)
+            + "".join("{:>12.2f}us".format(t / number * 1e6) for t in timings)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,32 @@
 
 from ._version import __version__
 from .henge import *
+from .federation import Delegate, RemoteHengeError
 
-__classes__ = ["Henge"]
+__classes__ = [
+    "Henge",
+    "AsyncHenge",
+    "AsyncDict",
+    "AsyncMappingAdapter",
+    "Delegate",
+    "InsertMemo",
+]
 __all__ = __classes__ + [
     "connect_mongo",
     "split_schema",
     "NotFoundException",
+    "RemoteHengeError",
     "canonical_str",
+    "md5",
     "sha512t24u_digest",
+    "migrate_to_packed",
 ]
+
+
+def __getattr__(name):
+    # The asyncio interface is only imported when used, as asyncio is slow to import
+    if name in ["AsyncHenge", "AsyncDict", "AsyncMappingAdapter"]:
+        from . import aio
+
+        return getattr(aio, name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,488 @@
+"""Asyncio interface to insert and retrieve items, over async backends"""
+
+import asyncio
+import inspect
+import logging
+import weakref
+
+from collections import deque
+from contextlib import aclosing
+
+from .henge import (
+    Henge,
+    _InsertBatch,
+    _WRITES,
+    _clear,
+    _contains_many,
+    _delete_many,
+    _execute,
+    _get_many,
+    _set_many,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _is_async(database, method):
+    return inspect.iscoroutinefunction(getattr(database, method, None))
+
+
+class AsyncHenge(Henge):
+    """
+    A Henge with awaitable insert and retrieve methods.
+
+    Inserts and retrievals have the same semantics as in Henge, and share its
+    code: only the backend operations are awaited instead of called. Each
+    backend is used through the first of these that it has:
+
+    - async `get_many(keys)`, `set_many(pairs)` and `contains_many(keys)`,
+      called once per tree level (see Henge.retrieve_many);
+    - async `get(key)` and `set(key, value)`, called concurrently for all keys
+      of a tree level, so sibling sub-items are fetched at the same time;
+    - a synchronous Mapping, such as a dict, which is used directly and so
+      must not block; wrap others in an AsyncMappingAdapter.
+
+    At most `concurrency` backend calls are in flight at once, per call to an
+    AsyncHenge method. Henge methods that would have to read the backend
+    synchronously, such as reindex, show, len() or lazy retrieval, raise
+    instead; use a Henge over the same store for those.
+    """
+
+    def __init__(self, database, schemas, concurrency: int = 32, **kwargs) -> None:
+        """
+        :param database: Async backend for items; see AsyncHenge.
+        :param list schemas: A list of file paths containing YAML jsonschema
+            schemas describing the data types stored by this Henge.
+        :param int concurrency: Maximum number of concurrent backend calls.
+        :param kwargs: Other arguments, as in Henge.
+        """
+        super(AsyncHenge, self).__init__(database, schemas, **kwargs)
+        self.concurrency = concurrency
+        self._index_locks = weakref.WeakKeyDictionary()  # event loop -> lock
+
+    async def retrieve(
+        self, druid: str, reclimit: int = None, raw: bool = False, lazy: bool = False
+    ) -> dict | list:
+        """
+        Retrieve an item given a digest; see Henge.retrieve.
+
+        :param str druid: The DRUID of the item to retrieve.
+        :param int reclimit: Recursion limit. Set to None for no limit (default).
+        :param bool raw: As in Henge.retrieve, so arguments line up with it.
+        :param bool lazy: Not supported: lazy proxies read sub-items when
+            they're accessed, which can't be awaited. Use iter_retrieve to
+            read a large array a chunk at a time.
+        """
+        if lazy:
+            raise NotImplementedError(
+                "AsyncHenge can't retrieve lazily, as proxies would read the "
+                "async backend synchronously; use retrieve with a reclimit, "
+                "or iter_retrieve"
+            )
+        return (await self.retrieve_many([druid], reclimit))[0]
+
+    async def lookup(self, druid: str, item_type: str) -> str:
+        """
+        Read the canonical string of an item; see Henge.lookup.
+
+        :param str druid: The druid of the item.
+        :param str item_type: The type of the item.
+        :return str: The canonical string of the item.
+        """
+        return await self._arun(self._lookup_plan(druid, item_type))
+
+    async def retrieve_many(self, druids: list[str], reclimit: int = None) -> list:
+        """
+        Retrieve many items given their digests; see Henge.retrieve_many.
+
+        :param list[str] druids: The druids of the items to retrieve.
+        :param int reclimit: Recursion limit. Set to None for no limit (default).
+        :return list: The retrieved items, in the order of the druids.
+        """
+        return await self._arun(self._retrieve_plan(druids, reclimit))
+
+    async def iter_retrieve(
+        self,
+        druid: str,
+        reclimit: int = None,
+        chunk_size: int = 1000,
+        start: int = 0,
+        chunks: bool = False,
+        prefetch: int = 1,
+    ):
+        """
+        Retrieve the elements of an array one at a time, or a chunk at a time;
+        see Henge.iter_retrieve. The next `prefetch` chunks are retrieved in
+        tasks while the current one is consumed.
+
+        Use like: async for element in h.iter_retrieve(druid): ...
+        """
+        records = await self._arun(self._read_nodes_plan([druid]))
+        batches, nested = self._element_batches(
+            druid, records[druid], reclimit, chunk_size, start
+        )
+        if nested:
+            child_reclimit = reclimit - 1 if isinstance(reclimit, int) else None
+            batches = _aprefetched(
+                lambda batch: self.retrieve_many(batch, child_reclimit),
+                batches,
+                prefetch,
+            )
+        else:
+            batches = _aiter(batches)
+        async with aclosing(batches):
+            async for batch in batches:
+                if chunks:
+                    yield batch
+                else:
+                    for element in batch:
+                        yield element
+
+    async def insert(
+        self, item: dict | list, item_type: str, reclimit: int = None
+    ) -> str | bool:
+        """
+        Add a structured item of a specified type; see Henge.insert.
+
+        :param item: The item to add.
+        :param str item_type: A string specifying the type of item.
+        :param int reclimit: Recursion limit, as in Henge.insert.
+        :return str: The druid of the item.
+        """
+        druids = await self.insert_many([item], item_type, reclimit)
+        return druids and druids[0]
+
+    async def insert_many(
+        self, items: list, item_type: str, reclimit: int = None
+    ) -> list[str] | bool:
+        """
+        Add many structured items of the same type; see Henge.insert_many.
+
+        :param list items: Items to add.
+        :param str item_type: A string specifying the type of the items.
+        :param int reclimit: Recursion limit, as in Henge.insert.
+        :return list[str]: The druids of the items, in input order.
+        """
+        if item_type not in self.schemas.keys():
+            _LOGGER.error(
+                "I don't know about items of type '{}'. I know of: '{}'".format(
+                    item_type, list(self.schemas.keys())
+                )
+            )
+            return False
+
+        # Flattening and validation don't touch the backend
+        batch = _InsertBatch(self._insert_session)
+        druids = [self._insert(item, item_type, reclimit, batch) for item in items]
+        if self.index_items:
+            # Probing, writing and indexing together; see Henge._write_batch
+            async with self._index_lock_for_loop():
+                new, rewritten = await self._arun(self._write_plan(batch))
+                await self._arun(self._index_plan(new, rewritten))
+                self._remember_batch(batch)
+        else:
+            await self._arun(self._write_plan(batch))
+            self._remember_batch(batch)
+        return druids
+
+    async def delete(
+        self, druids: list[str], cascade: bool = False, batch_size: int = 1000
+    ) -> int:
+        """
+        Remove items, with all their metadata; see Henge.delete.
+
+        :param list[str] druids: Druids of the items to remove.
+        :param bool cascade: Also remove sub-items left unreferenced.
+        :param int batch_size: Number of items to remove at a time.
+        :return int: The number of items removed.
+        """
+        async with self._index_lock_for_loop():
+            plan = self._delete_plan(druids, cascade, (), batch_size)
+            return await self._arun(plan)
+
+    async def gc(self, roots: list[str], batch_size: int = 1000) -> int:
+        """
+        Remove all items that can't be reached from the given roots; see
+        Henge.gc.
+
+        :param list[str] roots: Druids of the items to keep.
+        :param int batch_size: Number of druids to check and remove at a
+            time.
+        :return int: The number of items removed.
+        """
+        async with self._index_lock_for_loop():
+            return await self._arun(self._gc_plan(roots, batch_size))
+
+    async def clean(self, item_type: str = None, batch_size: int = 10000) -> None:
+        """
+        Remove all items, or all items of one type; see Henge.clean.
+
+        Removing all items needs a backend with a `clear` method.
+
+        :param str item_type: Remove only items of this type. Default: all.
+        :param int batch_size: Number of items to delete at a time.
+        """
+        async with self._index_lock_for_loop():
+            if item_type is None:
+                if _is_async(self.database, "clear"):
+                    await self.database.clear()
+                else:
+                    _clear(self.database, batch_size)
+            else:
+                await self._arun(self._clean_plan(item_type, batch_size))
+        self.invalidate_cache()
+
+    async def list(
+        self,
+        limit: int = 1000,
+        offset: int = 0,
+        item_type: str = None,
+        cursor: str = None,
+    ) -> dict:
+        """
+        List druids of stored items, by item type; see Henge.list.
+
+        :param int limit: Maximum number of druids to list.
+        :param int offset: Number of druids to skip, if no cursor is given.
+        :param str item_type: List only items of this type. Default: all.
+        :param str cursor: Continue after a previous call, from its "cursor".
+        """
+        return await self._arun(self._list_plan(limit, offset, item_type, cursor))
+
+    async def stats(self) -> dict:
+        """
+        Count the stored items, and their total size, by item type; see
+        Henge.stats.
+        """
+        return await self._arun(self._stats_plan())
+
+    def __len__(self):
+        # len() can't await the backend; see AsyncHenge.stats
+        raise TypeError(
+            "len() of an AsyncHenge would read its async backend synchronously; "
+            "use (await h.stats())['items']"
+        )
+
+    def reindex(self, batch_size: int = 10000) -> int:
+        # Scanning needs key iteration, which async backends don't offer
+        raise NotImplementedError(
+            "AsyncHenge can't scan its backend to reindex; call reindex on a "
+            "Henge over the same store"
+        )
+
+    def show(self):
+        raise NotImplementedError(
+            "AsyncHenge can't scan its backend; call show on a Henge over the "
+            "same store"
+        )
+
+    def _lazy_many(self, druids, reclimit):
+        raise NotImplementedError("AsyncHenge can't retrieve lazily")
+
+    def _index_lock_for_loop(self):
+        """The lock serializing index appends of coroutines in this loop"""
+        loop = asyncio.get_running_loop()
+        if loop not in self._index_locks:
+            self._index_locks[loop] = asyncio.Lock()
+        return self._index_locks[loop]
+
+    def _check_existing_druid(self, druid, item_type):
+        # Only logs; reading the async backend synchronously isn't possible
+        _LOGGER.debug("Using druid {} as a sub-item of {}".format(druid, item_type))
+
+    async def _arun(self, plan):
+        """
+        Carry out an I/O plan, awaiting the operations of each step together.
+
+        See Henge._run.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            operations = next(plan)
+            while True:
+                results = await asyncio.gather(
+                    *[self._aexecute(op, semaphore) for op in operations]
+                )
+                operations = plan.send(list(results))
+        except StopIteration as e:
+            return e.value
+
+    async def _aexecute(self, operation, semaphore):
+        """
+        Carry out one backend operation of an I/O plan; see henge._execute.
+        """
+        action, database, argument = operation
+        delegate = self._delegates.get(id(database))
+        if delegate is not None:
+            write = action in _WRITES
+            future = await delegate.asubmit(
+                self._executor, _execute, operation, wait=delegate.limit(write)
+            )
+            return await delegate.aresult(future, write)
+        method = {
+            "get": "get_many",
+            "set": "set_many",
+            "contains": "contains_many",
+            "delete": "delete_many",
+        }
+        if _is_async(database, method[action]):
+            if not argument:
+                return {"get": {}, "contains": set()}.get(action)
+            async with semaphore:
+                result = await getattr(database, method[action])(argument)
+            return result if action != "get" else _drop_missing(result)
+        if action == "delete" and _is_async(database, "delete"):
+            await _gather_limited(semaphore, [database.delete(k) for k in argument])
+            return None
+        if action == "set" and _is_async(database, "set"):
+            await _gather_limited(
+                semaphore, [database.set(k, v) for k, v in argument.items()]
+            )
+            return None
+        if action in ["get", "contains"] and _is_async(database, "get"):
+            keys = list(dict.fromkeys(argument))
+            values = await _gather_limited(
+                semaphore, [database.get(key) for key in keys]
+            )
+            found = {k: v for k, v in zip(keys, values) if v is not None}
+            return found if action == "get" else set(found)
+        return _execute(operation)
+
+
+def _drop_missing(values):
+    return {k: v for k, v in values.items() if v is not None}
+
+
+async def _gather_limited(semaphore, coroutines):
+    async def limited(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*[limited(c) for c in coroutines])
+
+
+async def _aiter(iterable):
+    for value in iterable:
+        yield value
+
+
+async def _aprefetched(fetch, batches, prefetch):
+    """
+    Await fetch for each batch, running up to `prefetch` batches ahead of the
+    consumer in tasks; see henge._prefetched.
+    """
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(asyncio.ensure_future(fetch(batch)))
+            if len(pending) > prefetch:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:  # Also when the consumer stops early
+        for task in pending:
+            task.cancel()
+
+
+class AsyncDict(object):
+    """
+    An in-memory async backend, mostly for tests.
+
+    Each call yields to the event loop, like a networked backend would.
+    """
+
+    def __init__(self, data: dict = None) -> None:
+        """
+        :param dict data: Initial contents.
+        """
+        self.data = dict(data or {})
+
+    async def get(self, key, default=None):
+        await asyncio.sleep(0)
+        return self.data.get(key, default)
+
+    async def set(self, key, value) -> None:
+        await asyncio.sleep(0)
+        self.data[key] = value
+
+    async def delete(self, key) -> None:
+        await asyncio.sleep(0)
+        self.data.pop(key, None)
+
+    async def get_many(self, keys) -> dict:
+        await asyncio.sleep(0)
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    async def set_many(self, pairs) -> None:
+        await asyncio.sleep(0)
+        self.data.update(pairs)
+
+    async def delete_many(self, keys) -> None:
+        await asyncio.sleep(0)
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def clear(self) -> None:
+        await asyncio.sleep(0)
+        self.data.clear()
+
+    async def contains_many(self, keys) -> set:
+        await asyncio.sleep(0)
+        return {key for key in keys if key in self.data}
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return "AsyncDict ({} keys)".format(len(self))
+
+
+class AsyncMappingAdapter(object):
+    """
+    Async backend around a synchronous Mapping backend, such as an RDBDict.
+
+    Each call runs in a worker thread, so blocking queries don't block the
+    event loop. Bulk methods of the wrapped backend are used when it has
+    them; see Henge's custom backend protocol.
+    """
+
+    def __init__(self, mapping) -> None:
+        """
+        :param Mapping mapping: The synchronous backend to wrap.
+        """
+        self.mapping = mapping
+
+    async def get(self, key, default=None):
+        values = await self.get_many([key])
+        return values.get(key, default)
+
+    async def set(self, key, value) -> None:
+        await self.set_many({key: value})
+
+    async def delete(self, key) -> None:
+        await self.delete_many([key])
+
+    async def get_many(self, keys) -> dict:
+        return await asyncio.to_thread(_get_many, self.mapping, list(keys))
+
+    async def set_many(self, pairs) -> None:
+        await asyncio.to_thread(_set_many, self.mapping, pairs)
+
+    async def contains_many(self, keys) -> set:
+        return await asyncio.to_thread(_contains_many, self.mapping, list(keys))
+
+    async def delete_many(self, keys) -> None:
+        await asyncio.to_thread(_delete_many, self.mapping, list(keys))
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(_clear, self.mapping)
+
+    async def close(self) -> None:
+        if hasattr(self.mapping, "close"):
+            await asyncio.to_thread(self.mapping.close)
+
+    def __len__(self):
+        return len(self.mapping)
+
+    def __repr__(self):
+        return "AsyncMappingAdapter ({!r})".format(self.mapping)
@@ -0,0 +1,116 @@
+"""A bounded, thread-safe LRU cache for retrieved items"""
+
+import logging
+import threading
+
+from collections import OrderedDict
+
+_LOGGER = logging.getLogger(__name__)
+
+MISSING = object()  # Returned by LRUCache.get on a miss
+
+
+class LRUCache(object):
+    """
+    A least-recently-used cache bounded by entry count and approximate size.
+
+    Druids are content addresses, so an item retrieved for a druid never
+    changes; entries only need to go away to bound memory, or after the
+    items are removed from the database.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = None) -> None:
+        """
+        :param int max_entries: Maximum number of cached entries.
+        :param int max_bytes: Maximum approximate total size of the cached
+            entries, in bytes. Default: no size limit.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        """
+        Get a cached value, marking it as recently used.
+
+        :param key: The cache key.
+        :param default: Returned if the key is not cached.
+        """
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size: int = 0) -> None:
+        """
+        Cache a value, evicting the least recently used entries if needed.
+
+        :param key: The cache key.
+        :param value: The value to cache. It must not be mutated afterwards.
+        :param int size: Approximate size of the value, in bytes.
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, match=None) -> int:
+        """
+        Remove entries from the cache.
+
+        :param callable match: Function of a key that returns True for the
+            entries to remove. Default: remove all entries.
+        :return int: The number of entries removed.
+        """
+        with self._lock:
+            if match is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return removed
+            keys = [key for key in self._entries if match(key)]
+            for key in keys:
+                self._bytes -= self._entries.pop(key)[1]
+            return len(keys)
+
+    def stats(self) -> dict:
+        """
+        Report cache usage and effectiveness.
+
+        :return dict: Hit, miss and eviction counts, and current size.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return "LRUCache ({} entries, {} bytes)".format(len(self), self._bytes)
@@ -2,3 +2,11 @@ LIBS_BY_BACKEND = {"mongo": ["pymongo", "mongodict"]}
 DELIM_ATTR = ","  # chr(30); separating attributes in an item
 DELIM_ITEM = ","  # separating items in a collection
 ITEM_TYPE = "_item_type"
+DIGEST_VERSION = "_digest_version"
+EXTERNAL_STRING = "_external_string"
+PACKED_RECORD = "\x1e"  # leads a single-key record; can't start a canonical string
+COMPACT_ARRAY = "\x1f"  # leads a compact druid array; can't start one either
+METADATA_SUFFIXES = (ITEM_TYPE, DIGEST_VERSION, EXTERNAL_STRING)
+DIGEST_CHUNK_SIZE = 2**20  # characters or bytes fed to a hash at a time
+HENGE_KEY_PREFIX = "_henge:"  # leads keys of henge indexes; never a druid
+SCHEMA_CACHE_ENV = "HENGE_SCHEMA_CACHE"  # default directory of the schema cache
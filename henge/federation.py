@@ -0,0 +1,248 @@
+"""Guarded access to the databases of delegate (remote) henges"""
+
+import logging
+import threading
+import time
+
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+_LOGGER = logging.getLogger(__name__)
+
+# Use like:
+# h = Henge(db, schemas, henges={"sequence": Delegate(seq_henge, timeout=2.0)})
+
+
+class RemoteHengeError(Exception):
+    """A delegate henge timed out, failed, or is cut off by its breaker"""
+
+    def __init__(self, m):
+        self.message = m
+
+    def __str__(self):
+        return self.message
+
+
+class CircuitBreaker(object):
+    """
+    Stop calling a backend that keeps failing, and retry it later.
+
+    After `failures` consecutive failures the breaker opens, and calls are
+    refused for `reset_after` seconds. Then a single trial call is let
+    through: if it succeeds the breaker closes again, and if it fails the
+    breaker stays open for another `reset_after` seconds.
+    """
+
+    def __init__(self, failures: int = 5, reset_after: float = 30.0) -> None:
+        """
+        :param int failures: Consecutive failures that open the breaker.
+        :param float reset_after: Seconds to refuse calls once open.
+        """
+        self.failures = failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failed = 0  # Consecutive failures
+        self._opened_at = None
+        self._trial = False  # A trial call is in flight
+
+    @property
+    def state(self) -> str:
+        """One of "closed", "open" or "half-open" """
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_after:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failed = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failed += 1
+            if self._trial or self._failed >= self.failures:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class Delegate(object):
+    """
+    A delegate henge, with a timeout and a circuit breaker on its database.
+
+    Pass one in the `henges` argument of a Henge, in place of the delegate
+    henge itself, to tune how it's called; plain henges get the defaults.
+    Backend operations against the delegate's database run on the worker
+    threads of the henge that delegates to it, so operations against
+    different delegates run in parallel. A read that doesn't complete within
+    `timeout` seconds, or an operation that fails, raises a RemoteHengeError,
+    and counts towards opening the breaker. The worker thread of a timed out
+    operation is only released when the backend call returns, so at most
+    `max_concurrency` operations against the delegate occupy worker threads
+    at once: a hung delegate can't take over the threads of the others.
+
+    Writes wait for `write_timeout` seconds, by default as long as they
+    take: a write that timed out may still be applied by the backend later,
+    so its caller couldn't tell whether it was stored.
+    """
+
+    def __init__(
+        self,
+        henge,
+        timeout: float = 10.0,
+        failures: int = 5,
+        reset_after: float = 30.0,
+        write_timeout: float = None,
+        max_concurrency: int = 4,
+    ) -> None:
+        """
+        :param Henge henge: The delegate henge.
+        :param float timeout: Seconds to wait for each backend read. None
+            waits indefinitely.
+        :param int failures: Consecutive failures that open the breaker.
+        :param float reset_after: Seconds to refuse operations once open.
+        :param float write_timeout: Seconds to wait for each backend write.
+            Default: None, wait until it completes.
+        :param int max_concurrency: Most operations to run at once on worker
+            threads. Keep the remote_workers of the delegating henge at least
+            the sum over its delegates, so each can use its share.
+        """
+        self.henge = henge
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(failures, reset_after)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    @property
+    def database(self):
+        return self.henge.database
+
+    def limit(self, write: bool = False):
+        """Seconds to wait for a read, or a write; None waits indefinitely"""
+        return self.write_timeout if write else self.timeout
+
+    def submit(self, executor, function, *args, wait: float = 0):
+        """
+        Start a backend operation on a worker thread, once one of the
+        max_concurrency slots of the delegate is free.
+
+        :param Executor executor: The pool to run the operation on.
+        :param callable function: The operation.
+        :param float wait: Seconds to wait for a free slot. None waits
+            indefinitely. Default: 0, don't wait.
+        :return Future: Pass it to Delegate.result.
+        :raise RemoteHengeError: If no slot freed up in time, or the breaker
+            is open.
+        """
+        if not self._slots.acquire(timeout=wait):
+            raise self._busy()
+        return self._start(executor, function, args)
+
+    async def asubmit(self, executor, function, *args, wait: float = 0):
+        """
+        Start a backend operation on a worker thread, like Delegate.submit,
+        but await a free slot instead of blocking the event loop.
+        """
+        import asyncio  # Only AsyncHenge awaits delegates
+
+        deadline = None if wait is None else time.monotonic() + wait
+        while not self._slots.acquire(blocking=False):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise self._busy()
+            await asyncio.sleep(0.005)
+        return self._start(executor, function, args)
+
+    def _busy(self):
+        return RemoteHengeError(
+            "Delegate henge {!r} has {} operations in flight".format(
+                self.database, self.max_concurrency
+            )
+        )
+
+    def _start(self, executor, function, args):
+        """Submit an operation holding a slot, which it frees when done"""
+        try:
+            if not self.breaker.allow():
+                raise RemoteHengeError(
+                    "Circuit open for delegate henge {!r}".format(self.database)
+                )
+            future = executor.submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def result(self, future, started: float, write: bool = False):
+        """
+        Wait for an operation started by Delegate.submit, up to the timeout.
+
+        :param Future future: The operation.
+        :param float started: time.monotonic() when it was submitted.
+        :param bool write: Whether the operation writes, and so waits up to
+            the write timeout instead.
+        :return: The result of the operation.
+        :raise RemoteHengeError: If it times out or fails.
+        """
+        limit = self.limit(write)
+        timeout = limit
+        if timeout is not None:
+            timeout = max(0, started + timeout - time.monotonic())
+        try:
+            result = future.result(timeout)
+        except FutureTimeoutError:
+            raise self._failure("timed out after {}s".format(limit))
+        except Exception as e:
+            raise self._failure("failed: {}".format(e)) from e
+        self.breaker.record_success()
+        return result
+
+    async def aresult(self, future, write: bool = False):
+        """
+        Await an operation started by Delegate.submit, up to the timeout.
+
+        :param Future future: The operation.
+        :param bool write: Whether the operation writes, and so waits up to
+            the write timeout instead.
+        :return: The result of the operation.
+        :raise RemoteHengeError: If it times out or fails.
+        """
+        import asyncio  # Only AsyncHenge awaits delegates
+
+        limit = self.limit(write)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), limit)
+        except asyncio.TimeoutError:
+            raise self._failure("timed out after {}s".format(limit))
+        except Exception as e:
+            raise self._failure("failed: {}".format(e)) from e
+        self.breaker.record_success()
+        return result
+
+    def _failure(self, reason):
+        self.breaker.record_failure()
+        message = "Delegate henge {!r} {}".format(self.database, reason)
+        _LOGGER.debug(message)
+        return RemoteHengeError(message)
+
+    def __repr__(self):
+        return "Delegate ({!r}, timeout {}s, breaker {})".format(
+            self.database, self.timeout, self.breaker.state
+        )
@@ -1,20 +1,28 @@
 """An interface to a database back-end for DRUIDs"""
 
 import base64
-import copy
 import hashlib
-import jsonschema
 import json
 import logging
 import os
 import sys
-import yacman
-import yaml
+import threading
+import time
 
-from ubiquerg import VersionInHelpParser
+# jsonschema, yacman and yaml are imported where used: construction only
+# needs them for schemas missing from the schema cache, and retrieval never
+
+from collections import deque, namedtuple
+from contextlib import closing, contextmanager
+from itertools import islice
 
 from . import __version__
+from .cache import LRUCache, MISSING
 from .const import *
+from .federation import Delegate
+from .lazy import LazyMapping, LazySequence
+from .schema_cache import SchemaCache
+from .serializer import get_serializer
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -29,15 +37,256 @@ class NotFoundException(Exception):
         return self.message
 
 
-def sha512t24u_digest(seq: str, offset: int = 24) -> str:
-    """GA4GH digest function"""
-    digest = hashlib.sha512(seq.encode()).digest()
-    tdigest_b64us = base64.urlsafe_b64encode(digest[:offset])
+def _iter_bytes(data, chunk_size: int = DIGEST_CHUNK_SIZE):
+    """
+    Yield the UTF-8 encoded bytes of some data in bounded chunks.
+
+    :param data: A str, a bytes-like object, a file opened in text or binary
+        mode, or an iterable of any of those.
+    :param int chunk_size: Maximum characters or bytes per chunk.
+    """
+    if isinstance(data, str):
+        for i in range(0, len(data), chunk_size):
+            yield data[i : i + chunk_size].encode()
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        yield data  # Hashed in place, without a copy
+    elif hasattr(data, "read"):
+        while True:
+            chunk = data.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk.encode() if isinstance(chunk, str) else chunk
+    else:
+        for chunk in data:
+            yield from _iter_bytes(chunk, chunk_size)
+
+
+def sha512t24u_digest(seq, offset: int = 24) -> str:
+    """
+    GA4GH digest function
+
+    :param seq: The data to digest: a str, a bytes-like object, a file, or
+        an iterable of chunks of those. The data is hashed incrementally, so
+        it's never held in memory twice.
+    :param int offset: Number of bytes of the digest to keep.
+    """
+    hasher = hashlib.sha512()
+    for chunk in _iter_bytes(seq):
+        hasher.update(chunk)
+    tdigest_b64us = base64.urlsafe_b64encode(hasher.digest()[:offset])
     return tdigest_b64us.decode("ascii")
 
 
 def md5(seq):
-    return hashlib.md5(seq.encode()).hexdigest()
+    """
+    MD5 digest function
+
+    :param seq: The data to digest, as for sha512t24u_digest.
+    """
+    hasher = hashlib.md5()
+    for chunk in _iter_bytes(seq):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _set_many(database, pairs):
+    """
+    Write many key/value pairs to a database backend.
+
+    Uses the backend's bulk `set_many` method if it has one, and falls back
+    to one write per key otherwise.
+
+    :param Mapping database: The database backend.
+    :param dict pairs: Keys and values to write.
+    """
+    if hasattr(database, "set_many"):
+        return database.set_many(pairs)
+    if isinstance(database, dict):
+        return database.update(pairs)
+    for key, value in pairs.items():
+        database[key] = value
+
+
+def _get(database, key):
+    """Read a key from a database backend, returning None if it's missing"""
+    try:
+        return database[key]
+    except KeyError:
+        return None
+
+
+def _has_get_many(database):
+    """Determine if a database backend provides bulk reads"""
+    return hasattr(database, "get_many")
+
+
+def _node_keys(druids, with_metadata):
+    """List the keys to read for druids, optionally with legacy metadata keys"""
+    if not with_metadata:
+        return druids
+    return [key for d in druids for key in (d, d + ITEM_TYPE, d + EXTERNAL_STRING)]
+
+
+def _get_many(database, keys):
+    """
+    Read many keys from a database backend.
+
+    Uses the backend's bulk `get_many` method if it has one, and falls back
+    to one read per key otherwise.
+
+    :param Mapping database: The database backend.
+    :param list keys: Keys to read.
+    :return dict: Values of the keys that were found.
+    """
+    if not keys:
+        return {}
+    if _has_get_many(database):
+        found = database.get_many(keys)
+    else:
+        found = {key: _get(database, key) for key in keys}
+    return {key: value for key, value in found.items() if value is not None}
+
+
+def _contains_many(database, keys):
+    """
+    Find which of many keys are in a database backend.
+
+    Uses the backend's bulk `contains_many` method if it has one, and falls
+    back to one membership test per key otherwise.
+
+    :param Mapping database: The database backend.
+    :param list keys: Keys to look for.
+    :return set: The keys that were found.
+    """
+    if not keys:
+        return set()
+    if hasattr(database, "contains_many"):
+        return set(database.contains_many(keys))
+    return {key for key in keys if key in database}
+
+
+def _delete_many(database, keys):
+    """
+    Delete many keys from a database backend, ignoring missing ones.
+
+    Uses the backend's bulk `delete_many` method if it has one, and falls
+    back to one delete per key otherwise.
+
+    :param Mapping database: The database backend.
+    :param list keys: Keys to delete.
+    """
+    if not keys:
+        return
+    if hasattr(database, "delete_many"):
+        return database.delete_many(keys)
+    for key in keys:
+        try:
+            del database[key]
+        except KeyError:
+            pass
+
+
+def _batched(iterable, size):
+    """Split an iterable into lists of at most size elements"""
+    batch = []
+    for element in iterable:
+        batch.append(element)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _clear(database, batch_size=10000):
+    """
+    Delete all keys of a database backend.
+
+    Uses the backend's `clear` method if it has one, and otherwise streams
+    its keys and deletes them in batches.
+
+    :param Mapping database: The database backend.
+    :param int batch_size: Number of keys to delete at a time.
+    """
+    if hasattr(database, "clear"):
+        return database.clear()
+    # Deleting from a dict while iterating it is not allowed
+    keys = list(database) if isinstance(database, dict) else iter(database)
+    for batch in _batched(keys, batch_size):
+        _delete_many(database, batch)
+
+
+# Backend operations of I/O plans that change the database
+_WRITES = ("set", "delete")
+
+
+def _execute(operation):
+    """
+    Carry out one backend operation of an I/O plan.
+
+    :param tuple operation: ("get", database, keys), ("contains", database,
+        keys), ("set", database, pairs) or ("delete", database, keys).
+    """
+    action, database, argument = operation
+    if action == "get":
+        return _get_many(database, argument)
+    if action == "contains":
+        return _contains_many(database, argument)
+    if action == "set":
+        return _set_many(database, argument)
+    if action == "delete":
+        return _delete_many(database, argument)
+    raise ValueError("Unknown backend operation: {}".format(action))
+
+
+def _run_plan(plan):
+    """
+    Carry out an I/O plan synchronously.
+
+    A plan is a generator that yields lists of backend operations (see
+    _execute), is sent back the list of their results, and finally returns
+    its own result.
+    """
+    try:
+        operations = next(plan)
+        while True:
+            operations = plan.send([_execute(op) for op in operations])
+    except StopIteration as e:
+        return e.value
+
+
+def _prefetched(fetch, batches, prefetch):
+    """
+    Apply fetch to each batch, running up to `prefetch` batches ahead of the
+    consumer on a background thread.
+
+    :param callable fetch: Function of a batch.
+    :param iterable batches: The batches.
+    :param int prefetch: Number of batches to fetch ahead; 0 for none.
+    :return iterator: The results of fetch, in the order of the batches.
+    """
+    if prefetch < 1:
+        yield from map(fetch, batches)
+        return
+    from concurrent.futures import ThreadPoolExecutor
+
+    batches = iter(batches)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="henge-prefetch")
+    pending = deque(executor.submit(fetch, b) for b in islice(batches, prefetch))
+    try:
+        while pending:
+            result = pending.popleft().result()
+            pending.extend(executor.submit(fetch, b) for b in islice(batches, 1))
+            yield result
+    finally:  # Also when the consumer stops early
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _elements(batches):
+    """Yield the elements of batches, closing the batches when stopped early"""
+    with closing(batches):
+        for batch in batches:
+            yield from batch
 
 
 def is_url(maybe_url):
@@ -57,10 +306,428 @@ def read_url(url):
         raise e
     data = response.read()  # a `bytes` object
     text = data.decode("utf-8")
+    return _parse_yaml(text)
+
+
+def _parse_yaml(text):
+    import yaml
+
     return yaml.safe_load(text)
 
 
+def _load_yaml_file(path):
+    import yacman
+
+    return yacman.load_yaml(path)
+
+
+def _split_through(cache, key, load):
+    """Split the schema returned by load(), unless the cache has it"""
+    split = cache.get(key)
+    if split is None:
+        split = split_schema(load())
+        cache.put(key, split)
+    return split
+
+
+def _split_schema_file(path, cache=None):
+    """
+    Read and split the schema in a YAML file.
+
+    :param str path: Path to the file.
+    :param SchemaCache cache: Cache of split schemas, keyed by file content.
+    :return dict: Flattened schemas, by item type.
+    """
+    if cache is None:
+        return split_schema(_load_yaml_file(path))
+    with open(path, "rb") as f:
+        key = cache.key(f.read())
+    return _split_through(cache, key, lambda: _load_yaml_file(path))
+
+
+def _split_schema_str(text, cache=None):
+    """
+    Parse and split a YAML schema given as a string; see _split_schema_file.
+    """
+    if cache is None:
+        return split_schema(_parse_yaml(text))
+    return _split_through(cache, cache.key(text.encode()), lambda: _parse_yaml(text))
+
+
+def _split_schema_url(url, cache=None):
+    """
+    Fetch and split a YAML schema from a URL; see _split_schema_file.
+
+    With a cache, a URL read before is requested with the ETag of the last
+    response, and a 304 Not Modified answer is served from the cache.
+    """
+    if cache is None:
+        return split_schema(read_url(url))
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+
+    etag, key = cache.get_etag(url)
+    split = cache.get(key) if etag else None
+    request = Request(url)
+    if split is not None:
+        request.add_header("If-None-Match", etag)
+    _LOGGER.info("Reading URL: {}".format(url))
+    try:
+        response = urlopen(request)
+    except HTTPError as e:
+        if e.code == 304 and split is not None:
+            return split
+        raise
+    data = response.read()
+    key = cache.key(data)
+    split = _split_through(cache, key, lambda: _parse_yaml(data.decode("utf-8")))
+    if response.headers.get("ETag"):
+        cache.put_etag(url, response.headers["ETag"], key)
+    return split
+
+
+_Record = namedtuple("_Record", ["druid", "item_type", "string", "external_string"])
+
+
+def _pack_record(record, digest_version):
+    """
+    Serialize a record into the single-key layout: a marker, a JSON header
+    with the item type, digest version and external string, a newline, and
+    then the canonical string itself.
+    """
+    header = canonical_str([record.item_type, digest_version, record.external_string])
+    return PACKED_RECORD + header + "\n" + record.string
+
+
+def _unpack_record(druid, value):
+    """
+    Parse a value stored in the single-key layout.
+
+    :return _Record: The record, or None if the value is not a packed record.
+    """
+    if not isinstance(value, str) or not value.startswith(PACKED_RECORD):
+        return None
+    split = value.index("\n")
+    item_type, _, external_string = json.loads(value[1:split])
+    return _Record(druid, item_type, value[split + 1 :], external_string)
+
+
+def _encode_druid_array(druids):
+    """
+    Encode an array of druids compactly, as one blob of their raw digests.
+
+    The druids must all have the same width, and be lowercase hex or
+    unpadded URL-safe base64, like those of md5 and sha512t24u_digest; the
+    encoding names which and the width, followed by the base64 of the blob.
+
+    :param list[str] druids: The array.
+    :return str: The encoded array, or None if it can't be encoded.
+    """
+    if type(druids) is not list or not druids or type(druids[0]) is not str:
+        return None
+    width = len(druids[0])
+    if not width or any(type(d) is not str or len(d) != width for d in druids):
+        return None
+    joined = "".join(druids)
+    blob = None
+    if width % 2 == 0:
+        try:
+            blob = bytes.fromhex(joined)
+        except ValueError:
+            pass
+        kind = "x"
+        if blob is not None and blob.hex() != joined:
+            blob = None  # Uppercase, or with whitespace
+    if blob is None and width % 4 == 0:
+        try:
+            blob = base64.urlsafe_b64decode(joined)
+        except ValueError:
+            return None
+        kind = "u"
+        if base64.urlsafe_b64encode(blob).decode("ascii") != joined:
+            return None
+    if blob is None:
+        return None
+    return "{}{}{}:{}".format(
+        COMPACT_ARRAY, kind, width, base64.b64encode(blob).decode("ascii")
+    )
+
+
+def _decode_druid_array(value):
+    """Decode an array of druids encoded by _encode_druid_array"""
+    spec, _, data = value.partition(":")
+    kind, width = spec[1], int(spec[2:])
+    blob = base64.b64decode(data)
+    if kind == "x":  # Hex digits of each digest, split in C
+        return blob.hex(" ", width // 2).split(" ")
+    text = base64.urlsafe_b64encode(blob).decode("ascii")
+    return [text[i : i + width] for i in range(0, len(text), width)]
+
+
+def _is_metadata_key(key):
+    """Determine if a database key holds henge metadata, rather than an item"""
+    return key.startswith(HENGE_KEY_PREFIX) or key.endswith(METADATA_SUFFIXES)
+
+
+def _index_key(item_type, page=None):
+    """Key of the item-type index header, or of one of its pages"""
+    key = HENGE_KEY_PREFIX + "index:" + item_type
+    return key if page is None else "{}:{}".format(key, page)
+
+
+def _refs_key(druid, page=None):
+    """
+    Key of the reverse references of a druid, the druids that refer to it:
+    of their header, or of one of their pages.
+    """
+    key = HENGE_KEY_PREFIX + "refs:" + druid
+    return key if page is None else key + ":" + str(page)
+
+
+def _append_to_pages(pairs, page_key, page, entries, values, page_size):
+    """
+    Append values to a list kept in fixed-size pages, adding the rewritten
+    and new pages to pairs.
+
+    :param dict pairs: Keys and values to write.
+    :param callable page_key: Function of a page number, giving its key.
+    :param int page: The number of the last page.
+    :param list entries: The entries of the last page.
+    :param iterable values: Values to append.
+    :param int page_size: Maximum entries per page.
+    """
+    for value in values:
+        entries.append(value)
+        if len(entries) == page_size:
+            pairs[page_key(page)] = json.dumps(entries)
+            page, entries = page + 1, []
+    if entries:
+        pairs[page_key(page)] = json.dumps(entries)
+
+
+def _record_size(record):
+    """Size of the stored strings of a record, in bytes"""
+    return len(record.string.encode("utf-8")) + len(
+        record.external_string.encode("utf-8")
+    )
+
+
+def _encode_cursor(item_type, position):
+    cursor = json.dumps([item_type, position]).encode()
+    return base64.urlsafe_b64encode(cursor).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        item_type, position = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor: {}".format(cursor))
+    return item_type, position
+
+
+class _InsertBatch(object):
+    """
+    Flattened records waiting to be written, collected during an insert.
+
+    Records are kept by druid, with the druids of the sub-items each one
+    refers to, so that writes can skip whole subtrees that already exist.
+    """
+
+    def __init__(self, memo=None):
+        """
+        :param InsertMemo memo: Druids of items inserted by earlier calls,
+            to look up along with the ones of this batch.
+        """
+        self.records = {}  # druid -> (record, digest_version, children)
+        self.skipped = 0
+        self.rewritten = {}  # druid -> stored record, of changed externals
+        self.memo = memo
+        self.druids = {}  # memo key -> druid, of items flattened here
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, record, digest_version=None, children=()):
+        children = [child for child in children if isinstance(child, str)]
+        self.records[record.druid] = (record, digest_version, children)
+
+    def lookup(self, key):
+        """Find the druid of an already flattened item, counting hits"""
+        druid = self.druids.get(key)
+        if druid is None and self.memo is not None:
+            druid = self.memo.get(key)
+        if druid is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return druid
+
+
+class InsertMemo(object):
+    """
+    Druids of inserted items, to share between inserts; see
+    Henge.insert_session.
+
+    Flattened items are keyed by item type and the digest of their canonical
+    string, and only remembered once their records are written. The least
+    recently used ones are forgotten first, once the memo is full.
+    """
+
+    def __init__(self, max_entries: int = 100000) -> None:
+        """
+        :param int max_entries: Maximum number of items to remember.
+        """
+        self._druids = LRUCache(max_entries)  # (item type, digest) -> druid
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Get the druid of a remembered item.
+
+        :param tuple key: Item type and digest of the flattened item.
+        :return str: The druid, or None if the item is not remembered.
+        """
+        return self._druids.get(key, None)
+
+    def update(self, batch):
+        """
+        Remember the items of a written batch, and count its lookups.
+
+        :param _InsertBatch batch: A batch that has been written.
+        """
+        self.hits += batch.hits
+        self.misses += batch.misses
+        for key, druid in batch.druids.items():
+            self._druids.put(key, druid)
+
+    def clear(self) -> None:
+        """Forget all items, e.g. after items are removed."""
+        self._druids.invalidate()
+
+    def stats(self) -> dict:
+        """
+        Report lookups of inserted items.
+
+        :return dict: Hit and miss counts, and the number of items
+            remembered and forgotten to make room.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._druids),
+            "evictions": self._druids.evictions,
+        }
+
+    def __len__(self):
+        return len(self._druids)
+
+    def __repr__(self):
+        return "InsertMemo ({} items, {} hits, {} misses)".format(
+            len(self), self.hits, self.misses
+        )
+
+
+def _compile_validator(schema):
+    """Check a schema and build a reusable jsonschema validator for it"""
+    import jsonschema
+
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+# Keywords that annotate a schema without constraining what validates
+_ANNOTATION_KEYWORDS = {
+    "type",
+    "henge_class",
+    "description",
+    "title",
+    "default",
+    "examples",
+    "$comment",
+    "recursive",
+    "inherent",
+}
+
+
+def _fast_checker(schema):
+    """
+    Build a structural checker for the simple flattened schema shapes that
+    split_schema produces: strings, integers, arrays of those, and objects
+    with only string and integer properties.
+
+    The checker returns True only for items the full jsonschema validator
+    would also accept; False means "not sure", not "invalid".
+
+    :param dict schema: A flattened schema.
+    :return callable: A checker, or None if the schema is not simple enough.
+    """
+    if not isinstance(schema, dict):
+        return None
+    primitive = {
+        "string": lambda x: isinstance(x, str),
+        "integer": lambda x: isinstance(x, int) and not isinstance(x, bool),
+    }
+    stype = schema.get("type")
+    if not isinstance(stype, str):
+        return None  # A list of types, or none; left to jsonschema
+    if stype in primitive:
+        if set(schema) - _ANNOTATION_KEYWORDS:
+            return None
+        return primitive[stype]
+    if stype == "array":
+        items = schema.get("items")
+        if set(schema) - _ANNOTATION_KEYWORDS - {"items"}:
+            return None
+        if not isinstance(items, dict) or set(items) - _ANNOTATION_KEYWORDS:
+            return None
+        if not isinstance(items.get("type"), str) or items["type"] not in primitive:
+            return None
+        check_element = primitive[items["type"]]
+        return lambda x: isinstance(x, list) and all(check_element(e) for e in x)
+    if stype == "object":
+        if set(schema) - _ANNOTATION_KEYWORDS - {"properties", "required"}:
+            return None
+        required = schema.get("required", [])
+        if not isinstance(required, list):
+            return None
+        prop_checks = {}
+        for name, prop in schema.get("properties", {}).items():
+            if not isinstance(prop, dict) or set(prop) - _ANNOTATION_KEYWORDS:
+                return None
+            if not isinstance(prop.get("type"), str) or prop["type"] not in primitive:
+                return None
+            prop_checks[name] = primitive[prop["type"]]
+
+        def check_object(x):
+            if not isinstance(x, dict):
+                return False
+            for name in required:
+                if name not in x:
+                    return False
+            for name, check in prop_checks.items():
+                if name in x and not check(x[name]):
+                    return False
+            return True
+
+        return check_object
+    return None
+
+
+def _validate(validator, item):
+    """Validate an item, raising the same error jsonschema.validate would"""
+    import jsonschema
+
+    error = jsonschema.exceptions.best_match(validator.iter_errors(item))
+    if error is not None:
+        raise error
+
+
 class Henge(object):
+    index_page_size = 1000  # Druids per page of the item-type index
+    refs_page_size = 1000  # Druids per page of the reverse references
+
     def __init__(
         self,
         database: dict,
@@ -68,6 +735,17 @@ class Henge(object):
         schemas_str: list[str] = None,
         henges: dict = None,
         checksum_function: callable = md5,
+        fast_validation: bool = True,
+        packed_records: bool = False,
+        cache_size: int = 0,
+        cache_bytes: int = None,
+        compact_arrays: bool = False,
+        remote_workers: int = 8,
+        remote_cache_size: int = 10000,
+        schema_cache: str = None,
+        serializer: str = "auto",
+        memoize_inserts: bool = True,
+        index_items: bool = True,
     ) -> None:
         """
         A user interface to insert and retrieve decomposable recursive unique
@@ -79,21 +757,70 @@ class Henge(object):
             data types stored by this Henge
         :param list schemas_str: A list of strings containing YAML jsonschema schemas directly
         :param dict henges: One or more henge objects indexed by object name for
-            remote storing of items.
+            remote storing of items. Wrap one in a Delegate to set its timeout
+            and circuit breaker.
         :param function(str) -> str checksum_function: Default function to
             handle the digest of the serialized items stored in this henge.
+        :param bool fast_validation: Check items of simple flattened schemas
+            (strings, integers, arrays and flat objects of those) with a
+            structural checker before falling back to jsonschema.
+        :param bool packed_records: Store each item as a single packed record
+            holding its canonical string, item type, digest version and
+            external string, instead of under four separate keys. Items in
+            either layout can always be read; see migrate_to_packed.
+        :param int cache_size: Maximum number of retrieved items to keep in an
+            in-memory LRU cache, keyed by druid and recursion limit. Default:
+            0, no cache.
+        :param int cache_bytes: Maximum approximate size of the cached items,
+            in bytes. Default: no size limit.
+        :param bool compact_arrays: Store arrays of sub-item druids as one
+            blob of their raw digests, instead of JSON text. Druids are still
+            digests of the canonical strings, so they don't change, and
+            arrays in either form can always be read.
+        :param int remote_workers: Number of threads running backend
+            operations against remote henges in parallel.
+        :param int remote_cache_size: Maximum number of records read from
+            remote henges to keep in memory, so they're only fetched once.
+            Set to 0 for no cache.
+        :param str schema_cache: Directory of an on-disk cache of parsed and
+            split schemas, keyed by their content; see SchemaCache. Default:
+            the HENGE_SCHEMA_CACHE environment variable, or no cache.
+        :param str serializer: Engine encoding items to canonical strings and
+            decoding them: "json", "orjson", "auto" for the fastest one
+            installed, or a Serializer. All produce the same strings, and so
+            the same druids.
+        :param bool memoize_inserts: Validate and queue sub-items that repeat
+            within an insert (or insert_many, or insert_session) once, keyed
+            by the digest of their flattened form; see Henge.memo_info.
+        :param bool index_items: Keep the item-type index and the reverse
+            references up to date on insert. Without them inserts write only
+            the items, but delete and gc are unavailable, and list, stats,
+            len and clean of one item type miss new items until reindex.
         """
         self.database = database
         self.checksum_function = checksum_function
         self.digest_version = "md5"
         self.flexible_digests = True
         self.supports_inherent_attrs = True
+        self.packed_records = packed_records
+        self.compact_arrays = compact_arrays
+        self.fast_validation = fast_validation
+        self.serializer = get_serializer(serializer)
+        self.cache = LRUCache(cache_size, cache_bytes) if cache_size else None
+        self._index_lock = threading.Lock()  # Serializes index appends
+        self.memoize_inserts = memoize_inserts
+        self.index_items = index_items
+        self._insert_session = None
+        self._memo_hits = 0
+        self._memo_misses = 0
 
         # TODO: Right now you can pass a file, or a URL, or some yaml directly
         # into the schemas param. I want to split that out so that at least the
         # yaml direct is its own arg
 
         if isinstance(schemas, dict):
+            import yacman
+
             _LOGGER.debug("Using old dict schemas")
             populated_schemas = {}
             for schema_key, schema_value in schemas.items():
@@ -101,7 +828,10 @@ class Henge(object):
                     populated_schemas[schema_key] = yacman.load_yaml(schema_value)
             self.schemas = populated_schemas
         else:
-            populated_schemas = []
+            if schema_cache is None:
+                schema_cache = os.environ.get(SCHEMA_CACHE_ENV)
+            cache = SchemaCache(schema_cache) if schema_cache else None
+            split_schemas = {}
             if isinstance(schemas, str):
                 _LOGGER.error(
                     "The schemas should be a list. Please pass a list of schemas"
@@ -110,9 +840,9 @@ class Henge(object):
             for schema_value in schemas:
                 if isinstance(schema_value, str):
                     if os.path.isfile(schema_value):
-                        populated_schemas.append(yacman.load_yaml(schema_value))
+                        split_schemas.update(_split_schema_file(schema_value, cache))
                     elif is_url(schema_value):
-                        populated_schemas.append(read_url(schema_value))
+                        split_schemas.update(_split_schema_url(schema_value, cache))
                     else:
                         _LOGGER.error(
                             f"Schema file not found: {schema_value}. Use schemas_str if you meant to specify a direct schema"
@@ -120,11 +850,7 @@ class Henge(object):
                         # populated_schemas.append(yaml.safe_load(schema_value))
 
             for schema_value in schemas_str or []:
-                populated_schemas.append(yaml.safe_load(schema_value))
-
-            split_schemas = {}
-            for s in populated_schemas:
-                split_schemas.update(split_schema(s))
+                split_schemas.update(_split_schema_str(schema_value, cache))
 
             self.schemas = split_schemas
 
@@ -138,14 +864,38 @@ class Henge(object):
             self.henges[item_type] = self
 
         # Next add in any remote henges for item types not stored in self:
+        self._delegates = {}  # id(remote database) -> Delegate
         if henges:
             for item_type, henge in henges.items():
                 if item_type not in self.item_types:
+                    delegate = henge if isinstance(henge, Delegate) else None
+                    henge = henge.henge if delegate else henge
                     self.schemas[item_type] = henge.schemas[item_type]
                     self.henges[item_type] = henge
+                    if henge.database is not database:
+                        self._delegates.setdefault(
+                            id(henge.database), delegate or Delegate(henge)
+                        )
+        if self._delegates:
+            from concurrent.futures import ThreadPoolExecutor
+        self._executor = (  # Threads only start with the first remote operation
+            ThreadPoolExecutor(remote_workers, thread_name_prefix="henge-remote")
+            if self._delegates
+            else None
+        )
+        self.remote_cache = (
+            LRUCache(remote_cache_size)
+            if self._delegates and remote_cache_size
+            else None
+        )
+
+        # One validator per flattened schema, compiled on first use and then
+        # reused on every insert
+        self._validators = {}
+        self._fast_checkers = {}
 
     def retrieve(
-        self, druid: str, reclimit: int = None, raw: bool = False
+        self, druid: str, reclimit: int = None, raw: bool = False, lazy: bool = False
     ) -> dict | list:
         """
         Retrieve an item given a digest
@@ -155,69 +905,457 @@ class Henge(object):
         :param int reclimit: Recursion limit. Set to None for no limit (default).
         :param bool raw: Return the value as a raw, henge-delimited string, instead
             of processing into a mapping. Default: False.
+        :param bool lazy: Read only the item itself, and return a LazyMapping or
+            LazySequence proxy that fetches sub-items when they're accessed.
+            Its to_plain() method returns the item as a plain dict or list.
         """
-        try:
-            item_type = self.database[druid + ITEM_TYPE]
-        except KeyError:
-            raise NotFoundException(druid)
+        if lazy:
+            return self._lazy_many([druid], reclimit)[0]
+        return self.retrieve_many([druid], reclimit)[0]
+
+    def retrieve_many(self, druids: list[str], reclimit: int = None) -> list:
+        """
+        Retrieve many items given their digests.
 
-        digested_string = self.lookup(druid, item_type)
-        reconstructed_item = json.loads(digested_string)
+        The druid tree is expanded breadth-first, one level at a time, and
+        each level is fetched from the backend with a single multi-get; see
+        Henge._read_nodes. Items shared between trees are fetched once.
 
-        external_string = self.database[druid + "_external_string"]
-        if external_string != "null":
-            external_values = json.loads(external_string)
+        :param list[str] druids: The druids of the items to retrieve.
+        :param int reclimit: Recursion limit. Set to None for no limit (default).
+        :return list: The retrieved items, in the order of the druids.
+        """
+        return self._run(self._retrieve_plan(druids, reclimit))
+
+    def _run(self, plan):
+        """
+        Carry out an I/O plan against the database backends.
+
+        Plans are generators that yield lists of backend operations and get
+        back their results; see _run_plan. Keeping the I/O out of the plans
+        lets the same retrieval and insert logic run synchronously here, or
+        asynchronously in an AsyncHenge.
+
+        Operations against remote henges are started first, on worker
+        threads, so that each step waits for its slowest remote henge rather
+        than for all of them in turn; see Delegate.
+        """
+        if not self._delegates:
+            return _run_plan(plan)
+        try:
+            operations = next(plan)
+            while True:
+                operations = plan.send(self._execute_step(operations))
+        except StopIteration as e:
+            return e.value
+
+    def _execute_step(self, operations):
+        """Carry out the operations of one plan step; see Henge._run"""
+        started = time.monotonic()
+        pending = {}  # position -> (delegate, future)
+        for i, operation in enumerate(operations):
+            delegate = self._delegates.get(id(operation[1]))
+            if delegate is not None:
+                # Waiting for a slot of the delegate counts against its timeout
+                wait = delegate.limit(operation[0] in _WRITES)
+                pending[i] = (
+                    delegate,
+                    delegate.submit(self._executor, _execute, operation, wait=wait),
+                )
+        results = [
+            None if i in pending else _execute(operation)
+            for i, operation in enumerate(operations)
+        ]
+        for i, (delegate, future) in pending.items():
+            write = operations[i][0] in _WRITES
+            results[i] = delegate.result(future, started, write)
+        return results
+
+    def _retrieve_plan(self, druids, reclimit):
+        """I/O plan for Henge.retrieve_many"""
+        nodes = {}  # druid -> (item_type, parsed item, size)
+        memo = None  # (druid, reclimit) -> (item, size), if caching
+        if self.cache is not None:
+            memo = {}
+        level = [(druid, reclimit) for druid in dict.fromkeys(druids)]
+        seen = set(level)
+        while level:
+            if self.cache is not None:
+                for key in level:
+                    hit = self.cache.get(key)
+                    if hit is not MISSING:
+                        memo[key] = hit
+                level = [key for key in level if key not in memo]
+            missing = [druid for druid, _ in level if druid not in nodes]
+            records = yield from self._read_nodes_plan(missing)
+            for druid, record in records.items():
+                size = len(record.string) + len(record.external_string)
+                nodes[druid] = (record.item_type, self._parse_node(record), size)
+            next_level = []
+            for druid, level_reclimit in level:
+                item_type, item, _ = nodes[druid]
+                child_reclimit = level_reclimit
+                if isinstance(level_reclimit, int):
+                    child_reclimit = level_reclimit - 1
+                for child in self._child_druids(item_type, item, level_reclimit):
+                    if (child, child_reclimit) not in seen:
+                        seen.add((child, child_reclimit))
+                        next_level.append((child, child_reclimit))
+            _LOGGER.debug(
+                "Fetched {} druids; {} in next level".format(
+                    len(missing), len(next_level)
+                )
+            )
+            level = next_level
+
+        if self.cache is None:
+            return [self._assemble(druid, reclimit, nodes) for druid in druids]
+        cached = set(memo)
+        results = [self._assemble(druid, reclimit, nodes, memo) for druid in druids]
+        for key, (item, size) in memo.items():
+            if key not in cached:
+                self.cache.put(key, (item, size), size)
+        # Assembled items are shared with the cache and between trees
+        return [_copy_tree(item) for item in results]
+
+    def _parse_node(self, record):
+        """Reconstruct the flat item of a record, with its external values"""
+        if record.string.startswith(COMPACT_ARRAY):
+            return _decode_druid_array(record.string)
+        reconstructed_item = self.serializer.loads(record.string)
+        if record.external_string != "null":
+            external_values = self.serializer.loads(record.external_string)
             reconstructed_item.update(external_values)
+        return reconstructed_item
 
-        schema = self.schemas[item_type]
+    def _child_druids(self, item_type, item, reclimit):
+        """
+        List the druids of the sub-items that retrieval recurses into.
 
+        :param str item_type: The item type of the flat item.
+        :param item: A flat item, as returned by Henge._parse_node.
+        :param int reclimit: Recursion limit remaining at this item.
+        :return list[str]: Druids of the sub-items; empty if not recursing.
+        """
+        if isinstance(reclimit, int) and reclimit == 0:
+            return []
+        schema = self.schemas[item_type]
         if schema["type"] == "array":
-            if isinstance(reclimit, int) and reclimit == 0:
-                return reconstructed_item
             if "henge_class" in schema["items"]:
-                _LOGGER.debug(
-                    "Henge classed array: {}; Schema: {}".format(
-                        digested_string, schema
-                    )
-                )
-                if isinstance(reclimit, int):
-                    reclimit = reclimit - 1
-                return [self.retrieve(item, reclimit) for item in reconstructed_item]
+                return list(item)
         elif schema["type"] == "object":
             if "recursive" in schema:
-                if isinstance(reclimit, int) and reclimit == 0:
+                return [
+                    item[recursive_attr]
+                    for recursive_attr in schema["recursive"]
+                    if recursive_attr in item and item[recursive_attr] != ""
+                ]
+        return []
+
+    def _assemble(self, druid, reclimit, nodes, memo=None):
+        """
+        Build the nested result for a druid from already-fetched flat items.
+
+        :param str druid: The druid to assemble.
+        :param int reclimit: Recursion limit remaining at this item.
+        :param dict nodes: Fetched (item type, flat item, size) tuples, by
+            druid.
+        :param dict memo: If given, (item, size) tuples of already assembled
+            items, by druid and recursion limit; newly assembled items are
+            added to it, and shared rather than copied.
+        """
+        key = (druid, reclimit)
+        if memo is not None and key in memo:
+            return memo[key][0]
+        item_type, item, size = nodes[druid]
+        schema = self.schemas[item_type]
+        if isinstance(item, (dict, list)):
+            item = item.copy()  # The flat item may be shared between trees
+        children = []
+        if not (isinstance(reclimit, int) and reclimit == 0):
+            if isinstance(reclimit, int):
+                reclimit = reclimit - 1
+            if schema["type"] == "array":
+                if "henge_class" in schema["items"]:
                     _LOGGER.debug(
-                        "Lookup/obj/Recursive: {}; Schema: {}".format(
-                            digested_string, schema
-                        )
+                        "Henge classed array: {}; Schema: {}".format(item, schema)
                     )
-                    return reconstructed_item
-                else:
-                    if isinstance(reclimit, int):
-                        reclimit = reclimit - 1
+                    children = list(item)
+                    item = [
+                        self._assemble(element, reclimit, nodes, memo)
+                        for element in item
+                    ]
+            elif schema["type"] == "object":
+                if "recursive" in schema:
                     for recursive_attr in schema["recursive"]:
-                        if (
-                            recursive_attr in reconstructed_item
-                            and reconstructed_item[recursive_attr] != ""
-                        ):
-                            reconstructed_item[recursive_attr] = self.retrieve(
-                                reconstructed_item[recursive_attr], reclimit, raw
+                        if recursive_attr in item and item[recursive_attr] != "":
+                            children.append(item[recursive_attr])
+                            item[recursive_attr] = self._assemble(
+                                item[recursive_attr], reclimit, nodes, memo
                             )
-        return reconstructed_item
+        if memo is not None:
+            size += sum(memo[(child, reclimit)][1] for child in children)
+            memo[key] = (item, size)
+        return item
+
+    def _lazy_many(self, druids, reclimit):
+        """
+        Read items with one multi-get, wrapping those with sub-items in lazy
+        proxies; see Henge.retrieve.
+
+        :param list[str] druids: The druids of the items to read.
+        :param int reclimit: Recursion limit remaining at these items.
+        :return list: The items, in the order of the druids.
+        """
+        records = self._read_nodes(druids)
+        items = []
+        for druid in druids:
+            record = records[druid]
+            item = self._parse_node(record)
+            schema = self.schemas[record.item_type]
+            if isinstance(reclimit, int) and reclimit == 0:
+                pass
+            elif schema["type"] == "array" and "henge_class" in schema["items"]:
+                item = LazySequence(self, druid, item, reclimit)
+            elif schema["type"] == "object" and "recursive" in schema:
+                item = LazyMapping(self, druid, item, schema["recursive"], reclimit)
+            items.append(item)
+        return items
+
+    def iter_retrieve(
+        self,
+        druid: str,
+        reclimit: int = None,
+        chunk_size: int = 1000,
+        start: int = 0,
+        chunks: bool = False,
+        prefetch: int = 1,
+    ):
+        """
+        Retrieve the elements of an array one at a time, or a chunk at a time.
+
+        Elements are retrieved with one Henge.retrieve_many per chunk, so at
+        most `prefetch` + 1 chunks of retrieved elements are held at once,
+        however long the array. The next `prefetch` chunks are retrieved on a
+        background thread while the current one is consumed.
+
+        :param str druid: The druid of an array.
+        :param int reclimit: Recursion limit, at the array. Set to None for no
+            limit (default).
+        :param int chunk_size: Number of elements retrieved together.
+        :param int start: Index of the first element to yield, to resume an
+            earlier iteration.
+        :param bool chunks: Yield lists of up to chunk_size elements, instead
+            of single elements.
+        :param int prefetch: Number of chunks retrieved ahead; 0 retrieves
+            each chunk when it's reached, on the calling thread.
+        :raise ValueError: If the item is not an array.
+        """
+        record = self._read_node(druid)
+        batches, nested = self._element_batches(
+            druid, record, reclimit, chunk_size, start
+        )
+        if nested:
+            child_reclimit = reclimit - 1 if isinstance(reclimit, int) else None
+            batches = _prefetched(
+                lambda batch: self.retrieve_many(batch, child_reclimit),
+                batches,
+                prefetch,
+            )
+        return batches if chunks else _elements(batches)
+
+    def _element_batches(self, druid, record, reclimit, chunk_size, start):
+        """
+        Split the flat array of a record into chunks; see iter_retrieve.
+
+        :return (iterator, bool): The chunks, and whether their elements are
+            druids of sub-items to retrieve.
+        """
+        if self.schemas[record.item_type]["type"] != "array":
+            raise ValueError(
+                "Item {} is a '{}', not an array".format(druid, record.item_type)
+            )
+        if chunk_size < 1 or start < 0:
+            raise ValueError(
+                "chunk_size must be positive, and start not negative: "
+                "{}, {}".format(chunk_size, start)
+            )
+        elements = self._parse_node(record)
+        nested = bool(self._child_druids(record.item_type, elements[:1], reclimit))
+        batches = (
+            elements[i : i + chunk_size]
+            for i in range(start, len(elements), chunk_size)
+        )
+        return batches, nested
 
     def lookup(self, druid, item_type):
+        """
+        Read the canonical string of an item, from the henge storing its type.
+
+        Remote henges are read under their timeout and circuit breaker, and
+        through the remote cache; see Delegate.
+
+        :param str druid: The druid of the item.
+        :param str item_type: The type of the item.
+        :return str: The canonical string of the item.
+        :raise NotFoundException: If the item isn't found.
+        """
+        return self._run(self._lookup_plan(druid, item_type))
+
+    def _lookup_plan(self, druid, item_type):
+        """I/O plan for Henge.lookup"""
         try:
             henge_to_query = self.henges[item_type]
         except KeyError:
             _LOGGER.debug("No henges available for this item type")
             raise NotFoundException(druid)
-        try:
-            string = henge_to_query.database[druid]
-        except KeyError:
+        if henge_to_query is not self and self.remote_cache is not None:
+            cached = self.remote_cache.get(druid)
+            if cached is not MISSING:
+                return self._canonical_string(cached.string)
+        keys = [druid, druid + EXTERNAL_STRING]
+        (values,) = yield [("get", henge_to_query.database, keys)]
+        if druid not in values:
             raise NotFoundException(druid)
 
+        record = _unpack_record(druid, values[druid]) or _Record(
+            druid,
+            item_type,
+            values[druid],
+            values.get(druid + EXTERNAL_STRING) or "null",
+        )
+        if henge_to_query is not self and self.remote_cache is not None:
+            self.remote_cache.put(druid, record)
+        return self._canonical_string(record.string)
+
+    def _canonical_string(self, string):
+        """The canonical string of a stored string, which may be compact"""
+        if string.startswith(COMPACT_ARRAY):
+            return self.serializer.dumps(_decode_druid_array(string))
         return string
 
+    def _read_node(self, druid):
+        """
+        Read the stored record for a druid, in either storage layout.
+
+        :param str druid: The druid to read.
+        :return _Record: The stored record.
+        :raise NotFoundException: If the druid is not in the database.
+        """
+        return self._read_nodes([druid])[druid]
+
+    def _read_nodes(self, druids):
+        """
+        Read the stored records for many druids, in either storage layout.
+
+        A packed record is found with a single read. The legacy layout keeps
+        the canonical string, item type and external string under separate
+        keys; backends with a `get_many` method return all of them in the
+        same round trip, and others are read in turn. Either way it's one
+        multi-get per backend and step, however many druids are read.
+
+        :param list[str] druids: The druids to read.
+        :return dict: Stored records, by druid.
+        :raise NotFoundException: If any druid is not in the database.
+        """
+        return self._run(self._read_nodes_plan(druids))
+
+    def _read_nodes_plan(self, druids):
+        """I/O plan for Henge._read_nodes"""
+        druids = list(dict.fromkeys(druids))
+        if not druids:
+            return {}
+        prefetch = _has_get_many(self.database) and not self.packed_records
+        (values,) = yield [("get", self.database, _node_keys(druids, prefetch))]
+        records = {}
+        legacy = []
+        for druid in druids:
+            record = _unpack_record(druid, values.get(druid))
+            if record:
+                records[druid] = record
+            else:
+                legacy.append(druid)
+        if not legacy:
+            return records
+
+        if not prefetch:
+            (item_types,) = yield [
+                ("get", self.database, [druid + ITEM_TYPE for druid in legacy])
+            ]
+            values.update(item_types)
+        by_henge = {}  # id(henge) -> (henge, [(druid, item_type)])
+        for druid in legacy:
+            item_type = values.get(druid + ITEM_TYPE)
+            if item_type is None:
+                raise NotFoundException(druid)
+            try:
+                henge_to_query = self.henges[item_type]
+            except KeyError:
+                _LOGGER.debug("No henges available for this item type")
+                raise NotFoundException(druid)
+            if henge_to_query is not self and self.remote_cache is not None:
+                cached = self.remote_cache.get(druid)
+                if cached is not MISSING:
+                    records[druid] = cached
+                    continue
+            by_henge.setdefault(id(henge_to_query), (henge_to_query, []))[1].append(
+                (druid, item_type)
+            )
+
+        # Items in remote henges are read from each of them in the same step
+        groups = []  # (database, nodes, fetched, with_externals)
+        remote_ops = []
+        for henge_to_query, nodes in by_henge.values():
+            if henge_to_query is self:
+                groups.append((self.database, nodes, values, prefetch))
+            else:
+                database = henge_to_query.database
+                with_externals = _has_get_many(database)
+                groups.append((database, nodes, None, with_externals))
+                keys = _node_keys([druid for druid, _ in nodes], with_externals)
+                remote_ops.append(("get", database, keys))
+        if remote_ops:
+            remote_values = iter((yield remote_ops))
+            groups = [
+                (db, nodes, next(remote_values) if fetched is None else fetched, ext)
+                for db, nodes, fetched, ext in groups
+            ]
+
+        external_ops = []
+        unpacked_groups = []
+        for database, nodes, fetched, with_externals in groups:
+            unpacked = []
+            for druid, item_type in nodes:
+                value = fetched.get(druid)
+                if value is None:
+                    raise NotFoundException(druid)
+                record = _unpack_record(druid, value)
+                if record:
+                    records[druid] = record
+                else:
+                    unpacked.append((druid, item_type, value))
+            if unpacked and not with_externals:
+                keys = [druid + EXTERNAL_STRING for druid, _, _ in unpacked]
+                external_ops.append(("get", database, keys))
+                fetched = None
+            unpacked_groups.append((unpacked, fetched))
+        if external_ops:
+            externals = iter((yield external_ops))
+            unpacked_groups = [
+                (unpacked, next(externals) if fetched is None else fetched)
+                for unpacked, fetched in unpacked_groups
+            ]
+        for unpacked, fetched in unpacked_groups:
+            for druid, item_type, value in unpacked:
+                external_string = fetched.get(druid + EXTERNAL_STRING) or "null"
+                records[druid] = _Record(druid, item_type, value, external_string)
+        if self.remote_cache is not None:
+            for henge_to_query, nodes in by_henge.values():
+                if henge_to_query is not self:
+                    for druid, _ in nodes:
+                        self.remote_cache.put(druid, records[druid])
+        return records
+
     @property
     def item_types(self):
         """
@@ -232,16 +1370,41 @@ class Henge(object):
 
         :param dict item: The item you wish to validate type of.
         """
+        from jsonschema import ValidationError
+
         valid_schemas = []
-        for name, schema in self.schemas.items():
+        for name in self.schemas:
             _LOGGER.debug("Testing schema: {}".format(name))
             try:
-                jsonschema.validate(item, schema)
+                self.validate(item, name)
                 valid_schemas.append(name)
-            except jsonschema.ValidationError:
+            except ValidationError:
                 continue
         return valid_schemas
 
+    def validate(self, item, item_type):
+        """
+        Validate a flattened item against the schema of an item type.
+
+        Uses the validator compiled for the item type on its first use.
+
+        :param item: The flattened item to validate.
+        :param str item_type: The item type to validate against.
+        :raise jsonschema.ValidationError: If the item is not valid.
+        :raise jsonschema.SchemaError: If the schema of the item type is not
+            valid.
+        """
+        if item_type not in self._validators:
+            schema = self.schemas[item_type]
+            validator = _compile_validator(schema)
+            if self.fast_validation:
+                self._fast_checkers[item_type] = _fast_checker(schema)
+            self._validators[item_type] = validator
+        check = self._fast_checkers.get(item_type)
+        if check is not None and check(item):
+            return
+        _validate(self._validators[item_type], item)
+
     def insert(
         self, item: dict | list, item_type: str, reclimit: int = None
     ) -> str | bool:
@@ -257,6 +1420,58 @@ class Henge(object):
 
         _LOGGER.debug("Insert type: {} / Item: {}".format(item_type, item))
 
+        if item_type not in self.schemas.keys():
+            _LOGGER.error(
+                "I don't know about items of type '{}'. I know of: '{}'".format(
+                    item_type, list(self.schemas.keys())
+                )
+            )
+            return False
+
+        batch = _InsertBatch(self._insert_session)
+        druid = self._insert(item, item_type, reclimit, batch)
+        self._write_batch(batch)
+        return druid
+
+    def insert_many(
+        self, items: list, item_type: str, reclimit: int = None
+    ) -> list[str] | bool:
+        """
+        Add many structured items of the same type to the database at once.
+
+        All items are flattened and validated first; the resulting key/value
+        pairs are then handed to each backend in a single bulk write, so
+        nothing is written if any item fails validation.
+
+        :param list items: Items to add.
+        :param str item_type: A string specifying the type of the items.
+        :param int reclimit: Recursion limit, as in Henge.insert.
+        :return list[str]: The druids of the items, in input order.
+        """
+        if item_type not in self.schemas.keys():
+            _LOGGER.error(
+                "I don't know about items of type '{}'. I know of: '{}'".format(
+                    item_type, list(self.schemas.keys())
+                )
+            )
+            return False
+
+        batch = _InsertBatch(self._insert_session)
+        druids = [self._insert(item, item_type, reclimit, batch) for item in items]
+        self._write_batch(batch)
+        _LOGGER.debug(
+            "Inserted {} items ({} flat nodes) of type {}".format(
+                len(druids), len(batch.records), item_type
+            )
+        )
+        return druids
+
+    def _insert(self, item, item_type, reclimit, batch):
+        """
+        Flatten a structured item into the batch, recursing into sub-items.
+
+        Nothing is written to the database here; see Henge._write_batch.
+        """
         if item_type not in self.schemas.keys():
             _LOGGER.error(
                 "I don't know about items of type '{}'. I know of: '{}'".format(
@@ -268,10 +1483,11 @@ class Henge(object):
         schema = self.schemas[item_type]
 
         flat_item = item
+        children = []  # druids of sub-items
         if schema["type"] == "object":
             flat_item = {}
             if isinstance(reclimit, int) and reclimit == 0:
-                return self._insert_flat(item, item_type)
+                return self._flatten_node(item, item_type, batch)
             else:
                 if isinstance(reclimit, int):
                     reclimit = reclimit - 1
@@ -284,11 +1500,13 @@ class Henge(object):
                         )
                         if "recursive" in schema and prop in schema["recursive"]:
                             hclass = schema["properties"][prop]["henge_class"]
-                            digest = self.insert(item[prop], hclass, reclimit)
+                            digest = self._insert(item[prop], hclass, reclimit, batch)
                             flat_item[prop] = digest
+                            children.append(digest)
                         elif schema["properties"][prop]["type"] in ["array"]:
-                            digest = self.insert(item[prop], "array", reclimit)
+                            digest = self._insert(item[prop], "array", reclimit, batch)
                             flat_item[prop] = digest
+                            children.append(digest)
                         else:
                             flat_item[prop] = item[prop]
                         _LOGGER.debug(
@@ -306,7 +1524,7 @@ class Henge(object):
                 digest = []
                 hclass = schema["items"]["henge_class"]
                 if isinstance(reclimit, int) and reclimit == 0:
-                    return self._insert_flat(item, item_type)
+                    return self._flatten_node(item, item_type, batch)
                 else:
                     if isinstance(reclimit, int):
                         reclimit = reclimit - 1
@@ -316,8 +1534,9 @@ class Henge(object):
                         )
                     )
                     for element in item:
-                        digest.append(self.insert(element, hclass, reclimit))
+                        digest.append(self._insert(element, hclass, reclimit, batch))
                     flat_item = digest
+                    children = digest
             else:
                 flat_item = item
                 _LOGGER.debug("Array flat item: {}".format(flat_item))
@@ -327,7 +1546,7 @@ class Henge(object):
             # digest = self.insert(item, hclass)
             flat_item = item
 
-        return self._insert_flat(flat_item, item_type)
+        return self._flatten_node(flat_item, item_type, batch, children)
 
     def _insert_flat(self, item, item_type=None, item_name=None):
         """
@@ -343,6 +1562,25 @@ class Henge(object):
             Henge.select_item_type to automatically choose this, if only one
             fits.
         """
+        batch = _InsertBatch()
+        druid = self._flatten_node(item, item_type, batch)
+        self._write_batch(batch)
+        return druid
+
+    def _flatten_node(self, item, item_type, batch, children=()):
+        """
+        Validate and digest a flattened item, queueing it in the batch.
+
+        Items already flattened in the batch, or written in the insert
+        session, are found by the digest of their canonical string instead,
+        and neither validated nor queued again.
+
+        :param item: A flattened item (no nesting).
+        :param str item_type: The item type to validate against.
+        :param _InsertBatch batch: The batch collecting records to write.
+        :param list[str] children: Druids of the sub-items the item refers to.
+        :return str: The druid of the item.
+        """
         if item_type not in self.schemas.keys():
             _LOGGER.error(
                 "I don't know about items of type '{}'. I know of: '{}'".format(
@@ -357,11 +1595,25 @@ class Henge(object):
         # jsonschema do this automatically?
         # also item_type ?
 
+        key = string = None
+        if self.memoize_inserts:
+            try:
+                string = self.serializer.dumps(item)
+            except (TypeError, ValueError):
+                pass  # Not JSON; left for validation to report
+            else:
+                key = (item_type, self.checksum_function(string))
+                druid = batch.lookup(key)
+                if druid is not None:
+                    return druid
+
+        from jsonschema import ValidationError
+
         valid_schema = self.schemas[item_type]
         # Add defaults here ?
         try:
-            jsonschema.validate(item, valid_schema)
-        except jsonschema.ValidationError as e:
+            self.validate(item, item_type)
+        except ValidationError as e:
             _LOGGER.error(
                 "Not valid data. Item type: {}. Attempting to insert item: {}".format(
                     item_type, item
@@ -370,19 +1622,7 @@ class Henge(object):
             _LOGGER.error(e)
 
             if isinstance(item, str):
-                henge_to_query = self.henges[item_type]
-                try:
-                    existing_item_type = henge_to_query.database[item + ITEM_TYPE]
-                except KeyError:
-                    _LOGGER.error(
-                        "If you're trying to insert an item with druids, the sub-items must exist in the database."
-                    )
-                    # return None
-                try:
-                    existing_item = henge_to_query.database[item]
-                except KeyError:
-                    _LOGGER.error("That item wasn't in the database.")
-
+                self._check_existing_druid(item, item_type)
                 # if (item_type == existing_item_type):
                 # _LOGGER.info("But wait!!! That's already here, and it's great! I'll return that!")
                 return item
@@ -391,21 +1631,51 @@ class Henge(object):
 
         _LOGGER.debug(f"item to insert: {item}")
         item_inherent_split = select_inherent_properties(item, valid_schema)
-        attr_string = canonical_str(item_inherent_split["inherent"])
-        external_string = canonical_str(item_inherent_split["external"])
+        external_string = self.serializer.dumps(item_inherent_split["external"])
+        if key is not None and item_inherent_split["external"] is None:
+            attr_string, druid = string, key[1]  # The whole item is inherent
+        else:
+            attr_string = self.serializer.dumps(item_inherent_split["inherent"])
+            druid = self.checksum_function(attr_string)
 
         _LOGGER.debug(f"String to digest: {attr_string}")
         _LOGGER.debug(f"External string: {external_string}")
-        druid = self.checksum_function(attr_string)
-        self._henge_insert(druid, attr_string, item_type, external_string)
+        if (
+            self.compact_arrays
+            and valid_schema["type"] == "array"
+            and "henge_class" in valid_schema["items"]
+        ):
+            attr_string = _encode_druid_array(item) or attr_string
+        batch.add(
+            _Record(druid, item_type, attr_string, external_string), None, children
+        )
+        if key is not None:
+            batch.druids[key] = druid
 
         _LOGGER.debug(
-            "Inserted flat item. Digest: {} / Type: {} / Item: {}".format(
+            "Flattened item. Digest: {} / Type: {} / Item: {}".format(
                 druid, item_type, item
             )
         )
         return druid
 
+    def _check_existing_druid(self, druid, item_type):
+        """
+        Log whether a druid, given in place of a sub-item, is in the database.
+        """
+        henge_to_query = self.henges[item_type]
+        try:
+            existing_item_type = henge_to_query.database[druid + ITEM_TYPE]
+        except KeyError:
+            _LOGGER.error(
+                "If you're trying to insert an item with druids, the sub-items must exist in the database."
+            )
+            # return None
+        try:
+            existing_item = henge_to_query.database[druid]
+        except KeyError:
+            _LOGGER.error("That item wasn't in the database.")
+
     def _henge_insert(
         self, druid, string, item_type, external_string, digest_version=None
     ):
@@ -413,6 +1683,395 @@ class Henge(object):
         Inserts an item into the database, with henge-metadata slots for item
         type and digest version.
         """
+        batch = _InsertBatch()
+        batch.add(_Record(druid, item_type, string, external_string), digest_version)
+        self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        """
+        Write all records queued in a batch, with one bulk write per backend.
+
+        Druids are content addresses, so records that are already stored are
+        skipped. The batch is probed top-down, one tree level at a time: when
+        an item already exists, so do all of its sub-items, which are then
+        not probed at all.
+
+        With the index kept, probing, writing and indexing all happen under
+        _index_lock: otherwise threads inserting the same items at once would
+        each find them missing, and index them more than once.
+        """
+        if self.index_items:
+            with self._index_lock:
+                new, rewritten = self._run(self._write_plan(batch))
+                self._run(self._index_plan(new, rewritten))
+                self._remember_batch(batch)
+        else:
+            self._run(self._write_plan(batch))
+            with self._index_lock:
+                self._remember_batch(batch)
+
+    def _remember_batch(self, batch):
+        """
+        Add the items of a written batch to the insert session, if any, and
+        forget cached retrievals that rewritten items make stale.
+        """
+        if batch.rewritten:
+            if self.cache is not None:
+                self.cache.invalidate()  # Trees can embed rewritten items
+            if self.remote_cache is not None:
+                self.remote_cache.invalidate(lambda druid: druid in batch.rewritten)
+        if batch.hits or batch.misses:
+            _LOGGER.debug(
+                "Insert memo: {} hits, {} misses".format(batch.hits, batch.misses)
+            )
+        self._memo_hits += batch.hits
+        self._memo_misses += batch.misses
+        if batch.memo is not None:
+            batch.memo.update(batch)
+
+    @contextmanager
+    def insert_session(self, max_entries: int = 100000):
+        """
+        Share memoized items between the inserts made within a block.
+
+        Each insert or insert_many call validates and queues a repeated
+        sub-item once; in a session, items written by earlier calls are also
+        looked up, and neither validated nor written again. Nested sessions
+        join the outermost one. Removing items with delete, gc or clean, or
+        invalidate_cache, forgets the remembered items.
+
+        :param int max_entries: Maximum number of items to remember; the
+            least recently used ones are forgotten first.
+        :return InsertMemo: The session's memo, with its hit counts.
+        """
+        if self._insert_session is not None:
+            yield self._insert_session
+            return
+        self._insert_session = InsertMemo(max_entries)
+        try:
+            yield self._insert_session
+        finally:
+            self._insert_session = None
+
+    def memo_info(self) -> dict:
+        """
+        Report how often inserts found an item already flattened.
+
+        :return dict: Hit and miss counts of all inserts by this henge.
+        """
+        return {"hits": self._memo_hits, "misses": self._memo_misses}
+
+    def _write_plan(self, batch):
+        """
+        I/O plan for Henge._write_batch
+
+        Records already stored are skipped, unless their external attributes
+        changed; see Henge._changed_externals_plan.
+
+        :return (list, list): (record, children) of the records that were
+            written new, and (record, stored record, children) of those that
+            were rewritten.
+        """
+        records = batch.records
+        referenced = {
+            child for _, _, children in records.values() for child in children
+        }
+        level = [druid for druid in records if druid not in referenced]
+        visited = set(level)
+        new = []
+        while level:
+            existing = yield from self._existing_plan(level, records)
+            changed = yield from self._changed_externals_plan(existing, records)
+            batch.rewritten.update(changed)
+            batch.skipped += len(existing) - len(changed)
+            next_level = []
+            for druid in level:
+                if druid in existing and druid not in changed:
+                    continue
+                if druid not in existing:
+                    new.append(druid)
+                for child in records[druid][2]:
+                    if child in records and child not in visited:
+                        visited.add(child)
+                        next_level.append(child)
+            level = next_level
+
+        writes = {}  # id(database) -> (database, pairs)
+        for druid in new + list(batch.rewritten):
+            record, digest_version, _ = records[druid]
+            for database, pairs in self._record_pairs(record, digest_version):
+                writes.setdefault(id(database), (database, {}))[1].update(pairs)
+        if writes:
+            yield [("set", database, pairs) for database, pairs in writes.values()]
+        _LOGGER.debug(
+            "Wrote {} records; skipped {} existing".format(len(new), batch.skipped)
+        )
+        written = [(records[druid][0], records[druid][2]) for druid in new]
+        rewritten = [
+            (records[druid][0], stored, records[druid][2])
+            for druid, stored in batch.rewritten.items()
+        ]
+        return written, rewritten
+
+    def _index_plan(self, written, rewritten=()):
+        """
+        I/O plan to add newly written records to the item-type index, to its
+        item and byte counters, and to the reverse references of their
+        sub-items.
+
+        The index of each item type is a header, and fixed-size pages of
+        druids in insertion order. The header holds the number of index
+        entries and the number and total size of the items. New druids are
+        appended to the last page, so this reads and rewrites one header and
+        at most one partial page per item type. The reverse references of a
+        druid, the druids of the items that refer to it, are kept the same
+        way, under a header holding their count; see _remove_refs_plan.
+        Appends are read-modify-writes, so callers serialize them; see
+        _index_lock.
+
+        :param list written: (record, children) of the records that were
+            just written, where children are the druids they refer to.
+        :param list rewritten: (record, stored record, children) of stored
+            items rewritten with other external attributes. Their sizes are
+            updated, and they're added to the references of the sub-items
+            written with them.
+        """
+        by_type = {}
+        referrers = {}  # child druid -> druids of new items referring to it
+        for record, children in written:
+            by_type.setdefault(record.item_type, []).append(record)
+            for child in dict.fromkeys(children):
+                referrers.setdefault(child, []).append(record.druid)
+        new_druids = {record.druid for record, _ in written}
+        resized = {}  # item type -> change in bytes of rewritten items
+        for record, stored, children in rewritten:
+            change = _record_size(record) - _record_size(stored)
+            resized[record.item_type] = resized.get(record.item_type, 0) + change
+            for child in dict.fromkeys(children):
+                if child in new_druids:
+                    referrers.setdefault(child, []).append(record.druid)
+        if not by_type and not resized:
+            return
+        item_types = list(dict.fromkeys(list(by_type) + list(resized)))
+        header_keys = [_index_key(item_type) for item_type in item_types]
+        refs_keys = [_refs_key(child) for child in referrers]
+        found, found_refs = yield [
+            ("get", self.database, header_keys),
+            ("get", self.database, refs_keys),
+        ]
+        headers = self._index_headers(item_types, found)
+        refs_headers = self._refs_headers(referrers, found_refs)
+        keys = []  # Partial last pages
+        for item_type in by_type:
+            header = headers[item_type]
+            if header["entries"] % header["page_size"]:
+                page = header["entries"] // header["page_size"]
+                keys.append(_index_key(item_type, page))
+        for child, header in refs_headers.items():
+            if header["count"] % header["page_size"]:
+                page = header["count"] // header["page_size"]
+                keys.append(_refs_key(child, page))
+        (pages,) = yield [("get", self.database, keys)]
+
+        pairs = {}
+        for child, parents in referrers.items():
+            header = refs_headers[child]
+            page = header["count"] // header["page_size"]
+            _append_to_pages(
+                pairs,
+                lambda page, child=child: _refs_key(child, page),
+                page,
+                json.loads(pages.get(_refs_key(child, page), "[]")),
+                parents,
+                header["page_size"],
+            )
+            header["count"] += len(parents)
+            pairs[_refs_key(child)] = json.dumps(header)
+        for item_type, type_records in by_type.items():
+            header = headers[item_type]
+            page_size = header["page_size"]
+            page = header["entries"] // page_size
+            key = _index_key(item_type, page)
+            _append_to_pages(
+                pairs,
+                lambda page, item_type=item_type: _index_key(item_type, page),
+                page,
+                json.loads(pages.get(key, "[]")),
+                (record.druid for record in type_records),
+                page_size,
+            )
+            header["entries"] += len(type_records)
+            header["items"] += len(type_records)
+            header["bytes"] += sum(_record_size(r) for r in type_records)
+        for item_type, change in resized.items():
+            headers[item_type]["bytes"] += change
+        for item_type in item_types:
+            pairs[_index_key(item_type)] = json.dumps(headers[item_type])
+        yield [("set", self.database, pairs)]
+
+    def _remove_refs_plan(self, children):
+        """
+        I/O plan to remove referrers from the reverse references of druids.
+
+        Reads all pages of each druid's references, and rewrites them without
+        the removed referrers, packed into as few pages as before or fewer.
+        The header of a druid's references holds their count and page size.
+
+        :param dict children: Sets of referrers to remove, by druid.
+        :return (dict, list, list): Keys and values to write, keys to delete,
+            and the druids left without any referrer.
+        """
+        keys = [_refs_key(child) for child in children]
+        (found,) = yield [("get", self.database, keys)]
+        headers = self._refs_headers(
+            [c for c in children if _refs_key(c) in found], found
+        )
+        page_keys = {
+            child: self._refs_keys(child, header) for child, header in headers.items()
+        }
+        (pages,) = yield [
+            ("get", self.database, [k for ks in page_keys.values() for k in ks[1:]])
+        ]
+        pairs = {}
+        deletes = []
+        unreferenced = [child for child in children if child not in headers]
+        for child, child_keys in page_keys.items():
+            header = headers[child]
+            size = header["page_size"]
+            child_keys = child_keys[1:]
+            refs = [
+                parent
+                for key in child_keys
+                for parent in json.loads(pages.get(key, "[]"))
+                if parent not in children[child]
+            ]
+            if not refs:
+                unreferenced.append(child)
+                deletes.extend([_refs_key(child)] + child_keys)
+                continue
+            kept = -(-len(refs) // size)
+            for page in range(kept):
+                pairs[child_keys[page]] = json.dumps(
+                    refs[page * size : (page + 1) * size]
+                )
+            deletes.extend(child_keys[kept:])
+            header["count"] = len(refs)
+            pairs[_refs_key(child)] = json.dumps(header)
+        return pairs, deletes, unreferenced
+
+    def _refs_keys_plan(self, druids):
+        """I/O plan to list the keys of the reverse references of druids"""
+        keys = [_refs_key(druid) for druid in druids]
+        (found,) = yield [("get", self.database, keys)]
+        stored = [druid for druid in druids if _refs_key(druid) in found]
+        headers = self._refs_headers(stored, found)
+        return [k for d, h in headers.items() for k in self._refs_keys(d, h)]
+
+    def _refs_headers(self, druids, found):
+        """Parse reverse reference headers read from the database, by druid"""
+        headers = {}
+        for druid in druids:
+            key = _refs_key(druid)
+            if key in found:
+                headers[druid] = json.loads(found[key])
+            else:
+                headers[druid] = {"count": 0, "page_size": self.refs_page_size}
+        return headers
+
+    @staticmethod
+    def _refs_keys(druid, header):
+        """Keys of the header and pages of the reverse references of a druid"""
+        pages = -(-header["count"] // header["page_size"])
+        return [_refs_key(druid)] + [_refs_key(druid, p) for p in range(pages)]
+
+    def _index_headers_plan(self, item_types):
+        """
+        I/O plan to read the item-type index headers.
+
+        :return dict: Headers by item type, with empty headers for item
+            types that have no index yet.
+        """
+        item_types = list(item_types)
+        header_keys = [_index_key(item_type) for item_type in item_types]
+        (found,) = yield [("get", self.database, header_keys)]
+        return self._index_headers(item_types, found)
+
+    def _index_headers(self, item_types, found):
+        """Parse index headers read from the database, by item type"""
+        headers = {}
+        for item_type in item_types:
+            key = _index_key(item_type)
+            if key in found:
+                headers[item_type] = json.loads(found[key])
+            else:
+                headers[item_type] = {
+                    "entries": 0,
+                    "page_size": self.index_page_size,
+                    "items": 0,
+                    "bytes": 0,
+                }
+        return headers
+
+    def _existing_plan(self, druids, records):
+        """
+        I/O plan to find which of the batched records are already stored.
+
+        :param list[str] druids: Druids of batched records to probe.
+        :param dict records: The batched records, by druid.
+        :return set[str]: The druids that are already stored.
+        """
+        by_henge = {}  # id(henge) -> (henge, [druid])
+        for druid in druids:
+            henge_to_query = self.henges[records[druid][0].item_type]
+            by_henge.setdefault(id(henge_to_query), (henge_to_query, []))[1].append(
+                druid
+            )
+        groups = list(by_henge.values())
+        found = yield [
+            ("contains", henge_to_query.database, henge_druids)
+            for henge_to_query, henge_druids in groups
+        ]
+        existing = set()
+        remote = set()
+        for (henge_to_query, _), henge_found in zip(groups, found):
+            (existing if henge_to_query is self else remote).update(henge_found)
+        if remote:
+            # The interface henge must also know the item type
+            (types,) = yield [
+                ("contains", self.database, [druid + ITEM_TYPE for druid in remote])
+            ]
+            existing.update(druid for druid in remote if druid + ITEM_TYPE in types)
+        return existing
+
+    def _changed_externals_plan(self, druids, records):
+        """
+        I/O plan to find which stored items are being inserted with other
+        external (non-inherent) attributes.
+
+        A druid only covers the inherent attributes, so such an item is
+        already stored under the same druid, and the last insert wins.
+
+        :param set[str] druids: Druids of batched records already stored.
+        :param dict records: The batched records, by druid.
+        :return dict: The stored records that differ, by druid.
+        """
+        candidates = [d for d in druids if records[d][0].external_string != "null"]
+        if not candidates:
+            return {}
+        stored = yield from self._read_nodes_plan(candidates)
+        return {
+            druid: stored[druid]
+            for druid in candidates
+            if stored[druid].external_string != records[druid][0].external_string
+        }
+
+    def _record_pairs(self, record, digest_version=None):
+        """
+        Build the key/value pairs that store a record, with henge-metadata
+        slots for item type and digest version.
+
+        :return list: (database, pairs) tuples for each database written.
+        """
         if not digest_version:
             digest_version = self.digest_version
 
@@ -423,31 +2082,133 @@ class Henge(object):
 
         # The storage henge may also be a read-only API...for some items...
 
-        henge_to_query = self.henges[item_type]
-        # _LOGGER.debug("henge_to_query: {}".format(henge_to_query))
-        henge_to_query.database[druid] = string
-        henge_to_query.database[druid + ITEM_TYPE] = item_type
-        henge_to_query.database[druid + "_digest_version"] = digest_version
-        henge_to_query.database[druid + "_external_string"] = external_string
+        druid = record.druid
+        henge_to_query = self.henges[record.item_type]
+        if self.packed_records:
+            pairs = {druid: _pack_record(record, digest_version)}
+        else:
+            pairs = {
+                druid: record.string,
+                druid + ITEM_TYPE: record.item_type,
+                druid + DIGEST_VERSION: digest_version,
+                druid + EXTERNAL_STRING: record.external_string,
+            }
+        writes = [(henge_to_query.database, pairs)]
 
         if henge_to_query != self:
-            self.database[druid + ITEM_TYPE] = item_type
-            self.database[druid + "_digest_version"] = digest_version
+            writes.append(
+                (
+                    self.database,
+                    {
+                        druid + ITEM_TYPE: record.item_type,
+                        druid + DIGEST_VERSION: digest_version,
+                    },
+                )
+            )
+        return writes
 
-    def clean(self):
+    def cache_info(self):
         """
-        Remove all items from this database.
+        Report the usage of the retrieval cache.
+
+        :return dict: Hit, miss and eviction counts and the cache size, or
+            None if this henge has no cache.
         """
-        try:
-            for k, v in self.database.items():
-                try:
-                    del self.database[k]
-                    del self.database[k + ITEM_TYPE]
-                    del self.database[k + "_digest_version"]
-                except (KeyError, AttributeError):
-                    pass
-        except AttributeError as e:
-            _LOGGER.warn(f"Error trying to iterate over database items: {e}")
+        return self.cache.stats() if self.cache is not None else None
+
+    def invalidate_cache(self, druids: list[str] = None) -> int:
+        """
+        Remove retrieved items from the cache, e.g. after removing them from
+        the database.
+
+        :param list[str] druids: Druids to remove. Default: all.
+        :return int: The number of cache entries removed.
+        """
+        if self._insert_session is not None:
+            self._insert_session.clear()
+        if druids is not None:
+            druids = set(druids)
+        if self.remote_cache is not None:
+            self.remote_cache.invalidate(
+                None if druids is None else lambda druid: druid in druids
+            )
+        if self.cache is None:
+            return 0
+        if druids is None:
+            return self.cache.invalidate()
+        return self.cache.invalidate(lambda key: key[0] in druids)
+
+    def clean(self, item_type: str = None, batch_size: int = 10000) -> None:
+        """
+        Remove all items from this database, or all items of one type.
+
+        Removing everything uses the backend's `clear` method if it has one,
+        such as a TRUNCATE, and otherwise deletes keys in batches. Removing
+        one item type pages through its index, deleting the items with all
+        their metadata in bulk, and removing them from the reverse
+        references of their sub-items; items of other types that refer to
+        them are left dangling.
+
+        :param str item_type: Remove only items of this type. Default: all.
+        :param int batch_size: Number of keys or items to delete at a time.
+        """
+        with self._index_lock:
+            if item_type is None:
+                _clear(self.database, batch_size)
+            else:
+                self._run(self._clean_plan(item_type, batch_size))
+        self.invalidate_cache()
+
+    def _clean_plan(self, item_type, batch_size):
+        """I/O plan for Henge.clean of one item type"""
+        headers = yield from self._index_headers_plan([item_type])
+        header = headers[item_type]
+        page_size = header["page_size"]
+        pages = -(-header["entries"] // page_size)
+        # Items of types without sub-items needn't be read to be removed
+        schema = self.schemas[item_type]
+        has_children = "recursive" in schema or (
+            schema["type"] == "array" and "henge_class" in schema["items"]
+        )
+        pages_per_batch = max(batch_size // page_size, 1)
+        for first in range(0, pages, pages_per_batch):
+            last = min(first + pages_per_batch, pages)
+            keys = [_index_key(item_type, page) for page in range(first, last)]
+            (found,) = yield [("get", self.database, keys)]
+            druids = list(
+                dict.fromkeys(d for k in keys for d in json.loads(found.get(k, "[]")))
+            )
+            if header["entries"] != header["items"]:
+                druids = list((yield from self._live_plan(item_type, druids)))
+            pairs = {}
+            deletes = {id(self.database): (self.database, keys)}
+            if has_children:
+                records = yield from self._read_nodes_plan(druids)
+                children = {}  # child druid -> removed druids that referred to it
+                for druid, record in records.items():
+                    item = self._parse_node(record)
+                    for child in self._child_druids(item_type, item, None):
+                        children.setdefault(child, set()).add(druid)
+                # The references of removed druids are removed whole, below
+                for druid in druids:
+                    children.pop(druid, None)
+                pairs, refs_deletes, _ = yield from self._remove_refs_plan(children)
+                deletes[id(self.database)][1].extend(refs_deletes)
+            # Items of other types that refer to these are left dangling
+            refs_keys = yield from self._refs_keys_plan(druids)
+            deletes[id(self.database)][1].extend(refs_keys)
+            for druid in druids:
+                record = _Record(druid, item_type, None, None)
+                for database, record_keys in self._record_keys(record):
+                    deletes.setdefault(id(database), (database, []))[1].extend(
+                        record_keys
+                    )
+            operations = [("delete", db, keys) for db, keys in deletes.values()]
+            if pairs:
+                operations.append(("set", self.database, pairs))
+            yield operations
+        yield [("delete", self.database, [_index_key(item_type)])]
+        _LOGGER.info("Removed all items of type {}".format(item_type))
 
     def show(self):
         """
@@ -456,20 +2217,426 @@ class Henge(object):
         for k, v in self.database.items():
             _LOGGER.info(f"{k} {v}")
 
+    def delete(
+        self, druids: list[str], cascade: bool = False, batch_size: int = 1000
+    ) -> int:
+        """
+        Remove items, with all their metadata.
+
+        Items that other stored items still refer to are kept, unless those
+        are deleted too. Removed items are also removed from the reverse
+        references of their sub-items; with cascade, sub-items that no other
+        item refers to any more are removed as well, down the tree.
+
+        :param list[str] druids: Druids of the items to remove.
+        :param bool cascade: Also remove sub-items left unreferenced.
+        :param int batch_size: Number of items to remove at a time.
+        :return int: The number of items removed.
+        """
+        with self._index_lock:
+            return self._run(self._delete_plan(druids, cascade, (), batch_size))
+
+    def gc(self, roots: list[str], batch_size: int = 1000) -> int:
+        """
+        Remove all items that can't be reached from the given roots.
+
+        Streams through the item-type index, one batch of druids at a time.
+        Items that no other item refers to, and that are not roots, are
+        removed, and so are their sub-items once nothing else refers to
+        them; see Henge.delete. The index is then compacted. Memory use is
+        bounded by the batch size and the roots, not by the store size.
+
+        Inserts must not run at the same time, or they may refer to items
+        that are being removed.
+
+        :param list[str] roots: Druids of the items to keep, with everything
+            they refer to, recursively.
+        :param int batch_size: Number of druids to check and remove at a
+            time.
+        :return int: The number of items removed.
+        """
+        with self._index_lock:
+            return self._run(self._gc_plan(roots, batch_size))
+
+    def _check_indexed(self, operation):
+        """Raise if reverse references are not kept, as removing items needs"""
+        if not self.index_items:
+            raise ValueError(
+                "Can't {} items of a henge created with index_items=False".format(
+                    operation
+                )
+            )
+
+    def _gc_plan(self, roots, batch_size):
+        """I/O plan for Henge.gc"""
+        self._check_indexed("gc")
+        if self._insert_session is not None:
+            self._insert_session.clear()
+        roots = set(roots)
+        removed = 0
+        for item_type in sorted(self.item_types):
+            cursor = None
+            while True:
+                page = yield from self._list_plan(batch_size, 0, item_type, cursor)
+                candidates = [druid for druid in page["items"] if druid not in roots]
+                keys = [_refs_key(druid) for druid in candidates]
+                (refs,) = yield [("get", self.database, keys)]
+                garbage = [d for d in candidates if _refs_key(d) not in refs]
+                removed += yield from self._delete_plan(
+                    garbage, True, roots, batch_size
+                )
+                cursor = page["cursor"]
+                if cursor is None:
+                    break
+        # Removals cascade into other item types, so compact once all are done
+        for item_type in sorted(self.item_types):
+            yield from self._compact_index_plan(item_type)
+        _LOGGER.info("Garbage collection removed {} items".format(removed))
+        return removed
+
+    def _delete_plan(self, druids, cascade, keep, batch_size):
+        """
+        I/O plan for Henge.delete
+
+        :param list[str] druids: Druids of the items to remove.
+        :param bool cascade: Also remove sub-items left unreferenced.
+        :param set keep: Druids never to remove by cascading.
+        :param int batch_size: Number of items to remove at a time.
+        :return int: The number of items removed.
+        """
+        self._check_indexed("delete")
+        if self._insert_session is not None:
+            self._insert_session.clear()
+        requested = set(druids)
+        pending = list(dict.fromkeys(druids))
+        removed = 0
+        while pending:
+            level, pending = pending[:batch_size], pending[batch_size:]
+            refs_keys = [_refs_key(druid) for druid in level]
+            stored_keys = [key for d in level for key in (d, d + ITEM_TYPE)]
+            refs, stored = yield [
+                ("get", self.database, refs_keys),
+                ("contains", self.database, stored_keys),
+            ]
+            # Referenced items wait until all their referrers are removed
+            level = [
+                druid
+                for druid in level
+                if _refs_key(druid) not in refs
+                and (druid in stored or druid + ITEM_TYPE in stored)
+            ]
+            records = yield from self._read_nodes_plan(level)
+            children = {}  # child druid -> removed druids that referred to it
+            for druid, record in records.items():
+                item = self._parse_node(record)
+                for child in self._child_druids(record.item_type, item, None):
+                    children.setdefault(child, set()).add(druid)
+            by_type = {}
+            for record in records.values():
+                by_type.setdefault(record.item_type, []).append(record)
+            headers = yield from self._index_headers_plan(by_type)
+            pairs, refs_deletes, unreferenced = yield from self._remove_refs_plan(
+                children
+            )
+
+            deletes = {}  # id(database) -> (database, keys)
+            if refs_deletes:
+                deletes[id(self.database)] = (self.database, refs_deletes)
+            for child in unreferenced:
+                if (cascade or child in requested) and child not in keep:
+                    pending.append(child)
+            for item_type, type_records in by_type.items():
+                header = headers[item_type]
+                header["items"] -= len(type_records)
+                header["bytes"] -= sum(_record_size(r) for r in type_records)
+                pairs[_index_key(item_type)] = json.dumps(header)
+            for record in records.values():
+                for database, record_keys in self._record_keys(record):
+                    deletes.setdefault(id(database), (database, []))[1].extend(
+                        record_keys
+                    )
+            operations = [("delete", db, keys) for db, keys in deletes.values()]
+            if pairs:
+                operations.append(("set", self.database, pairs))
+            if operations:
+                yield operations
+            self.invalidate_cache(records)
+            removed += len(records)
+        return removed
+
+    def _record_keys(self, record):
+        """
+        List the keys that may store a record, in either storage layout.
+
+        :return list: (database, keys) tuples for each database.
+        """
+        druid = record.druid
+        henge_to_query = self.henges[record.item_type]
+        keys = [druid] + [druid + suffix for suffix in METADATA_SUFFIXES]
+        deletes = [(henge_to_query.database, keys)]
+        if henge_to_query != self:
+            deletes.append((self.database, [druid + ITEM_TYPE, druid + DIGEST_VERSION]))
+        return deletes
+
+    def _compact_index_plan(self, item_type):
+        """
+        I/O plan to drop the entries of removed items from an item-type
+        index, one page at a time.
+
+        Entries move to earlier positions, so listing cursors from before
+        the compaction may skip items.
+        """
+        headers = yield from self._index_headers_plan([item_type])
+        header = headers[item_type]
+        if header["entries"] == header["items"]:
+            return
+        page_size = header["page_size"]
+        pages = -(-header["entries"] // page_size)
+        kept = []
+        written = 0  # Pages written
+        for page in range(pages):
+            key = _index_key(item_type, page)
+            (found,) = yield [("get", self.database, [key])]
+            entries = json.loads(found.get(key, "[]"))
+            live = yield from self._live_plan(item_type, entries)
+            kept.extend(druid for druid in dict.fromkeys(entries) if druid in live)
+            while len(kept) >= page_size or (page == pages - 1 and kept):
+                key = _index_key(item_type, written)
+                yield [("set", self.database, {key: json.dumps(kept[:page_size])})]
+                header["entries"] = written * page_size + len(kept[:page_size])
+                kept = kept[page_size:]
+                written += 1
+        if written == 0:
+            header["entries"] = 0
+        stale = [_index_key(item_type, page) for page in range(written, pages)]
+        yield [
+            ("delete", self.database, stale),
+            ("set", self.database, {_index_key(item_type): json.dumps(header)}),
+        ]
+
     def __len__(self):
-        return len(self.database)
+        """The number of stored items, from the counters; see Henge.stats"""
+        return self.stats()["items"]
 
-    def list(self, limit=1000, offset=0):
+    def stats(self) -> dict:
         """
-        List all items in the database.
+        Count the stored items, and their total size, by item type.
+
+        Reads the counters kept in the item-type index headers, so it costs
+        one multi-get however large the store is. The counters are updated
+        with read-modify-writes, serialized only within this Henge: when
+        several processes or Henge instances write to the same database,
+        concurrent inserts can lose increments, and the counts are
+        approximate until a Henge.reindex recounts them. Stores written
+        before the counters existed count 0 items until a reindex.
+
+        :return dict: The number of "items" and their total "bytes", and the
+            same for each item type under "item_types".
         """
+        return self._run(self._stats_plan())
+
+    def _stats_plan(self):
+        """I/O plan for Henge.stats"""
+        headers = yield from self._index_headers_plan(sorted(self.item_types))
+        item_types = {
+            item_type: {"items": header["items"], "bytes": header["bytes"]}
+            for item_type, header in headers.items()
+        }
         return {
-            "count": len(self.database),
+            "items": sum(counts["items"] for counts in item_types.values()),
+            "bytes": sum(counts["bytes"] for counts in item_types.values()),
+            "item_types": item_types,
+        }
+
+    def list(
+        self,
+        limit: int = 1000,
+        offset: int = 0,
+        item_type: str = None,
+        cursor: str = None,
+    ) -> dict:
+        """
+        List druids of stored items, in insertion order, by item type.
+
+        Pages through the item-type index, so each call reads about
+        limit / index_page_size index pages, however large the store is.
+        Only items are listed, never metadata keys, and each at most once
+        per call. Stores written before the index existed need a
+        Henge.reindex first; so do stores written by several processes at
+        once, for exact counts and for no druid to repeat across calls.
+
+        :param int limit: Maximum number of druids to list.
+        :param int offset: Number of druids to skip, if no cursor is given.
+        :param str item_type: List only items of this type. Default: all
+            item types, one after another.
+        :param str cursor: Continue after a previous call, from its "cursor".
+        :return dict: The druids as "items", with the total "count", and a
+            "cursor" to pass to list the next druids, or None after the last.
+        """
+        return self._run(self._list_plan(limit, offset, item_type, cursor))
+
+    def _list_plan(self, limit, offset, item_type, cursor):
+        """I/O plan for Henge.list"""
+        item_types = [item_type] if item_type else sorted(self.item_types)
+        headers = yield from self._index_headers_plan(item_types)
+        count = sum(header["items"] for header in headers.values())
+        if cursor:
+            start_type, position = _decode_cursor(cursor)
+            if start_type not in item_types:
+                raise ValueError("Invalid cursor for this listing: {}".format(cursor))
+            item_types = item_types[item_types.index(start_type) :]
+        else:
+            position = offset
+
+        ranges = []  # (item type, start, stop) of the entries to list
+        remaining = limit
+        for t in item_types:
+            if remaining <= 0:
+                break
+            total = headers[t]["entries"]
+            if position >= total and not cursor:
+                position -= total  # Offsets span item types
+                continue
+            stop = min(total, position + remaining)
+            if stop > position:
+                ranges.append((t, position, stop))
+                remaining -= stop - position
+            position = 0
+        next_cursor = None
+        if ranges and remaining <= 0:
+            t, _, stop = ranges[-1]
+            later = item_types[item_types.index(t) + 1 :]
+            if stop < headers[t]["entries"] or any(
+                headers[x]["entries"] for x in later
+            ):
+                next_cursor = _encode_cursor(t, stop)
+
+        page_keys = []
+        for t, start, stop in ranges:
+            page_size = headers[t]["page_size"]
+            for page in range(start // page_size, (stop - 1) // page_size + 1):
+                page_keys.append(_index_key(t, page))
+        (pages,) = yield [("get", self.database, page_keys)]
+        items = []
+        for t, start, stop in ranges:
+            page_size = headers[t]["page_size"]
+            listed = []
+            for page in range(start // page_size, (stop - 1) // page_size + 1):
+                entries = json.loads(pages.get(_index_key(t, page), "[]"))
+                first = page * page_size
+                listed.extend(entries[max(start - first, 0) : stop - first])
+            # Henges writing to the same store at once can index a druid twice
+            listed = list(dict.fromkeys(listed))
+            if headers[t]["entries"] != headers[t]["items"]:
+                # Items were deleted since their index entries were written
+                live = yield from self._live_plan(t, listed)
+                listed = [druid for druid in listed if druid in live]
+            items.extend(listed)
+        return {
+            "count": count,
             "limit": limit,
             "offset": offset,
-            "items": list(self.database.keys())[offset : (offset + limit)],
+            "items": items,
+            "cursor": next_cursor,
         }
 
+    def _live_plan(self, item_type, druids):
+        """
+        I/O plan to find which druids of an item type are still stored.
+
+        :return set[str]: The druids that are stored.
+        """
+        if self.henges[item_type] is self:
+            keys = list(druids)
+        else:  # Only the interface henge has the metadata
+            keys = [druid + ITEM_TYPE for druid in druids]
+        (found,) = yield [("contains", self.database, keys)]
+        if self.henges[item_type] is self:
+            return found
+        return {key[: -len(ITEM_TYPE)] for key in found}
+
+    def reindex(self, batch_size: int = 10000) -> int:
+        """
+        Rebuild the item-type index, its counters and the reverse references
+        from a scan of the database.
+
+        Needed for stores written before the index existed, or written to
+        by several processes at once, which can lose index appends.
+
+        :param int batch_size: Number of items to read and index at a time.
+        :return int: The number of items indexed.
+        """
+        with self._index_lock:
+            headers = self._run(self._index_headers_plan(self.item_types))
+            for item_type, header in headers.items():
+                pages = -(-header["entries"] // header["page_size"])
+                keys = [_index_key(item_type, page) for page in range(pages)]
+                _delete_many(self.database, [_index_key(item_type)] + keys)
+            # Deleting from or adding to a dict while iterating it is not
+            # allowed; a dict already holds everything in memory anyway.
+            if isinstance(self.database, dict):
+                refs_keys = [k for k in self.database if k.startswith(_refs_key(""))]
+            else:
+                refs_keys = (k for k in self.database if k.startswith(_refs_key("")))
+            for batch in _batched(refs_keys, batch_size):
+                _delete_many(self.database, batch)
+            keys = (
+                list(self.database)
+                if isinstance(self.database, dict)
+                else iter(self.database)
+            )
+            batch = []
+            indexed = 0
+            for key in keys:
+                if key.startswith(HENGE_KEY_PREFIX):
+                    continue
+                if key.endswith(ITEM_TYPE):
+                    batch.append(key[: -len(ITEM_TYPE)])
+                elif not _is_metadata_key(key) and key + ITEM_TYPE not in self.database:
+                    # Packed records have no item type key; legacy items do
+                    if _unpack_record(key, _get(self.database, key)):
+                        batch.append(key)
+                if len(batch) >= batch_size:
+                    indexed += self._reindex_batch(batch)
+                    batch = []
+            indexed += self._reindex_batch(batch)
+        _LOGGER.info("Indexed {} items".format(indexed))
+        return indexed
+
+    def _reindex_batch(self, druids):
+        """Add stored items to the index, skipping any that can't be read"""
+        try:
+            records = self._read_nodes(druids)
+        except NotFoundException:
+            records = {}
+            for druid in druids:
+                try:
+                    records.update(self._read_nodes([druid]))
+                except NotFoundException:
+                    _LOGGER.warning("Not indexing unreadable item: {}".format(druid))
+        written = [
+            (r, self._child_druids(r.item_type, self._parse_node(r), None))
+            for r in records.values()
+        ]
+        self._run(self._index_plan(written))
+        return len(records)
+
+    def close(self) -> None:
+        """
+        Stop the worker threads that run operations against remote henges.
+
+        Operations still queued are cancelled, and running ones are not
+        waited for. The databases are not closed; close them separately.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def __repr__(self):
         repr = "Henge object. Item types: " + ",".join(self.item_types)
         return repr
@@ -492,7 +2659,7 @@ def split_schema(schema, name=None):
     elif schema["type"] == "object":
         recursive_properties = []
         if "henge_class" in schema:
-            schema_copy = copy.deepcopy(schema)
+            schema_copy = _copy_tree(schema)
             _LOGGER.debug("adding " + str(schema_copy["henge_class"]))
             henge_class = schema_copy["henge_class"]
             # del schema_copy['henge_class']
@@ -534,7 +2701,7 @@ def split_schema(schema, name=None):
         _LOGGER.debug("found array")
         _LOGGER.debug(schema)
         if "henge_class" in schema:
-            schema_copy = copy.deepcopy(schema)
+            schema_copy = _copy_tree(schema)
             _LOGGER.debug("adding " + str(schema["henge_class"]))
             henge_class = schema_copy["henge_class"]
             # del schema_copy['henge_class']
@@ -559,8 +2726,22 @@ def split_schema(schema, name=None):
     return slist
 
 
+def _copy_tree(item):
+    """Copy the nested dicts and lists of a retrieved item"""
+    if isinstance(item, dict):
+        return {k: _copy_tree(v) for k, v in item.items()}
+    if isinstance(item, list):
+        return [_copy_tree(v) for v in item]
+    return item
+
+
 def canonical_str(item: dict) -> str:
-    """Convert a dict into a canonical string representation"""
+    """
+    Convert a dict into a canonical string representation.
+
+    This is the reference encoding: every serializer of henge.serializer
+    produces exactly these strings.
+    """
     return json.dumps(
         item, separators=(",", ":"), ensure_ascii=False, allow_nan=False, sort_keys=True
     )
@@ -596,6 +2777,67 @@ def is_schema_recursive(schema):
     return False
 
 
+def migrate_to_packed(database, batch_size=1000, drop_legacy=True):
+    """
+    Convert a store written in the legacy four-key layout to packed records.
+
+    Keys are streamed from the database and converted in batches, so memory
+    use is bounded by the batch size. Already-packed items are left alone, so
+    an interrupted migration can simply be run again.
+
+    :param Mapping database: The database backend of a henge.
+    :param int batch_size: Number of items to convert per bulk write.
+    :param bool drop_legacy: Delete the legacy metadata keys of converted
+        items.
+    :return int: The number of items converted.
+    """
+    # Deleting from a dict while iterating it is not allowed; a dict already
+    # holds everything in memory, so iterating over a snapshot of its keys is
+    # no worse.
+    keys = list(database) if isinstance(database, dict) else iter(database)
+    converted = 0
+    batch = []
+
+    def convert(items):
+        pairs = {}
+        for druid, string in items:
+            item_type = _get(database, druid + ITEM_TYPE)
+            if item_type is None:
+                continue  # Not a henge item
+            record = _Record(
+                druid,
+                item_type,
+                string,
+                _get(database, druid + EXTERNAL_STRING) or "null",
+            )
+            digest_version = _get(database, druid + DIGEST_VERSION)
+            pairs[druid] = _pack_record(record, digest_version)
+        _set_many(database, pairs)
+        if drop_legacy:
+            for druid in pairs:
+                for suffix in METADATA_SUFFIXES:
+                    try:
+                        del database[druid + suffix]
+                    except KeyError:
+                        pass
+        return len(pairs)
+
+    for key in keys:
+        if _is_metadata_key(key):
+            continue
+        value = _get(database, key)
+        if value is None or _unpack_record(key, value):
+            continue
+        batch.append((key, value))
+        if len(batch) >= batch_size:
+            converted += convert(batch)
+            _LOGGER.info("Converted {} items to packed records".format(converted))
+            batch = []
+    if batch:
+        converted += convert(batch)
+    return converted
+
+
 def connect_mongo(
     host="0.0.0.0", port=27017, database="henge_dict", collection="store"
 ):
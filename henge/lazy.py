@@ -0,0 +1,186 @@
+"""Lazy proxies for retrieved items, that fetch sub-items on access"""
+
+import logging
+
+from collections.abc import Mapping, Sequence
+
+_LOGGER = logging.getLogger(__name__)
+
+# Use like:
+# collection = h.retrieve(druid, lazy=True)  # Reads only the top node
+# collection["sequences"][3]["name"]         # Reads what it needs to
+# collection.to_plain()                      # The whole item, as dicts and lists
+
+_UNLOADED = object()  # Placeholder for a sub-item that hasn't been fetched
+
+
+def to_plain(item):
+    """
+    Convert a retrieved item, lazy or not, into plain dicts and lists.
+
+    :param item: A retrieved item, possibly holding lazy proxies.
+    :return: The item, with every sub-item fetched.
+    """
+    if isinstance(item, (LazyMapping, LazySequence)):
+        return item.to_plain()
+    if isinstance(item, dict):
+        return {k: to_plain(v) for k, v in item.items()}
+    if isinstance(item, list):
+        return [to_plain(v) for v in item]
+    return item
+
+
+class _LazyNode(object):
+    """Shared state of the lazy proxies: the henge, and a node's druid"""
+
+    def __init__(self, henge, druid, reclimit):
+        self.henge = henge
+        self.druid = druid
+        self._child_reclimit = reclimit - 1 if isinstance(reclimit, int) else None
+
+    def _load(self, druids):
+        """Fetch sub-items with one multi-get, wrapped in proxies as needed"""
+        return self.henge._lazy_many(druids, self._child_reclimit)
+
+    def _plain_children(self, values):
+        """
+        Convert sub-items to plain items, fetching the unloaded ones a level
+        at a time with Henge.retrieve_many.
+        """
+        pending = [druid for druid, value in values if value is _UNLOADED]
+        fetched = iter(
+            self.henge.retrieve_many(pending, self._child_reclimit) if pending else []
+        )
+        return [
+            next(fetched) if value is _UNLOADED else to_plain(value)
+            for _, value in values
+        ]
+
+
+class LazyMapping(_LazyNode, Mapping):
+    """
+    A retrieved object whose recursive attributes are fetched on access.
+
+    Other attributes are loaded with the object itself. Fetched sub-items
+    are kept, so each is read at most once per proxy.
+    """
+
+    def __init__(self, henge, druid, item, recursive, reclimit) -> None:
+        """
+        :param Henge henge: The henge to fetch sub-items from.
+        :param str druid: The druid of the object.
+        :param dict item: The flat object, with druids for sub-items.
+        :param list[str] recursive: Attributes holding sub-item druids.
+        :param int reclimit: Recursion limit remaining at this object.
+        """
+        super(LazyMapping, self).__init__(henge, druid, reclimit)
+        self._item = dict(item)
+        self._druids = {
+            attr: item[attr] for attr in recursive if item.get(attr, "") != ""
+        }
+        for attr in self._druids:
+            self._item[attr] = _UNLOADED
+
+    def __getitem__(self, key):
+        value = self._item[key]
+        if value is _UNLOADED:
+            value = self._load([self._druids[key]])[0]
+            self._item[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self._item)
+
+    def __len__(self):
+        return len(self._item)
+
+    def __contains__(self, key):
+        return key in self._item
+
+    def to_plain(self) -> dict:
+        """
+        Convert to a plain dict, fetching all sub-items not yet fetched.
+
+        :return dict: The item, as retrieve would return it.
+        """
+        keys = list(self._item)
+        values = self._plain_children(
+            [(self._druids.get(key), self._item[key]) for key in keys]
+        )
+        return dict(zip(keys, values))
+
+    def __repr__(self):
+        return "LazyMapping ({}, {} loaded of {} sub-items)".format(
+            self.druid,
+            sum(self._item[attr] is not _UNLOADED for attr in self._druids),
+            len(self._druids),
+        )
+
+
+class LazySequence(_LazyNode, Sequence):
+    """
+    A retrieved array of sub-items, fetched on access.
+
+    Indexing fetches one element; slicing and iteration fetch the elements
+    they reach in batches of `batch_size`, with one multi-get per batch.
+    Fetched elements are kept, so each is read at most once per proxy.
+    """
+
+    batch_size = 100
+
+    def __init__(self, henge, druid, druids, reclimit) -> None:
+        """
+        :param Henge henge: The henge to fetch elements from.
+        :param str druid: The druid of the array.
+        :param list[str] druids: The druids of the elements.
+        :param int reclimit: Recursion limit remaining at this array.
+        """
+        super(LazySequence, self).__init__(henge, druid, reclimit)
+        self.druids = list(druids)
+        self._items = [_UNLOADED] * len(self.druids)
+
+    def _fetch(self, indices):
+        unloaded = [i for i in indices if self._items[i] is _UNLOADED]
+        if unloaded:
+            values = self._load([self.druids[i] for i in unloaded])
+            for i, value in zip(unloaded, values):
+                self._items[i] = value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            indices = range(*index.indices(len(self)))
+            for start in range(0, len(indices), self.batch_size):
+                self._fetch(indices[start : start + self.batch_size])
+            return [self._items[i] for i in indices]
+        value = self._items[index]
+        if value is _UNLOADED:
+            self._fetch([range(len(self))[index]])
+            value = self._items[index]
+        return value
+
+    def __iter__(self):
+        for start in range(0, len(self), self.batch_size):
+            yield from self[start : start + self.batch_size]
+
+    def __len__(self):
+        return len(self.druids)
+
+    def __eq__(self, other):
+        if isinstance(other, (LazySequence, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def to_plain(self) -> list:
+        """
+        Convert to a plain list, fetching all elements not yet fetched.
+
+        :return list: The array, as retrieve would return it.
+        """
+        return self._plain_children(list(zip(self.druids, self._items)))
+
+    def __repr__(self):
+        return "LazySequence ({}, {} loaded of {})".format(
+            self.druid,
+            sum(value is not _UNLOADED for value in self._items),
+            len(self),
+        )
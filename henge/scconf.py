@@ -1,18 +1,23 @@
 import logging
 import os
 import psycopg2
+import threading
 
 from collections.abc import Mapping
-from psycopg2 import OperationalError, sql
-from psycopg2.errors import UniqueViolation
+from contextlib import contextmanager
+from psycopg2 import InterfaceError, OperationalError, sql
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
 
 _LOGGER = logging.getLogger(__name__)
 
 # Use like:
-# pgdb = RDBDict(...)       # Open connection
+# pgdb = RDBDict(...)       # Open connection pool
 # pgdb["key"] = "value"     # Insert item
 # pgdb["key"]               # Retrieve item
-# pgdb.close()              # Close connection
+# pgdb.set_many({...})      # Upsert many items in a few statements
+# pgdb.clear()              # Truncate the table
+# pgdb.close()              # Close connections
 
 
 # This was originally written in seqcolapi.
@@ -41,6 +46,8 @@ import pipestat
 class PipestatMapping(pipestat.PipestatManager):
     """A wrapper class to allow using a PipestatManager as a dict-like object."""
 
+    fetch_size = 100  # Records per page when iterating
+
     def __getitem__(self, key):
         # This little hack makes this work with `in`;
         # e.g.: for x in rdbdict, which is now disabled, instead of infinite.
@@ -54,37 +61,32 @@ class PipestatMapping(pipestat.PipestatManager):
     def __len__(self):
         return self.count_records()
 
-    def _next_page(self):
-        self._buf["page_index"] += 1
-        limit = self._buf["page_size"]
-        offset = self._buf["page_index"] * limit
-        self._buf["keys"] = self.get_records(limit, offset)
-        return self._buf["keys"][0]
-
     def __iter__(self):
+        # Pages with pipestat's cursor, which continues after the last record
+        # seen instead of re-skipping every record before an offset. Backends
+        # without cursors (file, PEPhub) ignore it and return the first page
+        # again, with a next_page_token of 0; the rest of their records are
+        # then read in one selection.
         _LOGGER.debug("Iterating...")
-        self._buf = {  # buffered iterator
-            "current_view_index": 0,
-            "len": len(self),
-            "page_size": 100,
-            "page_index": -1,
-            "keys": self._next_page(),
-        }
-        return self
-
-    def __next__(self):
-        if self._buf["current_view_index"] > self._buf["len"]:
-            raise StopIteration
-
-        idx = (
-            self._buf["current_view_index"]
-            - self._buf["page_index"] * self._buf["page_size"]
-        )
-        if idx <= self._buf["page_size"]:
-            self._buf["current_view_index"] += 1
-            return self._buf["keys"][idx - 1]
-        else:  # current index is beyond current page, but not beyond total
-            return self._next_page()
+        columns = ["record_identifier"]
+        cursor = None
+        seen = 0
+        while True:
+            page = self.select_records(
+                columns=columns, limit=self.fetch_size, cursor=cursor
+            )
+            for record in page["records"]:
+                yield record["record_identifier"]
+            seen += len(page["records"])
+            if not page["records"] or seen >= page.get("total_size", seen):
+                return
+            next_cursor = page.get("next_page_token")
+            if not next_cursor or next_cursor == cursor:
+                rest = self.select_records(columns=columns, limit=None)["records"]
+                for record in rest[seen:]:
+                    yield record["record_identifier"]
+                return
+            cursor = next_cursor
 
 
 class RDBDict(Mapping):
@@ -94,6 +96,9 @@ class RDBDict(Mapping):
     Simple database connection manager object that allows us to use a
     PostgresQL database as a simple key-value store to back Python
     dict-style access to database items.
+
+    Connections come from a thread-safe pool, so one RDBDict can be shared
+    by the threads of a loader or a web server.
     """
 
     def __init__(
@@ -104,8 +109,24 @@ class RDBDict(Mapping):
         db_host: str = None,
         db_port: str = None,
         db_table: str = None,
+        min_connections: int = 1,
+        max_connections: int = 10,
+        page_size: int = 1000,
+        fetch_size: int = 1000,
     ):
-        self.connection = None
+        """
+        :param int min_connections: Connections to open up front.
+        :param int max_connections: Maximum simultaneous connections; one
+            per concurrently querying thread. Further threads wait for a
+            connection to be returned.
+        :param int page_size: Maximum rows per statement in bulk upserts.
+        :param int fetch_size: Rows per query when iterating over the table.
+        """
+        self.pool = None
+        # The pool raises PoolError when exhausted, so threads wait here
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self.page_size = page_size
+        self.fetch_size = fetch_size
         self.db_name = db_name or getenv("POSTGRES_DB")
         self.db_user = db_user or getenv("POSTGRES_USER")
         self.db_host = db_host or os.environ.get("POSTGRES_HOST") or "localhost"
@@ -114,16 +135,21 @@ class RDBDict(Mapping):
         db_password = db_password or getenv("POSTGRES_PASSWORD")
 
         try:
-            self.connection = self.create_connection(
-                self.db_name, self.db_user, db_password, self.db_host, self.db_port
+            self.pool = self.create_pool(
+                self.db_name,
+                self.db_user,
+                db_password,
+                self.db_host,
+                self.db_port,
+                min_connections,
+                max_connections,
             )
-            if not self.connection:
+            if not self.pool:
                 raise Exception("Connection failed")
         except Exception as e:
             _LOGGER.info(f"{self}")
             raise e
-        _LOGGER.info(self.connection)
-        self.connection.autocommit = True
+        _LOGGER.info(self.pool)
 
     def __repr__(self):
         return (
@@ -177,16 +203,71 @@ class RDBDict(Mapping):
         ).format(table=sql.Identifier(self.db_table))
         params = {"key": key}
         res = self.execute_read_query(stmt, params)
-        if not res:
+        if res is None:
             _LOGGER.info("Not found: {}".format(key))
+            raise KeyError(key)
         return res
 
+    def get_many(self, keys):
+        """
+        Read many keys with a single query.
+
+        :param list keys: Keys to read.
+        :return dict: Values of the keys that were found; missing keys are
+            left out.
+        """
+        stmt = sql.SQL(
+            """
+            SELECT key, value FROM {table} WHERE key = ANY(%(keys)s)
+        """
+        ).format(table=sql.Identifier(self.db_table))
+        res = self.execute_multi_query(stmt, {"keys": list(keys)})
+        return {key: value for key, value in res}
+
+    def contains_many(self, keys):
+        """
+        Find which of many keys are in the table, with a single query.
+
+        :param list keys: Keys to look for.
+        :return set: The keys that were found.
+        """
+        stmt = sql.SQL(
+            """
+            SELECT key FROM {table} WHERE key = ANY(%(keys)s)
+        """
+        ).format(table=sql.Identifier(self.db_table))
+        res = self.execute_multi_query(stmt, {"keys": list(keys)})
+        return {row[0] for row in res}
+
     def __setitem__(self, key, value):
-        try:
-            return self.insert(key, value)
-        except UniqueViolation as e:
-            _LOGGER.info("Updating existing value for {}".format(key))
-            return self.update(key, value)
+        stmt = sql.SQL(
+            """
+            INSERT INTO {table}(key, value)
+            VALUES (%(key)s, %(value)s)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+        """
+        ).format(table=sql.Identifier(self.db_table))
+        params = {"key": key, "value": value}
+        return self.execute_query(stmt, params)
+
+    def set_many(self, pairs):
+        """
+        Insert or update many items at once, in one transaction.
+
+        Rows are sent as multi-row VALUES lists of up to page_size rows, so
+        thousands of keys take a single round trip.
+
+        :param dict pairs: Keys and values to write.
+        """
+        stmt = sql.SQL(
+            """
+            INSERT INTO {table}(key, value) VALUES %s
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+        """
+        ).format(table=sql.Identifier(self.db_table))
+        rows = list(pairs.items())
+        with self._transaction() as cursor:
+            execute_values(cursor, stmt, rows, page_size=self.page_size)
 
     def __delitem__(self, key):
         stmt = sql.SQL(
@@ -198,10 +279,43 @@ class RDBDict(Mapping):
         res = self.execute_query(stmt, params)
         return res
 
-    def create_connection(self, db_name, db_user, db_password, db_host, db_port):
-        connection = None
+    def delete_many(self, keys):
+        """
+        Delete many keys with a single statement; missing keys are ignored.
+
+        :param list keys: Keys to delete.
+        """
+        stmt = sql.SQL(
+            """
+            DELETE FROM {table} WHERE key = ANY(%(keys)s)
+        """
+        ).format(table=sql.Identifier(self.db_table))
+        with self._transaction() as cursor:
+            cursor.execute(stmt, {"keys": list(keys)})
+
+    def clear(self):
+        """Delete all items, truncating the table instead of deleting rows"""
+        stmt = sql.SQL("TRUNCATE TABLE {table}").format(
+            table=sql.Identifier(self.db_table)
+        )
+        with self._transaction() as cursor:
+            cursor.execute(stmt)
+
+    def create_pool(
+        self,
+        db_name,
+        db_user,
+        db_password,
+        db_host,
+        db_port,
+        min_connections=1,
+        max_connections=10,
+    ):
+        pool = None
         try:
-            connection = psycopg2.connect(
+            pool = ThreadedConnectionPool(
+                min_connections,
+                max_connections,
                 database=db_name,
                 user=db_user,
                 password=db_password,
@@ -211,55 +325,95 @@ class RDBDict(Mapping):
             _LOGGER.info("Connection to PostgreSQL DB successful")
         except OperationalError as e:
             _LOGGER.info("Error: {e}".format(e=str(e)))
-        return connection
+        return pool
+
+    @contextmanager
+    def _connection(self):
+        """
+        Borrow a pooled connection, waiting while all of them are in use.
+
+        Connections that broke while borrowed are closed rather than
+        returned to the pool, which opens a new one when needed.
+        """
+        with self._slots:
+            connection = self.pool.getconn()
+            broken = False
+            try:
+                yield connection
+            except (OperationalError, InterfaceError):
+                broken = True
+                raise
+            finally:
+                broken = broken or bool(connection.closed)
+                self.pool.putconn(connection, close=broken)
+
+    @contextmanager
+    def _cursor(self):
+        """Borrow a pooled connection, in autocommit mode, for one query"""
+        with self._connection() as connection:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                yield cursor
+
+    @contextmanager
+    def _transaction(self):
+        """Borrow a pooled connection for a transaction, committed on exit"""
+        with self._connection() as connection:
+            connection.autocommit = False
+            try:
+                with connection:  # Commits, or rolls back on an exception
+                    with connection.cursor() as cursor:
+                        yield cursor
+            finally:
+                if not connection.closed:
+                    connection.autocommit = True
 
     def execute_read_query(self, query, params=None):
-        cursor = self.connection.cursor()
-        result = None
-        try:
-            cursor.execute(query, params)
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            else:
-                _LOGGER.debug(f"Query: {query}")
-                _LOGGER.debug(f"Result: {result}")
-                return None
-        except OperationalError as e:
-            _LOGGER.info("Error: {e}".format(e=str(e)))
-            raise
-        except TypeError as e:
-            _LOGGER.info("TypeError: {e}, item: {q}".format(e=str(e), q=query))
-            raise
+        with self._cursor() as cursor:
+            result = None
+            try:
+                cursor.execute(query, params)
+                result = cursor.fetchone()
+                if result:
+                    return result[0]
+                else:
+                    _LOGGER.debug(f"Query: {query}")
+                    _LOGGER.debug(f"Result: {result}")
+                    return None
+            except OperationalError as e:
+                _LOGGER.info("Error: {e}".format(e=str(e)))
+                raise
+            except TypeError as e:
+                _LOGGER.info("TypeError: {e}, item: {q}".format(e=str(e), q=query))
+                raise
 
     def execute_multi_query(self, query, params=None):
-        cursor = self.connection.cursor()
-        result = None
-        try:
-            cursor.execute(query, params)
-            result = cursor.fetchall()
-            return result
-        except OperationalError as e:
-            _LOGGER.info("Error: {e}".format(e=str(e)))
-            raise
-        except TypeError as e:
-            _LOGGER.info("TypeError: {e}, item: {q}".format(e=str(e), q=query))
-            raise
+        with self._cursor() as cursor:
+            result = None
+            try:
+                cursor.execute(query, params)
+                result = cursor.fetchall()
+                return result
+            except OperationalError as e:
+                _LOGGER.info("Error: {e}".format(e=str(e)))
+                raise
+            except TypeError as e:
+                _LOGGER.info("TypeError: {e}, item: {q}".format(e=str(e), q=query))
+                raise
 
     def execute_query(self, query, params=None):
-        cursor = self.connection.cursor()
-        try:
-            return cursor.execute(query, params)
-            _LOGGER.info("Query executed successfully")
-        except OperationalError as e:
-            _LOGGER.info("Error: {e}".format(e=str(e)))
+        with self._cursor() as cursor:
+            try:
+                return cursor.execute(query, params)
+            except OperationalError as e:
+                _LOGGER.info("Error: {e}".format(e=str(e)))
 
     def close(self):
-        _LOGGER.info("Closing connection")
-        return self.connection.close()
+        _LOGGER.info("Closing connections")
+        return self.pool.closeall()
 
     def __del__(self):
-        if self.connection:
+        if self.pool and not self.pool.closed:
             self.close()
 
     def __len__(self):
@@ -286,55 +440,43 @@ class RDBDict(Mapping):
         res = self.execute_multi_query(stmt, params if params else None)
         return res
 
-    def _next_page(self):
-        self._buf["page_index"] += 1
-        limit = self._buf["page_size"]
-        offset = self._buf["page_index"] * limit
-        self._buf["keys"] = self.get_paged_keys(limit, offset)
-        return self._buf["keys"][0]
+    def _scan(self, columns):
+        """
+        Stream rows of the whole table, in key order.
+
+        Pages with keyset pagination: each query continues after the last
+        key seen, using the primary key index, so every page costs the same
+        however far into the table it is.
+
+        :param list[str] columns: Columns to select; the first must be key.
+        """
+        select = sql.SQL("SELECT {columns} FROM {table}").format(
+            columns=sql.SQL(", ").join(sql.Identifier(c) for c in columns),
+            table=sql.Identifier(self.db_table),
+        )
+        first_page = sql.SQL("{} ORDER BY key LIMIT %(limit)s").format(select)
+        next_page = sql.SQL(
+            "{} WHERE key > %(last)s ORDER BY key LIMIT %(limit)s"
+        ).format(select)
+        rows = self.execute_multi_query(first_page, {"limit": self.fetch_size})
+        while rows:
+            yield from rows
+            if len(rows) < self.fetch_size:
+                return
+            params = {"last": rows[-1][0], "limit": self.fetch_size}
+            rows = self.execute_multi_query(next_page, params)
 
     def __iter__(self):
         _LOGGER.debug("Iterating...")
-        self._buf = {  # buffered iterator
-            "current_view_index": 0,
-            "len": len(self),
-            "page_size": 10,
-            "page_index": 0,
-            "keys": self.get_paged_keys(10, 0),
-        }
-        return self
-
-    def __next__(self):
-        if self._buf["current_view_index"] > self._buf["len"]:
-            raise StopIteration
-
-        idx = (
-            self._buf["current_view_index"]
-            - self._buf["page_index"] * self._buf["page_size"]
-        )
-        if idx <= self._buf["page_size"]:
-            self._buf["current_view_index"] += 1
-            return self._buf["keys"][idx - 1]
-        else:  # current index is beyond current page, but not beyond total
-            return self._next_page()
-
-    # Old, non-paged iterator:
-    # def __iter__(self):
-    #     self._current_idx = 0
-    #     return self
-
-    # def __next__(self):
-    #     stmt = sql.SQL(
-    #         """
-    #         SELECT key,value FROM {table} LIMIT 1 OFFSET %(idx)s
-    #     """
-    #     ).format(table=sql.Identifier(self.db_table))
-    #     res = self.execute_read_query(stmt, {"idx": self._current_idx})
-    #     self._current_idx += 1
-    #     if not res:
-    #         _LOGGER.info("Not found: {}".format(self._current_idx))
-    #         raise StopIteration
-    #     return res
+        return (row[0] for row in self._scan(["key"]))
+
+    def items(self):
+        """Stream (key, value) pairs of the whole table, in key order"""
+        return (tuple(row) for row in self._scan(["key", "value"]))
+
+    def values(self):
+        """Stream values of the whole table, in key order"""
+        return (row[1] for row in self._scan(["key", "value"]))
 
 
 # We don't need the full SeqColHenge,
@@ -0,0 +1,107 @@
+"""An on-disk cache of parsed and split schemas, for faster Henge startup"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from ._version import __version__
+
+_LOGGER = logging.getLogger(__name__)
+
+# Use like:
+# h = Henge(db, schemas, schema_cache="~/.cache/henge")  # or set HENGE_SCHEMA_CACHE
+
+
+class SchemaCache(object):
+    """
+    Split schemas stored as JSON files, keyed by a hash of their source.
+
+    Entries are named by the SHA-256 of the henge version and the source
+    document, so an edited schema, or a henge version that splits schemas
+    differently, is a miss rather than a stale hit. Schemas read from URLs
+    also keep the ETag of the response, so they're revalidated with a
+    conditional request instead of downloaded again. The cache only ever
+    saves work: entries that can't be read or written are skipped.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param str path: Directory holding the cache, created if needed.
+        """
+        self.path = os.path.expanduser(path)
+
+    def __repr__(self):
+        return "SchemaCache ({})".format(self.path)
+
+    @staticmethod
+    def key(data: bytes) -> str:
+        """
+        Cache key of a source document.
+
+        :param bytes data: The document, as read from its file or URL.
+        :return str: The key.
+        """
+        return hashlib.sha256(__version__.encode() + b"\0" + data).hexdigest()
+
+    def _file(self, name):
+        return os.path.join(self.path, name + ".json")
+
+    def get(self, key: str):
+        """
+        Read an entry.
+
+        :param str key: The key, from SchemaCache.key.
+        :return: The cached value, or None on a miss.
+        """
+        try:
+            with open(self._file(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, value) -> None:
+        """
+        Write an entry, atomically: readers see the old entry or the new one.
+
+        :param str key: The key, from SchemaCache.key.
+        :param value: JSON-serializable value to store.
+        """
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(value, f)
+                os.replace(tmp_path, self._file(key))
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except (OSError, TypeError, ValueError) as e:
+            _LOGGER.debug("Not caching schema {}: {}".format(key, e))
+
+    def _url_name(self, url):
+        return "url-" + hashlib.sha256(url.encode()).hexdigest()
+
+    def get_etag(self, url: str) -> tuple:
+        """
+        Look up the ETag of the last response for a URL.
+
+        :param str url: The schema URL.
+        :return tuple: (etag, key) of the cached response, or (None, None).
+        """
+        entry = self.get(self._url_name(url))
+        if not isinstance(entry, dict):
+            return None, None
+        return entry.get("etag"), entry.get("key")
+
+    def put_etag(self, url: str, etag: str, key: str) -> None:
+        """
+        Remember the ETag of a response for a URL, and the key of its entry.
+
+        :param str url: The schema URL.
+        :param str etag: The ETag header of the response.
+        :param str key: The key the response body is cached under.
+        """
+        self.put(self._url_name(url), {"url": url, "etag": etag, "key": key})
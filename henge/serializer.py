@@ -0,0 +1,166 @@
+"""Canonical JSON serializers, with an optional faster engine"""
+
+import json
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+# Use like:
+# h = Henge(db, schemas, serializer="json")  # or "orjson", or "auto" (default)
+
+_INT64 = (-(2**63), 2**63 - 1)
+
+
+class Serializer(object):
+    """
+    Canonical JSON with the standard library json module.
+
+    The canonical string of an item is what its druid digests, so every
+    serializer must produce exactly the strings of canonical_str: sorted
+    keys, compact separators, non-ASCII characters unescaped, and no NaN or
+    infinities. Subclasses may use other engines for the items they can
+    encode identically, and fall back to these methods for the rest.
+    """
+
+    name = "json"
+
+    def dumps(self, item) -> str:
+        """
+        Encode an item as its canonical string.
+
+        :param item: A JSON-serializable item.
+        :return str: The canonical string.
+        """
+        return json.dumps(
+            item,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            allow_nan=False,
+            sort_keys=True,
+        )
+
+    def loads(self, string: str):
+        """
+        Decode a stored string.
+
+        :param str string: JSON text.
+        :return: The decoded item.
+        """
+        return json.loads(string)
+
+    def __repr__(self):
+        return "{} ({})".format(self.__class__.__name__, self.name)
+
+
+def _is_plain(item):
+    """
+    Check that an item only holds dicts with string keys, lists, strings,
+    64-bit integers, booleans and None, of exactly those types.
+
+    Floats are left out because engines format them differently, and
+    subclasses and other types because engines serialize some (UUIDs, enums)
+    that the json module refuses.
+    """
+    kind = type(item)
+    if kind is str or item is None or kind is bool:
+        return True
+    if kind is int:
+        return _INT64[0] <= item <= _INT64[1]
+    if kind is list:
+        for value in item:
+            # Strings first: arrays of druids are the common wide case
+            if type(value) is not str and not _is_plain(value):
+                return False
+        return True
+    if kind is dict:
+        for key, value in item.items():
+            if type(key) is not str:
+                return False
+            if type(value) is not str and not _is_plain(value):
+                return False
+        return True
+    return False
+
+
+def _has_float(item):
+    """Check whether a decoded item holds any float"""
+    kind = type(item)
+    if kind is not list and kind is not dict:
+        return kind is float
+    values = item.values() if kind is dict else item
+    kinds = set(map(type, values))  # Loops in C, for wide arrays
+    if float in kinds:
+        return True
+    if list in kinds or dict in kinds:
+        return any(_has_float(value) for value in values)
+    return False
+
+
+class OrjsonSerializer(Serializer):
+    """
+    Canonical JSON with orjson, for the items it encodes exactly like json.
+
+    orjson sorts keys by code point and leaves non-ASCII characters
+    unescaped, like canonical_str, but formats floats differently and
+    accepts types the json module rejects; items with those go through
+    json. Strings orjson can't decode, such as ones with lone surrogate
+    escapes or out of range numbers, also go through json. orjson decodes
+    integers beyond 64 bits as floats, so strings that decode to items
+    holding floats are decoded again with json.
+    """
+
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._orjson = orjson
+
+    def dumps(self, item) -> str:
+        if _is_plain(item):
+            try:
+                return self._orjson.dumps(
+                    item, option=self._orjson.OPT_SORT_KEYS
+                ).decode()
+            except TypeError:  # Lone surrogates aren't valid UTF-8
+                pass
+        return super(OrjsonSerializer, self).dumps(item)
+
+    def loads(self, string: str):
+        try:
+            item = self._orjson.loads(string)
+        except self._orjson.JSONDecodeError:
+            return json.loads(string)
+        return json.loads(string) if _has_float(item) else item
+
+
+SERIALIZERS = {"json": Serializer, "orjson": OrjsonSerializer}
+
+
+def get_serializer(serializer=None) -> Serializer:
+    """
+    Choose a serializer.
+
+    :param serializer: A Serializer, the name of one in SERIALIZERS, or
+        "auto" or None for the fastest one installed.
+    :return Serializer: The serializer.
+    :raise ValueError: If the name is unknown.
+    :raise ImportError: If the engine of the named serializer isn't
+        installed.
+    """
+    if isinstance(serializer, Serializer):
+        return serializer
+    if serializer in [None, "auto"]:
+        try:
+            return OrjsonSerializer()
+        except ImportError:
+            _LOGGER.debug("orjson is not installed; serializing with json")
+            return Serializer()
+    try:
+        return SERIALIZERS[serializer]()
+    except KeyError:
+        raise ValueError(
+            "Unknown serializer: {}. Choose from: {}".format(
+                serializer, list(SERIALIZERS)
+            )
+        )
@@ -0,0 +1,195 @@
+"""Immutable, memory-mapped snapshots of a henge database for serving"""
+
+import logging
+import mmap
+import os
+import struct
+
+from collections.abc import Mapping
+
+_LOGGER = logging.getLogger(__name__)
+
+# Use like:
+# write_snapshot(db, "henge.snap")   # Export any Mapping backend
+# snap = SnapshotDict("henge.snap")  # Map the file; nothing is loaded
+# h = Henge(snap, schemas)           # Serve retrievals from the snapshot
+
+# File layout, all integers little-endian:
+#   header: magic, format version, entry count, index offset
+#   data:   key bytes immediately followed by value bytes, for each entry
+#   index:  (data offset, key length, value length) per entry, sorted by key
+MAGIC = b"HENGESNP"
+VERSION = 1
+_HEADER = struct.Struct("<8sIQQ")
+_ENTRY = struct.Struct("<QII")
+
+
+def write_snapshot(database, path: str) -> int:
+    """
+    Export a database to an immutable snapshot file.
+
+    Items are streamed from the database into the data region, so only the
+    keys are kept in memory, to sort the index. The file is written next to
+    its destination and moved into place when complete, so readers never
+    see a partial snapshot.
+
+    :param Mapping database: The database to export; keys and values must
+        be strings.
+    :param str path: Path of the snapshot file to write.
+    :return int: The number of entries written.
+    """
+    tmp_path = "{}.tmp{}".format(path, os.getpid())
+    entries = []  # (key bytes, data offset, value length)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            offset = _HEADER.size
+            for key, value in database.items():
+                if not isinstance(key, str) or not isinstance(value, str):
+                    raise TypeError(
+                        "Snapshot keys and values must be strings: {!r}".format(key)
+                    )
+                key_bytes = key.encode("utf-8")
+                value_bytes = value.encode("utf-8")
+                f.write(key_bytes)
+                f.write(value_bytes)
+                entries.append((key_bytes, offset, len(value_bytes)))
+                offset += len(key_bytes) + len(value_bytes)
+            entries.sort()
+            for key_bytes, entry_offset, value_length in entries:
+                f.write(_ENTRY.pack(entry_offset, len(key_bytes), value_length))
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, len(entries), offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _LOGGER.info("Wrote snapshot of {} entries to {}".format(len(entries), path))
+    return len(entries)
+
+
+class SnapshotDict(Mapping):
+    """
+    A read-only Mapping backend over a memory-mapped snapshot file.
+
+    Opening a snapshot reads only its header. Each lookup is a binary
+    search over the sorted index, reading a few index entries and keys from
+    the mapped file, so the OS only pages in what lookups touch. Processes
+    that map the same file, including forked workers, share its pages
+    through the page cache.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        :param str path: Path to a file written by write_snapshot.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self._count, self._index = _HEADER.unpack_from(self._mm)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise ValueError(
+                "Not a henge snapshot (version {}): {}".format(VERSION, path)
+            )
+
+    def __repr__(self):
+        return "SnapshotDict ({}, {} entries)".format(self.path, self._count)
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._mm, self._index + i * _ENTRY.size)
+
+    def _key(self, i):
+        offset, key_length, _ = self._entry(i)
+        return self._mm[offset : offset + key_length]
+
+    def _find(self, key):
+        """Find the index entry of a key, or None if it's missing"""
+        if not isinstance(key, str):
+            return None
+        key_bytes = key.encode("utf-8")
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key_bytes:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count:
+            entry = self._entry(low)
+            offset, key_length, _ = entry
+            if self._mm[offset : offset + key_length] == key_bytes:
+                return entry
+        return None
+
+    def _value(self, entry):
+        offset, key_length, value_length = entry
+        start = offset + key_length
+        return self._mm[start : start + value_length].decode("utf-8")
+
+    def __getitem__(self, key):
+        entry = self._find(key)
+        if entry is None:
+            raise KeyError(key)
+        return self._value(entry)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def get_many(self, keys):
+        """
+        Read many keys.
+
+        :param list keys: Keys to read.
+        :return dict: Values of the keys that were found; missing keys are
+            left out.
+        """
+        found = {}
+        for key in keys:
+            entry = self._find(key)
+            if entry is not None:
+                found[key] = self._value(entry)
+        return found
+
+    def contains_many(self, keys):
+        """
+        Find which of many keys are in the snapshot.
+
+        :param list keys: Keys to look for.
+        :return set: The keys that were found.
+        """
+        return {key for key in keys if self._find(key) is not None}
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._key(i).decode("utf-8")
+
+    def items(self):
+        """Stream (key, value) pairs of the snapshot, in key order"""
+        for i in range(self._count):
+            entry = self._entry(i)
+            offset, key_length, _ = entry
+            key = self._mm[offset : offset + key_length].decode("utf-8")
+            yield key, self._value(entry)
+
+    def values(self):
+        """Stream values of the snapshot, in key order"""
+        return (value for _, value in self.items())
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
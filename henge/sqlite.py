@@ -0,0 +1,252 @@
+"""A SQLite backend for henge, tuned for bulk loads"""
+
+import logging
+import sqlite3
+import threading
+
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+_LOGGER = logging.getLogger(__name__)
+
+# Use like:
+# db = SQLiteDict("henge.db")   # Open or create the database file
+# db["key"] = "value"           # Insert item
+# db["key"]                     # Retrieve item
+# db.set_many({...})            # Upsert many items in one transaction
+# with db.transaction(): ...    # Group writes into one transaction
+# db.close()
+
+# Host parameters per statement; SQLite builds before 3.32 allow only 999
+MAX_VARIABLES = 999
+
+
+class SQLiteDict(MutableMapping):
+    """
+    A SQLite table as a key-value store, tuned for bulk loads.
+
+    The database runs in WAL mode, so readers in other processes aren't
+    blocked by a load. Statements are fixed strings with placeholders, so
+    the sqlite3 module prepares each one once and reuses it from its
+    statement cache. Bulk writes are executemany upserts in a single
+    transaction; multi-key reads are chunked under SQLite's host parameter
+    limit. Iteration streams rows in rowid order, which is insertion order.
+
+    One connection is shared by all threads, behind a lock; SQLite allows
+    a single writer at a time anyway.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        table: str = "henge",
+        batch_size: int = 10000,
+        fetch_size: int = 1000,
+        timeout: float = 30.0,
+        synchronous: str = "NORMAL",
+    ) -> None:
+        """
+        :param str path: Path to the database file, created if needed.
+            Default: an in-memory database.
+        :param str table: Name of the table holding the items.
+        :param int batch_size: Maximum rows per executemany call in bulk
+            writes.
+        :param int fetch_size: Rows per query when iterating over the table.
+        :param float timeout: Seconds to wait for a lock held by another
+            process.
+        :param str synchronous: SQLite synchronous setting. NORMAL is safe in
+            WAL mode, and only risks the last transactions on power loss.
+        """
+        if not table.isidentifier():
+            raise ValueError("Invalid table name: {}".format(table))
+        self.path = path
+        self.table = table
+        self.batch_size = batch_size
+        self.fetch_size = fetch_size
+        self._lock = threading.RLock()
+        self._depth = 0  # Nesting depth of open transactions
+        # Transactions are managed explicitly; see SQLiteDict.transaction
+        self.connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous={}".format(synchronous))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS {}(key TEXT PRIMARY KEY, value TEXT)".format(
+                table
+            )
+        )
+        self._select = "SELECT value FROM {} WHERE key = ?".format(table)
+        self._upsert = (
+            "INSERT INTO {}(key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value".format(table)
+        )
+        self._delete = "DELETE FROM {} WHERE key = ?".format(table)
+        self._scan = "SELECT rowid, key, value FROM {} WHERE rowid > ? ORDER BY rowid LIMIT ?".format(
+            table
+        )
+
+    def __repr__(self):
+        return "SQLiteDict ({}, table {})".format(self.path, self.table)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group writes into one transaction, committed on exit.
+
+        Writes outside a transaction are committed one statement at a time,
+        so wrap many single-key writes in a transaction when loading. Nested
+        transactions join the outermost one. On an exception, all writes of
+        the transaction are rolled back.
+        """
+        with self._lock:
+            if self._depth == 0:
+                self.connection.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.connection.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.execute("COMMIT")
+
+    def __getitem__(self, key):
+        with self._lock:
+            row = self.connection.execute(self._select, (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self.connection.execute(self._upsert, (key, value))
+
+    def __delitem__(self, key):
+        with self._lock:
+            cursor = self.connection.execute(self._delete, (key,))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self.connection.execute(self._select, (key,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM {}".format(self.table)
+            ).fetchone()[0]
+
+    def _select_many(self, columns, keys):
+        """Select rows for many keys, in chunks under the parameter limit"""
+        keys = list(dict.fromkeys(keys))
+        rows = []
+        with self._lock:
+            for start in range(0, len(keys), MAX_VARIABLES):
+                chunk = keys[start : start + MAX_VARIABLES]
+                stmt = "SELECT {} FROM {} WHERE key IN ({})".format(
+                    columns, self.table, ",".join("?" * len(chunk))
+                )
+                rows.extend(self.connection.execute(stmt, chunk))
+        return rows
+
+    def get_many(self, keys):
+        """
+        Read many keys with one query per chunk of keys.
+
+        :param list keys: Keys to read.
+        :return dict: Values of the keys that were found; missing keys are
+            left out.
+        """
+        return dict(self._select_many("key, value", keys))
+
+    def contains_many(self, keys):
+        """
+        Find which of many keys are in the table.
+
+        :param list keys: Keys to look for.
+        :return set: The keys that were found.
+        """
+        return {row[0] for row in self._select_many("key", keys)}
+
+    def set_many(self, pairs):
+        """
+        Insert or update many items at once, in one transaction.
+
+        :param dict pairs: Keys and values to write.
+        """
+        rows = list(pairs.items())
+        with self.transaction():
+            for start in range(0, len(rows), self.batch_size):
+                self.connection.executemany(
+                    self._upsert, rows[start : start + self.batch_size]
+                )
+
+    def delete_many(self, keys):
+        """
+        Delete many keys at once, in one transaction; missing keys are
+        ignored.
+
+        :param list keys: Keys to delete.
+        """
+        rows = [(key,) for key in keys]
+        with self.transaction():
+            for start in range(0, len(rows), self.batch_size):
+                self.connection.executemany(
+                    self._delete, rows[start : start + self.batch_size]
+                )
+
+    def clear(self):
+        """Delete all items, with a single unconditional DELETE"""
+        with self._lock:
+            self.connection.execute("DELETE FROM {}".format(self.table))
+
+    def update(self, other=(), **kwargs):
+        pairs = dict(other, **kwargs)
+        self.set_many(pairs)
+
+    def _rows(self):
+        """
+        Stream (key, value) rows of the whole table, in rowid order.
+
+        Pages with keyset pagination on the rowid, so each page is an index
+        range scan, and the lock is only held while a page is read.
+        """
+        last = 0
+        while True:
+            with self._lock:
+                rows = self.connection.execute(
+                    self._scan, (last, self.fetch_size)
+                ).fetchall()
+            for _, key, value in rows:
+                yield key, value
+            if len(rows) < self.fetch_size:
+                return
+            last = rows[-1][0]
+
+    def __iter__(self):
+        return (key for key, _ in self._rows())
+
+    def items(self):
+        """Stream (key, value) pairs of the whole table, in rowid order"""
+        return self._rows()
+
+    def values(self):
+        """Stream values of the whole table, in rowid order"""
+        return (value for _, value in self._rows())
+
+    def close(self):
+        _LOGGER.debug("Closing {}".format(self))
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
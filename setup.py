@@ -17,6 +17,7 @@ with open("requirements/requirements-all.txt", "r") as reqs_file:
         DEPENDENCIES.append(line)
 
 extra["install_requires"] = DEPENDENCIES
+extra["entry_points"] = {"console_scripts": ["henge = henge.cli:main"]}
 
 with open("{}/_version.py".format(PACKAGE), "r") as versionfile:
     version = versionfile.readline().split()[-1].strip("\"'\n")
@@ -0,0 +1,202 @@
+import asyncio
+import json
+
+import pytest
+
+from henge import AsyncDict, AsyncHenge, AsyncMappingAdapter, Henge, NotFoundException
+
+from .test_henge import CountingDict, TestRetrieveMany
+
+FAMS = TestRetrieveMany.fams
+
+
+class KeyValueStore(object):
+    """An async backend with only get and set, tracking concurrent calls"""
+
+    def __init__(self):
+        self.data = {}
+        self.active = 0
+        self.max_active = 0
+
+    async def _call(self):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.001)
+        self.active -= 1
+
+    async def get(self, key):
+        await self._call()
+        return self.data.get(key)
+
+    async def set(self, key, value):
+        await self._call()
+        self.data[key] = value
+
+
+class TestAsyncHenge:
+    @pytest.mark.parametrize("packed_records", [True, False])
+    def test_matches_sync_henge(self, packed_records):
+        sync = Henge({}, ["tests/data/family.yaml"], packed_records=packed_records)
+        h = AsyncHenge(
+            AsyncDict(), ["tests/data/family.yaml"], packed_records=packed_records
+        )
+
+        async def run():
+            druids = await h.insert_many(FAMS, "family")
+            assert druids == sync.insert_many(FAMS, "family")
+            assert await h.retrieve_many(druids) == FAMS
+            assert await h.retrieve(druids[1]) == FAMS[1]
+            shallow = await h.retrieve(druids[1], reclimit=1)
+            assert shallow == sync.retrieve(druids[1], reclimit=1)
+
+        asyncio.run(run())
+        assert h.database.data == sync.database
+
+    def test_siblings_are_fetched_concurrently(self):
+        store = KeyValueStore()
+        h = AsyncHenge(store, ["tests/data/family.yaml"], concurrency=3)
+
+        async def run():
+            druid = await h.insert(FAMS[0], "family")
+            store.max_active = 0
+            assert await h.retrieve(druid) == FAMS[0]
+
+        asyncio.run(run())
+        assert store.max_active == 3
+
+    def test_missing_druid_raises(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/person.yaml"])
+        with pytest.raises(NotFoundException):
+            asyncio.run(h.retrieve("not_a_druid"))
+
+    def test_unknown_item_type(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/person.yaml"])
+        assert asyncio.run(h.insert({"name": "Pat"}, "nope")) is False
+
+    def test_mapping_adapter(self):
+        db = CountingDict()
+        h = AsyncHenge(AsyncMappingAdapter(db), ["tests/data/family.yaml"])
+
+        async def run():
+            druid = await h.insert(FAMS[0], "family")
+            db.get_many_calls = 0
+            return await h.retrieve(druid)
+
+        assert asyncio.run(run()) == FAMS[0]
+        assert db.get_many_calls == 3
+
+    def test_list(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/family.yaml"])
+
+        async def run():
+            druids = await asyncio.gather(
+                *[h.insert({"name": str(i)}, "person") for i in range(20)]
+            )
+            listed = await h.list(item_type="person", limit=15)
+            listed = (
+                listed["items"]
+                + (await h.list(item_type="person", cursor=listed["cursor"]))["items"]
+            )
+            assert sorted(listed) == sorted(druids)
+            assert (await h.stats())["items"] == 20
+
+        asyncio.run(run())
+
+    def test_delete_and_gc(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/family.yaml"])
+
+        async def run():
+            keep, gone = await h.insert_many(FAMS[::-1], "family")
+            assert await h.delete([gone], cascade=True) == 6
+            assert await h.retrieve(keep) == FAMS[1]
+            await h.insert({"name": "Kim", "age": 7}, "person")
+            assert await h.gc([keep]) == 1
+            assert (await h.stats())["items"] == 4
+
+        asyncio.run(run())
+
+    def test_iter_retrieve(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/family.yaml"])
+        people = [{"name": "Kid{}".format(i), "age": i} for i in range(25)]
+
+        async def run():
+            druid = await h.insert({"parents": people}, "family")
+            array = (await h.retrieve(druid, reclimit=0))["parents"]
+            iterator = h.iter_retrieve(array, chunk_size=4, prefetch=2)
+            assert [person async for person in iterator] == people
+            chunks = h.iter_retrieve(array, chunk_size=10, start=5, chunks=True)
+            assert [chunk async for chunk in chunks] == [people[5:15], people[15:]]
+
+        asyncio.run(run())
+
+    def test_concurrent_inserts_of_the_same_items(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/person.yaml"])
+        people = [{"name": "P{}".format(i)} for i in range(50)]
+
+        async def run():
+            await asyncio.gather(*[h.insert_many(people, "person") for _ in range(4)])
+            return await h.stats(), await h.list()
+
+        stats, listed = asyncio.run(run())
+        assert stats["items"] == len(listed["items"]) == 50
+
+    def test_changed_external_attributes_are_rewritten(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/inherent.yaml"])
+
+        async def run():
+            druid = await h.insert({"string_attr": "x", "integer_attr": 1}, "test_item")
+            await h.insert({"string_attr": "x", "integer_attr": 2}, "test_item")
+            return await h.retrieve(druid), await h.stats()
+
+        item, stats = asyncio.run(run())
+        assert item == {"string_attr": "x", "integer_attr": 2}
+        assert stats["items"] == 1
+
+    def test_len_needs_await(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/person.yaml"])
+        with pytest.raises(TypeError, match="await"):
+            len(h)
+        assert asyncio.run(h.stats())["items"] == 0
+
+    def test_sync_reads_fail_loudly(self):
+        h = AsyncHenge(AsyncDict(), ["tests/data/family.yaml"])
+        person = {"name": "Pat", "age": 38}
+
+        async def run():
+            druid = await h.insert(person, "person")
+            with pytest.raises(NotImplementedError, match="lazily"):
+                await h.retrieve(druid, lazy=True)
+            with pytest.raises(NotImplementedError, match="lazily"):
+                await h.retrieve(druid, None, False, True)  # As Henge.retrieve
+            assert await h.retrieve(druid, None, False) == person
+            assert json.loads(await h.lookup(druid, "person")) == person
+            return druid
+
+        druid = asyncio.run(run())
+        for method in [h.reindex, h.show, lambda: h._lazy_many([druid], None)]:
+            with pytest.raises(NotImplementedError):
+                method()
+
+    def test_remote_henge_timeout(self):
+        from henge import Delegate, RemoteHengeError
+
+        from .test_henge import SlowDict
+
+        SlowDict.active = [0, 0]
+        remote = Henge(SlowDict(), ["tests/data/person.yaml"])
+        remote.database.delay = 0
+        h = AsyncHenge(
+            AsyncDict(),
+            ["tests/data/string.yaml"],
+            henges={"person": Delegate(remote, timeout=0.01)},
+            remote_cache_size=0,
+        )
+
+        async def run():
+            druid = await h.insert({"name": "Pat"}, "person")
+            assert await h.retrieve(druid) == {"name": "Pat"}
+            remote.database.delay = 0.1
+            with pytest.raises(RemoteHengeError):
+                await h.retrieve(druid)
+
+        asyncio.run(run())
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+
+import pytest
+
+from henge import Henge
+from henge.snapshot import SnapshotDict, write_snapshot
+from henge.sqlite import MAX_VARIABLES, SQLiteDict
+
+from .test_henge import TestRetrieveMany
+
+FAMS = TestRetrieveMany.fams
+
+
+@pytest.fixture
+def db(tmp_path):
+    with SQLiteDict(str(tmp_path / "henge.db"), fetch_size=3) as db:
+        yield db
+
+
+class TestSQLiteDict:
+    def test_mapping(self, db):
+        db["a"] = "1"
+        db["a"] = "2"
+        assert db["a"] == "2" and "a" in db and len(db) == 1
+        del db["a"]
+        assert "a" not in db
+        with pytest.raises(KeyError):
+            db["a"]
+        with pytest.raises(KeyError):
+            del db["a"]
+
+    def test_wal_mode(self, db):
+        mode = db.connection.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+    def test_bulk_methods_chunk_keys(self, db):
+        pairs = {"k{}".format(i): str(i) for i in range(MAX_VARIABLES * 2 + 5)}
+        db.set_many(pairs)
+        keys = list(pairs) + ["missing"]
+        assert db.get_many(keys) == pairs
+        assert db.contains_many(keys) == set(pairs)
+
+    def test_iterates_in_insertion_order(self, db):
+        keys = ["k{}".format(i) for i in range(10)][::-1]
+        db.update((k, k.upper()) for k in keys)
+        db[keys[0]] = "updated"  # Upserts keep their row
+        assert list(db) == keys
+        assert dict(db.items())[keys[0]] == "updated"
+        assert list(db.values())[1:] == [k.upper() for k in keys[1:]]
+
+    def test_transaction_rolls_back(self, db):
+        db["kept"] = "1"
+        with pytest.raises(ValueError):
+            with db.transaction():
+                db["a"] = "1"
+                with db.transaction():
+                    db.set_many({"b": "2"})
+                raise ValueError
+        assert list(db) == ["kept"]
+
+    def test_persists_and_shares_file(self, tmp_path):
+        path = str(tmp_path / "henge.db")
+        with SQLiteDict(path) as db:
+            h = Henge(db, ["tests/data/family.yaml"])
+            druids = h.insert_many(FAMS, "family")
+            reader = sqlite3.connect(path)
+            count = reader.execute("SELECT COUNT(*) FROM henge").fetchone()[0]
+            assert count == len(db)
+        with SQLiteDict(path) as db:
+            h = Henge(db, ["tests/data/family.yaml"])
+            assert h.retrieve_many(druids) == FAMS
+
+    def test_bulk_deletes(self, db):
+        db.set_many({"a": "1", "b": "2", "c": "3"})
+        db.delete_many(["a", "c", "missing"])
+        assert list(db) == ["b"]
+        db.clear()
+        assert len(db) == 0
+
+    def test_rejects_bad_table_name(self):
+        with pytest.raises(ValueError):
+            SQLiteDict(table="henge; DROP TABLE henge")
+
+
+class TestSnapshot:
+    @pytest.fixture
+    def henge_db(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        return h.database, h.insert_many(FAMS, "family")
+
+    def test_round_trip(self, henge_db, tmp_path):
+        database, _ = henge_db
+        database["\u00e9t\u00e9"] = "caf\u00e9"
+        path = str(tmp_path / "henge.snap")
+        assert write_snapshot(database, path) == len(database)
+        with SnapshotDict(path) as snap:
+            assert dict(snap.items()) == database
+            assert list(snap) == sorted(database, key=lambda k: k.encode())
+            assert snap.get_many(["\u00e9t\u00e9", "missing"]) == {
+                "\u00e9t\u00e9": "caf\u00e9"
+            }
+            assert "missing" not in snap and 1 not in snap
+            with pytest.raises(KeyError):
+                snap["missing"]
+            with pytest.raises(TypeError):
+                snap["new"] = "value"
+
+    def test_serves_henge(self, henge_db, tmp_path):
+        database, druids = henge_db
+        write_snapshot(database, str(tmp_path / "henge.snap"))
+        with SnapshotDict(str(tmp_path / "henge.snap")) as snap:
+            h = Henge(snap, ["tests/data/family.yaml"])
+            assert h.retrieve_many(druids) == FAMS
+
+    def test_empty_and_invalid_files(self, tmp_path):
+        write_snapshot({}, str(tmp_path / "empty.snap"))
+        with SnapshotDict(str(tmp_path / "empty.snap")) as snap:
+            assert len(snap) == 0 and "a" not in snap
+        (tmp_path / "bad.snap").write_bytes(b"not a snapshot at all, sorry....")
+        with pytest.raises(ValueError):
+            SnapshotDict(str(tmp_path / "bad.snap"))
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs fork")
+    def test_forked_workers_share_mapping(self, henge_db, tmp_path):
+        database, druids = henge_db
+        write_snapshot(database, str(tmp_path / "henge.snap"))
+        snap = SnapshotDict(str(tmp_path / "henge.snap"))
+        pid = os.fork()
+        if pid == 0:  # Child: read through the inherited mapping
+            try:
+                h = Henge(snap, ["tests/data/family.yaml"])
+                os._exit(0 if h.retrieve_many(druids) == FAMS else 1)
+            finally:
+                os._exit(1)
+        _, status = os.waitpid(pid, 0)
+        assert os.WEXITSTATUS(status) == 0
+        snap.close()
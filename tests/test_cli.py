@@ -0,0 +1,92 @@
+import io
+import json
+
+import pytest
+
+from henge import Henge
+from henge.cli import get, load, main, read_items
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    (tmp_path / "people.ndjson").write_text(
+        '{"name": "Pat", "age": 38}\n\n{"name": "Kim"}\n'
+    )
+    (tmp_path / "people.yaml").write_text("- name: Pat\n  age: 38\n- name: Sam\n")
+    (tmp_path / "people.json").write_text('[\n  {"name": "Pat",\n   "age": 38}\n]\n')
+    (tmp_path / "pat.json").write_text('{\n  "name": "Pat"\n}\n')
+    (tmp_path / "seqs.fa").write_text(">chr1 desc\nACGT\nTT\n>chr2\nGG\n")
+    return tmp_path
+
+
+class TestLoad:
+    def test_read_items(self, inputs):
+        assert list(read_items(str(inputs / "people.yaml"))) == [
+            {"name": "Pat", "age": 38},
+            {"name": "Sam"},
+        ]
+        assert list(read_items(str(inputs / "seqs.fa"))) == [
+            ("chr1", "ACGTTT"),
+            ("chr2", "GG"),
+        ]
+        assert list(read_items(str(inputs / "people.json"))) == [
+            {"name": "Pat", "age": 38}
+        ]
+        assert list(read_items(str(inputs / "pat.json"))) == [{"name": "Pat"}]
+        assert list(read_items(str(inputs / "people.ndjson"), "ndjson"))[1] == {
+            "name": "Kim"
+        }
+
+    @pytest.mark.parametrize("workers", [1, 3])
+    def test_load_then_get(self, inputs, workers):
+        h = Henge({}, ["tests/data/person.yaml"])
+        out = io.StringIO()
+        paths = [str(inputs / "people.ndjson"), str(inputs / "people.yaml")]
+        assert load(h, paths, "person", batch_size=1, workers=workers, out=out) == 4
+        druids = out.getvalue().split()
+        assert druids[0] == druids[2] == h.insert({"name": "Pat", "age": 38}, "person")
+        out = io.StringIO()
+        get(h, druids, out=out)
+        assert json.loads(out.getvalue().splitlines()[1]) == {"name": "Kim"}
+
+    def test_load_fasta(self, inputs):
+        h = Henge({}, ["tests/data/sequence.yaml"])
+        out = io.StringIO()
+        load(h, [str(inputs / "seqs.fa")], "sequence", out=out)
+        name, druid = out.getvalue().splitlines()[0].split("\t")
+        assert name == "chr1"
+        assert h.retrieve(druid) == "ACGTTT"
+
+    def test_main(self, inputs, capsys):
+        args = ["load", "-q", "-s", "tests/data/person.yaml", "-t", "person"]
+        assert main(args + ["-d", "dict", str(inputs / "people.ndjson")]) == 0
+        assert len(capsys.readouterr().out.split()) == 2
+        with pytest.raises(ValueError):
+            main(["load", "-s", "tests/data/person.yaml", "-d", "dict", "-t", "x", "-"])
+
+    def test_load_and_get_need_a_database(self, inputs, capsys):
+        # Without one, items would be loaded into memory and discarded
+        args = ["load", "-q", "-s", "tests/data/person.yaml", "-t", "person"]
+        with pytest.raises(SystemExit):
+            main(args + [str(inputs / "people.ndjson")])
+        assert "--database" in capsys.readouterr().err
+        # An in-memory database holds nothing to get
+        with pytest.raises(SystemExit):
+            main(
+                [
+                    "get",
+                    "-s",
+                    "tests/data/person.yaml",
+                    "8635d46366b79f5570a35128c3eaa055",
+                ]
+            )
+        assert "--database" in capsys.readouterr().err
+
+    def test_main_sqlite(self, inputs, capsys):
+        database = "sqlite:///{}".format(inputs / "people.db")
+        common = ["-q", "-s", "tests/data/person.yaml", "-d", database]
+        path = str(inputs / "people.ndjson")
+        assert main(["load"] + common + ["-t", "person", path]) == 0
+        druids = capsys.readouterr().out.split()
+        assert main(["get"] + common + druids) == 0
+        assert json.loads(capsys.readouterr().out.splitlines()[1]) == {"name": "Kim"}
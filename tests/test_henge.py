@@ -1,5 +1,10 @@
+import json
+import threading
+import time
+
 import pytest
-from henge import Henge
+from henge import Henge, md5, sha512t24u_digest
+from henge.lazy import to_plain
 from jsonschema import ValidationError
 
 # See conftest.py for fixtures
@@ -69,3 +74,1044 @@ class TestRetrieval:
 
     def test_inherent_attributes(self, inherent):
         print("test")
+
+
+class TestBulkInsert:
+    def test_insert_many_matches_insert(self):
+        people = [
+            {"name": "Pat", "age": 38},
+            {"name": "Kim"},
+            {"name": "Pat", "age": 38},
+        ]
+        h = Henge(database={}, schemas=["tests/data/person.yaml"])
+        druids = h.insert_many(people, item_type="person")
+        single = Henge(database={}, schemas=["tests/data/person.yaml"])
+        assert druids == [single.insert(p, item_type="person") for p in people]
+        assert h.database == single.database
+        assert [h.retrieve(d) for d in druids] == people
+
+    def test_insert_many_recurses(self):
+        fam = {
+            "domicile": {"address": "123 Main St"},
+            "parents": [{"name": "Pat", "age": 38}, {"name": "Kim", "age": 40}],
+            "children": [{"name": "Sam", "age": 5}],
+        }
+        h = Henge(database={}, schemas=["tests/data/family.yaml"])
+        druids = h.insert_many([fam], item_type="family")
+        assert h.retrieve(druids[0]) == fam
+
+    def test_insert_many_writes_nothing_on_invalid_item(self):
+        h = Henge(database={}, schemas=["tests/data/person.yaml"])
+        with pytest.raises(ValidationError):
+            h.insert_many([{"name": "Pat"}, {"age": 3}], item_type="person")
+        assert len(h.database) == 0
+
+    def test_insert_many_uses_backend_bulk_write(self):
+        class BulkDict(dict):
+            calls = 0
+
+            def set_many(self, pairs):
+                self.calls += 1
+                self.update(pairs)
+
+        db = BulkDict()
+        h = Henge(database=db, schemas=["tests/data/person.yaml"])
+        druids = h.insert_many([{"name": str(i)} for i in range(50)], "person")
+        assert db.calls == 2  # The items, then the item-type index
+        assert len(set(druids)) == 50
+
+
+class TestValidation:
+    @pytest.mark.parametrize(
+        "x",
+        [
+            {"name": "Pat", "age": 38},
+            {"name": "Pat"},
+            {"name": "Pat", "age": True},
+            {"name": "Pat", "age": 1.0},
+            {"name": "Pat", "extra": [1]},
+            {"age": 38},
+            {"name": 1},
+            "Pat",
+            ["Pat"],
+        ],
+    )
+    def test_fast_validation_agrees_with_jsonschema(self, x):
+        import jsonschema
+
+        fast = Henge(database={}, schemas=["tests/data/person.yaml"])
+        try:
+            jsonschema.validate(x, fast.schemas["person"])
+            expected = True
+        except ValidationError:
+            expected = False
+        assert fast.select_item_type(x) == (["person"] if expected else [])
+        assert fast._fast_checkers["person"] is not None
+
+    def test_fast_checker_skips_constrained_schemas(self):
+        h = Henge(database={}, schemas=["tests/data/annotated_sequence_digest.yaml"])
+        with pytest.raises(ValidationError):
+            h.validate(
+                {"name": "a", "length": 1, "topology": "x"}, "annotated_sequence_digest"
+            )
+        assert h._fast_checkers["annotated_sequence_digest"] is None
+
+    def test_list_valued_types(self):
+        from henge.henge import _fast_checker
+
+        schemas = [
+            "type: [string, 'null']\nhenge_class: nickname\n",
+            "type: object\nhenge_class: person\nproperties:\n"
+            "  name:\n    type: [string, 'null']\n",
+        ]
+        h = Henge(database={}, schemas=[], schemas_str=schemas)
+        for item_type, item in [("nickname", None), ("person", {"name": None})]:
+            assert h.retrieve(h.insert(item, item_type)) == item
+            assert h._fast_checkers[item_type] is None
+        with pytest.raises(ValidationError):
+            h.insert({"name": 1}, "person")
+        array = {"type": "array", "items": {"type": ["string", "null"]}}
+        assert _fast_checker(array) is None
+
+
+class TestSchemaCache:
+    @pytest.fixture
+    def no_yaml(self, monkeypatch):
+        def fail(*args):
+            raise AssertionError("Schema was parsed")
+
+        monkeypatch.setattr("henge.henge._load_yaml_file", fail)
+        monkeypatch.setattr("henge.henge._parse_yaml", fail)
+
+    def test_files_and_strings_are_cached(self, tmp_path, monkeypatch, request):
+        schema_str = "type: string\nhenge_class: name"
+        args = (["tests/data/family.yaml"], [schema_str])
+        h = Henge({}, *args, schema_cache=str(tmp_path))
+        request.getfixturevalue("no_yaml")
+        assert Henge({}, *args, schema_cache=str(tmp_path)).schemas == h.schemas
+        monkeypatch.setenv("HENGE_SCHEMA_CACHE", str(tmp_path))
+        assert Henge({}, *args).schemas == h.schemas
+
+    def test_edited_file_misses(self, tmp_path):
+        path = tmp_path / "schema.yaml"
+        path.write_text("type: string\nhenge_class: name")
+        cache = str(tmp_path / "cache")
+        assert list(Henge({}, [str(path)], schema_cache=cache).schemas) == ["name"]
+        path.write_text("type: string\nhenge_class: title")
+        assert list(Henge({}, [str(path)], schema_cache=cache).schemas) == ["title"]
+
+    def test_urls_are_revalidated_with_etags(self, tmp_path, request):
+        import threading
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+
+        statuses = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.headers.get("If-None-Match") == '"v1"':
+                    statuses.append(304)
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                statuses.append(200)
+                body = b"type: string\nhenge_class: name"
+                self.send_response(200)
+                self.send_header("ETag", '"v1"')
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:{}/schema.yaml".format(server.server_port)
+        cache = str(tmp_path)
+        try:
+            h = Henge({}, [url], schema_cache=cache)
+            request.getfixturevalue("no_yaml")
+            assert Henge({}, [url], schema_cache=cache).schemas == h.schemas
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert statuses == [200, 304]
+
+    def test_import_is_lazy(self):
+        import os
+        import subprocess
+        import sys
+
+        import henge
+
+        code = (
+            "import sys, henge; "
+            "assert not {'asyncio', 'jsonschema', 'yacman', 'yaml'} & set(sys.modules)"
+        )
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(henge.__path__[0]))
+        subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+
+class TestPackedRecords:
+    fam = {
+        "domicile": {"address": "123 Main St"},
+        "parents": [{"name": "Pat", "age": 38}],
+        "children": [{"name": "Sam", "age": 5}],
+    }
+
+    def test_packed_record_is_one_key_per_item(self):
+        h = Henge(database={}, schemas=["tests/data/person.yaml"], packed_records=True)
+        druid = h.insert({"name": "Pat", "age": 38}, item_type="person")
+        assert [k for k in h.database if not k.startswith("_henge:")] == [druid]
+        assert h.retrieve(druid) == {"name": "Pat", "age": 38}
+        assert h.lookup(druid, "person") == '{"age":38,"name":"Pat"}'
+
+    def test_packed_druids_match_legacy(self):
+        legacy = Henge(database={}, schemas=["tests/data/family.yaml"])
+        packed = Henge(
+            database={}, schemas=["tests/data/family.yaml"], packed_records=True
+        )
+        druid = packed.insert(self.fam, "family")
+        assert druid == legacy.insert(self.fam, "family")
+        assert packed.retrieve(druid) == legacy.retrieve(druid)
+
+    def test_inherent_attributes_survive_packing(self):
+        h = Henge(
+            database={}, schemas=["tests/data/inherent.yaml"], packed_records=True
+        )
+        druid = h.insert({"string_attr": "a", "integer_attr": 1}, "test_item")
+        assert druid == h.insert({"string_attr": "a"}, "test_item")
+        assert h.retrieve(druid)["string_attr"] == "a"
+
+    @pytest.mark.parametrize("drop_legacy", [True, False])
+    def test_migrate_to_packed(self, drop_legacy):
+        from henge import migrate_to_packed
+
+        h = Henge(database={}, schemas=["tests/data/family.yaml"])
+        druid = h.insert(self.fam, "family")
+        expected = h.retrieve(druid)
+        n_keys = len(h.database)
+        n_items = h.list()["count"]
+        assert migrate_to_packed(h.database, 2, drop_legacy) == n_items
+        assert len(h.database) == n_keys - (n_items * 3 if drop_legacy else 0)
+        assert h.retrieve(druid) == expected
+        assert migrate_to_packed(h.database) == 0
+
+
+class CountingDict(dict):
+    """A dict backend with a get_many method that counts its calls"""
+
+    get_many_calls = 0
+
+    def get_many(self, keys):
+        self.get_many_calls += 1
+        return {k: self[k] for k in keys if k in self}
+
+
+class SlowContainsDict(dict):
+    """A dict backend whose existence checks take a while"""
+
+    def contains_many(self, keys):
+        found = {key for key in keys if key in self}
+        time.sleep(0.02)  # Writes meanwhile aren't seen
+        return found
+
+
+def insert_concurrently(insert, threads=4):
+    """Run an insert function on several threads at once"""
+    workers = [threading.Thread(target=insert) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+class TestRetrieveMany:
+    fams = [
+        {
+            "domicile": {"address": "123 Main St"},
+            "parents": [{"name": "Pat", "age": 38}, {"name": "Kim", "age": 40}],
+            "children": [{"name": "Sam", "age": 5}],
+        },
+        {
+            "domicile": {"address": "9 Elm St"},
+            "parents": [{"name": "Pat", "age": 38}],
+        },
+    ]
+
+    @pytest.mark.parametrize("packed_records", [True, False])
+    def test_one_multiget_per_level(self, packed_records):
+        db = CountingDict()
+        h = Henge(db, ["tests/data/family.yaml"], packed_records=packed_records)
+        druids = h.insert_many(self.fams, "family")
+        db.get_many_calls = 0
+        assert h.retrieve_many(druids) == self.fams
+        # family -> domicile and people arrays -> persons; legacy metadata
+        # keys come back in the same multi-get as the canonical strings
+        assert db.get_many_calls == 3
+
+    def test_reclimit(self):
+        h = Henge(database={}, schemas=["tests/data/family.yaml"])
+        druid = h.insert(self.fams[1], "family")
+        shallow = h.retrieve(druid, reclimit=1)
+        assert shallow["domicile"] == self.fams[1]["domicile"]
+        assert isinstance(shallow["parents"], list)
+        assert isinstance(shallow["parents"][0], str)
+        assert isinstance(h.retrieve(druid, reclimit=0)["parents"], str)
+
+    def test_missing_druid_raises(self):
+        from henge import NotFoundException
+
+        h = Henge(database={}, schemas=["tests/data/family.yaml"])
+        druid = h.insert(self.fams[1], "family")
+        with pytest.raises(NotFoundException):
+            h.retrieve_many([druid, "not_a_druid"])
+
+
+class TestLazyRetrieval:
+    fams = TestRetrieveMany.fams
+
+    def test_reads_on_access_and_memoizes(self):
+        db = CountingDict()
+        h = Henge(db, ["tests/data/family.yaml"])
+        druid = h.insert(self.fams[0], "family")
+        db.get_many_calls = 0
+        fam = h.retrieve(druid, lazy=True)
+        assert db.get_many_calls == 1  # Only the family itself
+        assert sorted(fam) == sorted(self.fams[0])
+        parents = fam["parents"]
+        assert db.get_many_calls == 2
+        assert parents[1]["name"] == "Kim"
+        assert db.get_many_calls == 3
+        assert list(parents) == self.fams[0]["parents"]  # One batch for the rest
+        assert fam["parents"] is parents and db.get_many_calls == 4
+        assert parents[1] == {"name": "Kim", "age": 40}
+        assert db.get_many_calls == 4
+
+    def test_to_plain_matches_retrieve(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        druids = h.insert_many(self.fams, "family")
+        for druid, fam in zip(druids, self.fams):
+            lazy = h.retrieve(druid, lazy=True)
+            assert type(lazy.to_plain()) is dict
+            assert lazy.to_plain() == h.retrieve(druid) == fam
+            assert lazy == fam
+        partly = h.retrieve(druids[0], lazy=True)
+        partly["children"][0]
+        assert to_plain(partly) == self.fams[0]
+        assert "LazyMapping" in repr(partly)
+
+    def test_reclimit(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        druid = h.insert(self.fams[1], "family")
+        assert h.retrieve(druid, reclimit=0, lazy=True) == h.retrieve(druid, reclimit=0)
+        shallow = h.retrieve(druid, reclimit=1, lazy=True)
+        assert shallow.to_plain() == h.retrieve(druid, reclimit=1)
+        assert isinstance(shallow["parents"], list)
+        assert shallow["domicile"] == self.fams[1]["domicile"]
+
+
+class TestIterRetrieve:
+    people = [{"name": "Kid{}".format(i), "age": i % 18} for i in range(25)]
+
+    @pytest.fixture
+    def stored(self):
+        db = CountingDict()
+        h = Henge(db, ["tests/data/family.yaml"])
+        druid = h.insert({"parents": self.people}, "family")
+        array = h.retrieve(druid, reclimit=0)["parents"]
+        db.get_many_calls = 0
+        return h, array
+
+    @pytest.mark.parametrize("prefetch", [0, 1, 3])
+    def test_chunks_and_resuming(self, stored, prefetch):
+        h, array = stored
+        elements = h.iter_retrieve(array, chunk_size=10, prefetch=prefetch)
+        assert list(elements) == self.people
+        assert h.database.get_many_calls == 4  # The array, then 3 chunks
+        chunks = h.iter_retrieve(array, chunk_size=10, start=12, chunks=True)
+        assert list(chunks) == [self.people[12:22], self.people[22:]]
+        assert list(h.iter_retrieve(array, start=100)) == []
+
+    def test_reclimit(self, stored):
+        h, array = stored
+        druids = h.retrieve(array, reclimit=0)
+        assert list(h.iter_retrieve(array, reclimit=0, chunk_size=3)) == druids
+
+    def test_stopping_early(self, stored):
+        h, array = stored
+        elements = h.iter_retrieve(array, chunk_size=2, prefetch=2)
+        assert next(elements) == self.people[0]
+        elements.close()
+        assert h.database.get_many_calls <= 4  # The array, then up to 3 chunks
+
+    def test_not_an_array(self, stored):
+        h, _ = stored
+        druid = h.insert(self.people[0], "person")
+        with pytest.raises(ValueError):
+            h.iter_retrieve(druid)
+
+
+class TestGetMany:
+    def test_plain_dict_fallback(self):
+        h = Henge({}, ["tests/data/person.yaml"])
+        druid = h.insert({"name": "Pat"}, "person")
+        assert h.retrieve(druid) == {"name": "Pat"}
+
+    def test_remote_henge_reads(self):
+        from henge import NotFoundException
+
+        remote_db = CountingDict()
+        remote = Henge(remote_db, ["tests/data/person.yaml"])
+        h = Henge(CountingDict(), ["tests/data/string.yaml"], henges={"person": remote})
+        druid = h.insert({"name": "Pat"}, "person")
+        assert druid not in h.database
+        assert h.retrieve(druid) == {"name": "Pat"}
+        assert remote_db.get_many_calls == 1
+        with pytest.raises(NotFoundException):
+            h.retrieve("missing")
+
+
+class SlowDict(CountingDict):
+    """A CountingDict whose reads take a while, tracking concurrent reads"""
+
+    delay = 0.05
+    active = []  # Shared by all instances, as [current, max]
+
+    def get_many(self, keys):
+        self.active[0] += 1
+        self.active[1] = max(self.active)
+        time.sleep(self.delay)
+        self.active[0] -= 1
+        return super(SlowDict, self).get_many(keys)
+
+
+class TestFederation:
+    fam = TestRetrieveMany.fams[0]
+
+    @pytest.fixture
+    def remotes(self):
+        SlowDict.active = [0, 0]
+        return (
+            Henge(SlowDict(), ["tests/data/family.yaml"]),
+            Henge(SlowDict(), ["tests/data/family.yaml"]),
+        )
+
+    def federate(self, first, second, database=None, **kwargs):
+        henges = {"family": first, "location": first}
+        henges.update({"people": second, "person": second})
+        return Henge(
+            {} if database is None else database,
+            ["tests/data/string.yaml"],
+            henges=henges,
+            **kwargs,
+        )
+
+    def test_remotes_are_read_in_parallel(self, remotes):
+        h = self.federate(*remotes)
+        druid = h.insert(self.fam, "family")
+        SlowDict.active[1] = 0
+        assert h.retrieve(druid) == self.fam
+        # The domicile and the parent and children arrays are in one level
+        assert SlowDict.active[1] == 2
+
+    def test_remote_reads_are_cached(self, remotes):
+        h = self.federate(*remotes)
+        druid = h.insert(self.fam, "family")
+        string = remotes[0].lookup(druid, "family")
+        assert h.retrieve(druid) == self.fam
+        calls = [remote.database.get_many_calls for remote in remotes]
+        assert h.retrieve(druid) == self.fam
+        assert h.lookup(druid, "family") == string
+        assert [remote.database.get_many_calls for remote in remotes] == calls
+        uncached = self.federate(*remotes, h.database, remote_cache_size=0)
+        assert uncached.remote_cache is None
+        assert uncached.retrieve(druid) == self.fam
+
+    def test_timeout_and_circuit_breaker(self, remotes):
+        from henge import Delegate, RemoteHengeError
+
+        first, second = remotes
+        slow = Delegate(second, timeout=0.01, failures=2, reset_after=0.2)
+        h = self.federate(first, slow, remote_cache_size=0)
+        druid = h.insert(self.fam, "family")
+        second.database.delay = 0.1
+        for _ in range(2):
+            with pytest.raises(RemoteHengeError, match="timed out"):
+                h.retrieve(druid)
+        assert slow.breaker.state == "open"
+        calls = second.database.get_many_calls
+        with pytest.raises(RemoteHengeError, match="Circuit open"):
+            h.retrieve(druid)
+        time.sleep(0.2)  # Until a trial call is let through
+        second.database.delay = 0
+        assert h.retrieve(druid) == self.fam
+        assert second.database.get_many_calls > calls
+        assert slow.breaker.state == "closed"
+
+    def test_writes_wait_past_the_read_timeout(self, remotes):
+        from henge import Delegate, RemoteHengeError
+
+        class SlowWriteDict(dict):
+            def set_many(self, pairs):
+                time.sleep(0.05)
+                self.update(pairs)
+
+        first, second = remotes
+        second.database = SlowWriteDict()
+        h = self.federate(first, Delegate(second, timeout=0.01))
+        druid = h.insert(self.fam, "family")
+        assert h.retrieve(druid) == self.fam
+        strict = Delegate(second, timeout=0.01, write_timeout=0.01)
+        h = self.federate(first, strict)
+        with pytest.raises(RemoteHengeError, match="timed out after 0.01s"):
+            h.insert(TestRetrieveMany.fams[1], "family")
+
+    def test_hung_delegate_leaves_workers_to_others(self, remotes):
+        from henge import Delegate, RemoteHengeError
+
+        first, second = remotes
+        healthy = Delegate(first, timeout=0.2)
+        hung = Delegate(second, timeout=0.01, failures=100, max_concurrency=1)
+        h = Henge(
+            {},
+            ["tests/data/string.yaml"],
+            henges={
+                "family": healthy,
+                "location": healthy,
+                "people": hung,
+                "person": hung,
+            },
+            remote_workers=2,
+            remote_cache_size=0,
+        )
+        druid = h.insert(self.fam, "family")
+        second.database.delay = 1.0
+        with pytest.raises(RemoteHengeError, match="timed out"):
+            h.retrieve(druid)
+        for _ in range(3):
+            with pytest.raises(RemoteHengeError, match="in flight"):
+                h.retrieve(druid)
+        # The hung reads hold one worker; the other still serves the family
+        assert h.retrieve(druid, reclimit=0)["domicile"]
+        h.close()
+
+    def test_close_stops_workers(self, remotes):
+        with self.federate(*remotes, remote_cache_size=0) as h:
+            druid = h.insert(self.fam, "family")
+            assert h.retrieve(druid) == self.fam
+        with pytest.raises(RuntimeError):
+            h.retrieve(druid)
+        Henge({}, ["tests/data/family.yaml"]).close()  # No remote workers
+
+
+class TestRetrievalCache:
+    fam = TestRetrieveMany.fams[0]
+
+    def test_cache_hits_skip_backend(self):
+        db = CountingDict()
+        h = Henge(db, ["tests/data/family.yaml"], packed_records=True, cache_size=100)
+        druid = h.insert(self.fam, "family")
+        assert h.retrieve(druid) == self.fam
+        calls = db.get_many_calls
+        assert h.retrieve(druid) == self.fam
+        assert db.get_many_calls == calls
+        assert h.cache_info()["hits"] == 1
+
+    def test_shared_subitems_are_cached(self):
+        db = CountingDict()
+        h = Henge(db, ["tests/data/family.yaml"], packed_records=True, cache_size=100)
+        druid = h.insert(self.fam, "family")
+        h.retrieve(druid)
+        other = h.insert(TestRetrieveMany.fams[1], "family")
+        calls = db.get_many_calls
+        h.retrieve(other)
+        # Only the new family and its parents array; Pat is already cached
+        assert db.get_many_calls == calls + 2
+
+    def test_cached_results_are_copies(self):
+        h = Henge({}, ["tests/data/family.yaml"], cache_size=100)
+        druid = h.insert(self.fam, "family")
+        h.retrieve(druid)["parents"][0]["name"] = "changed"
+        assert h.retrieve(druid) == self.fam
+
+    def test_cache_bounds_and_invalidation(self):
+        h = Henge({}, ["tests/data/person.yaml"], cache_size=2)
+        druids = h.insert_many([{"name": str(i)} for i in range(3)], "person")
+        h.retrieve_many(druids)
+        assert h.cache_info()["entries"] == 2
+        assert h.cache_info()["evictions"] == 1
+        assert h.invalidate_cache([druids[2]]) == 1
+        assert h.invalidate_cache() == 1
+        h = Henge(h.database, ["tests/data/person.yaml"], cache_size=9, cache_bytes=40)
+        h.retrieve_many(druids)
+        assert h.cache_info()["bytes"] <= 40
+
+    def test_cache_is_shared_across_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        h = Henge({}, ["tests/data/family.yaml"], cache_size=5)
+        druids = h.insert_many(TestRetrieveMany.fams, "family")
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(h.retrieve, druids * 50))
+        assert results == TestRetrieveMany.fams * 50
+        assert h.cache_info()["entries"] <= 5
+
+
+class TestCompactArrays:
+    fams = TestRetrieveMany.fams
+
+    @pytest.mark.parametrize("packed_records", [True, False])
+    @pytest.mark.parametrize("digest_name", ["md5", "sha512t24u_digest"])
+    def test_druids_and_items_are_unchanged(self, packed_records, digest_name):
+        import henge
+
+        kwargs = dict(
+            checksum_function=getattr(henge, digest_name),
+            packed_records=packed_records,
+        )
+        plain = Henge({}, ["tests/data/family.yaml"], **kwargs)
+        compact = Henge({}, ["tests/data/family.yaml"], compact_arrays=True, **kwargs)
+        druids = compact.insert_many(self.fams, "family")
+        assert druids == plain.insert_many(self.fams, "family")
+        assert compact.retrieve_many(druids) == self.fams
+        parents = compact.retrieve(druids[0], reclimit=0)["parents"]
+        assert compact.lookup(parents, "people") == plain.lookup(parents, "people")
+        stored = compact.database[parents]
+        assert "\x1f" in stored and stored != plain.database[parents]
+        # Either form is read by any henge
+        assert plain.retrieve_many(druids) == compact.retrieve_many(druids)
+
+    def test_codec(self):
+        from henge.henge import _decode_druid_array, _encode_druid_array
+
+        hex_druids = [md5(str(i)) for i in range(100)]
+        b64_druids = [sha512t24u_digest(str(i)) for i in range(100)]
+        for druids in [hex_druids, b64_druids, ["ab", "cd"]]:
+            encoded = _encode_druid_array(druids)
+            assert _decode_druid_array(encoded) == druids
+        assert len(_encode_druid_array(hex_druids)) < 0.65 * len(json.dumps(hex_druids))
+        for druids in [[], ["AB"], ["ab", "abc"], ["a b "], [1, 2], ["abc"], None]:
+            assert _encode_druid_array(druids) is None
+
+
+class TestInsertMemo:
+    pat = {"name": "Pat", "age": 38}
+    fam = {"parents": [pat, {"name": "Kim", "age": 40}], "children": [pat, pat]}
+
+    def test_repeats_match_unmemoized_inserts(self):
+        plain = Henge({}, ["tests/data/family.yaml"], memoize_inserts=False)
+        h = Henge({}, ["tests/data/family.yaml"])
+        assert h.insert(self.fam, "family") == plain.insert(self.fam, "family")
+        assert h.memo_info()["hits"] == 2  # The second and third Pat
+        fams = [self.fam, dict(self.fam, domicile={"address": "1 Main St"})]
+        assert h.insert_many(fams, "family") == plain.insert_many(fams, "family")
+        # Pat twice, then all but the domicile and the family
+        assert h.memo_info()["hits"] == 2 + 8
+        assert h.database == plain.database
+        assert plain.memo_info() == {"hits": 0, "misses": 0}
+
+    def test_session(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        with h.insert_session() as memo:
+            h.insert(self.fam, "family")
+            with h.insert_session() as inner:
+                assert inner is memo
+                druid = h.insert({"parents": [self.pat]}, "family")
+            assert memo.hits == 2 + 1
+        assert h.retrieve(druid) == {"parents": [self.pat]}
+        assert h._insert_session is None
+
+    def test_session_forgets_least_recently_used(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        with h.insert_session(max_entries=3) as memo:
+            for i in range(4):
+                h.insert({"name": "P{}".format(i)}, "person")
+            assert len(memo) == 3 and memo.stats()["evictions"] == 1
+            h.insert({"name": "P3"}, "person")
+            h.insert({"name": "P0"}, "person")
+            assert memo.hits == 1 and memo.misses == 5
+
+    def test_failed_insert_is_not_remembered(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        with h.insert_session(max_entries=100) as memo:
+            with pytest.raises(ValidationError):
+                h.insert({"parents": [self.pat, {"age": 3}]}, "family")
+            assert len(memo) == 0
+            druid = h.insert({"parents": [self.pat]}, "family")
+            assert h.retrieve(druid) == {"parents": [self.pat]}
+
+    def test_deleting_forgets_subtrees(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        with h.insert_session() as memo:
+            druid = h.insert(self.fam, "family")
+            h.delete([druid], cascade=True)
+            assert len(memo) == 0
+            assert h.insert(self.fam, "family") == druid
+        assert h.retrieve(druid) == self.fam
+
+
+class TestSkipExisting:
+    fam = TestRetrieveMany.fams[0]
+
+    def test_reinsert_writes_nothing(self):
+        class WriteCountingDict(dict):
+            writes = 0
+
+            def set_many(self, pairs):
+                self.writes += len([k for k in pairs if not k.startswith("_henge:")])
+                self.update(pairs)
+
+        db = WriteCountingDict()
+        h = Henge(db, ["tests/data/family.yaml"])
+        druid = h.insert(self.fam, "family")
+        writes = db.writes
+        assert h.insert(self.fam, "family") == druid
+        assert db.writes == writes
+        # Only the new family and its new parents array are written
+        other = dict(self.fam, parents=[{"name": "Pat", "age": 38}])
+        h.insert(other, "family")
+        assert db.writes == writes + 2 * 4
+
+    def test_existing_parent_skips_probing_children(self):
+        class ProbeCountingDict(dict):
+            probed = []
+
+            def contains_many(self, keys):
+                self.probed.extend(keys)
+                return {k for k in keys if k in self}
+
+        db = ProbeCountingDict()
+        h = Henge(db, ["tests/data/family.yaml"])
+        druid = h.insert(self.fam, "family")
+        db.probed.clear()
+        h.insert(self.fam, "family")
+        assert db.probed == [druid]
+
+    @pytest.mark.parametrize("packed_records", [True, False])
+    def test_changed_external_attributes_are_rewritten(self, packed_records):
+        h = Henge(
+            {},
+            ["tests/data/inherent.yaml"],
+            packed_records=packed_records,
+            cache_size=100,
+        )
+        druid = h.insert({"string_attr": "x", "integer_attr": 1}, "test_item")
+        assert h.retrieve(druid)["integer_attr"] == 1
+        bytes_before = h.stats()["item_types"]["test_item"]["bytes"]
+        assert h.insert({"string_attr": "x", "integer_attr": 22}, "test_item") == druid
+        assert h.retrieve(druid) == {"string_attr": "x", "integer_attr": 22}
+        assert h.stats()["item_types"]["test_item"] == {
+            "items": 1,
+            "bytes": bytes_before + 1,
+        }
+        assert h.list(item_type="test_item")["items"] == [druid]
+        h.insert({"string_attr": "x"}, "test_item")
+        assert h.retrieve(druid) == {"string_attr": "x"}
+
+
+class TestStreamingDigests:
+    seq = "ACGT" * 1000 + 'é"\\\n\x01'
+
+    @pytest.mark.parametrize("digest_name", ["md5", "sha512t24u_digest"])
+    def test_digest_inputs_agree(self, digest_name):
+        import io
+        import henge
+
+        digest = getattr(henge, digest_name)
+        expected = digest(self.seq)
+        encoded = self.seq.encode()
+        chunks = [self.seq[i : i + 7] for i in range(0, len(self.seq), 7)]
+        assert digest(encoded) == expected
+        assert digest(memoryview(encoded)) == expected
+        assert digest(io.BytesIO(encoded)) == expected
+        assert digest(io.StringIO(self.seq)) == expected
+        assert digest(iter(chunks)) == expected
+
+
+class TestListing:
+    @pytest.fixture
+    def h(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        h.index_page_size = 4
+        return h
+
+    def page_through(self, h, **kwargs):
+        listed, cursor = [], None
+        while True:
+            page = h.list(cursor=cursor, **kwargs)
+            listed.extend(page["items"])
+            cursor = page["cursor"]
+            if cursor is None:
+                return listed
+
+    def test_pages_through_item_type(self, h):
+        druids = []
+        for start in range(0, 10, 3):
+            people = [{"name": str(i)} for i in range(start, start + 3)]
+            druids.extend(h.insert_many(people, "person"))
+        assert h.list(item_type="person", limit=5)["count"] == 12
+        assert self.page_through(h, item_type="person", limit=5) == druids
+        assert h.list(offset=5, limit=2, item_type="person")["items"] == druids[5:7]
+        assert h.list(item_type="family")["items"] == []
+
+    def test_lists_items_of_all_types(self, h):
+        fam = h.insert(TestRetrieveMany.fams[0], "family")
+        listed = self.page_through(h, limit=3)
+        assert fam in listed and len(listed) == len(set(listed)) == 7
+        assert not any(k.endswith("_item_type") for k in listed)
+        assert h.list(offset=5)["items"] == listed[5:]
+
+    def test_concurrent_inserts_are_listed_once(self):
+        people = [{"name": "P{}".format(i)} for i in range(50)]
+        db = SlowContainsDict()
+        h = Henge(db, ["tests/data/person.yaml"])
+        insert_concurrently(lambda: h.insert_many(people, "person"))
+        listed = h.list()
+        assert listed["count"] == len(listed["items"]) == h.stats()["items"] == 50
+        # Separate Henges, like separate processes, each index the items
+        db.clear()
+        henges = iter([Henge(db, ["tests/data/person.yaml"]) for _ in range(4)])
+        insert_concurrently(lambda: next(henges).insert_many(people, "person"))
+        assert sorted(h.list()["items"]) == sorted(listed["items"])
+        h.reindex()
+        assert h.list()["count"] == h.stats()["items"] == 50
+
+    def test_invalid_cursor(self, h):
+        with pytest.raises(ValueError):
+            h.list(cursor="not a cursor")
+
+    @pytest.mark.parametrize("packed_records", [True, False])
+    def test_reindex(self, packed_records):
+        h = Henge({}, ["tests/data/family.yaml"], packed_records=packed_records)
+        h.insert_many(TestRetrieveMany.fams, "family")
+        listed = sorted(h.list()["items"])
+        for key in [k for k in h.database if k.startswith("_henge:")]:
+            del h.database[key]
+        assert h.list()["items"] == []
+        assert h.reindex() == len(listed)
+        assert sorted(h.list()["items"]) == listed
+        assert h.reindex() == len(listed)
+
+
+class TestStats:
+    def test_counts_items_and_bytes(self):
+        h = Henge({}, ["tests/data/family.yaml"])
+        assert len(h) == 0
+        h.insert_many(TestRetrieveMany.fams, "family")
+        h.insert(TestRetrieveMany.fams[0], "family")  # Already stored
+        stats = h.stats()
+        assert len(h) == stats["items"] == 10
+        assert stats["item_types"]["family"]["items"] == 2
+        assert stats["item_types"]["person"]["items"] == 3
+        assert stats["bytes"] == sum(
+            len(v) + len(h.database[k + "_external_string"])
+            for k, v in h.database.items()
+            if k + "_item_type" in h.database
+        )
+
+    @pytest.mark.parametrize("packed_records", [True, False])
+    def test_reindex_rebuilds_counters(self, packed_records):
+        h = Henge({}, ["tests/data/family.yaml"], packed_records=packed_records)
+        h.insert_many(TestRetrieveMany.fams, "family")
+        stats = h.stats()
+        h.database["orphan_item_type"] = "person"  # Metadata without an item
+        for key in [k for k in h.database if k.startswith("_henge:")]:
+            del h.database[key]
+        assert len(h) == 0
+        h.reindex()
+        assert h.stats() == stats
+
+    def test_concurrent_inserts_of_the_same_items(self):
+        people = [{"name": "P{}".format(i)} for i in range(50)]
+        h = Henge(SlowContainsDict(), ["tests/data/person.yaml"])
+        insert_concurrently(lambda: h.insert_many(people, "person"))
+        assert h.stats()["items"] == len(h) == 50
+
+
+class TestGarbageCollection:
+    fams = TestRetrieveMany.fams
+
+    def henge(self, packed_records=False):
+        h = Henge({}, ["tests/data/family.yaml"], packed_records=packed_records)
+        h.index_page_size = 2
+        h.refs_page_size = 2
+        return h
+
+    def item_keys(self, h):
+        return {k for k in h.database if not k.startswith("_henge:")}
+
+    def test_reverse_references(self):
+        h = self.henge()
+        fam = h.insert(self.fams[0], "family")
+        pat = h.insert({"name": "Pat", "age": 38}, "person")
+        header = json.loads(h.database["_henge:refs:" + pat])
+        assert header == {"count": 1, "page_size": 2}
+        refs = json.loads(h.database["_henge:refs:" + pat + ":0"])
+        assert len(refs) == 1
+        assert h.retrieve(refs[0]) == self.fams[0]["parents"]
+        assert "_henge:refs:" + fam not in h.database
+
+    def test_references_of_shared_items_are_paged(self):
+        h = self.henge()
+        pat = {"name": "Pat", "age": 38}
+        fams = [{"parents": [pat, {"name": "P{}".format(i)}]} for i in range(5)]
+        druids = [h.insert(fam, "family") for fam in fams]
+        pat = h.insert(pat, "person")
+        key = "_henge:refs:" + pat
+        assert json.loads(h.database[key])["count"] == 5
+        pages = [json.loads(h.database["{}:{}".format(key, p)]) for p in range(3)]
+        assert [len(page) for page in pages] == [2, 2, 1]
+        # Appending a referrer rewrites only the last page
+        written = set()
+
+        class RecordingDict(dict):
+            def set_many(self, pairs):
+                written.update(pairs)
+                self.update(pairs)
+
+        h.database = RecordingDict(h.database)
+        h.insert({"parents": [{"name": "Pat", "age": 38}]}, "family")
+        assert json.loads(h.database[key])["count"] == 6
+        assert len(json.loads(h.database[key + ":2"])) == 2
+        assert {key, key + ":2"} <= written
+        assert not written & {key + ":0", key + ":1"}
+
+        assert h.delete(druids[:3], cascade=True) == 9
+        assert json.loads(h.database[key])["count"] == 3
+        assert [len(json.loads(h.database[key + ":" + p])) for p in "01"] == [2, 1]
+        assert key + ":2" not in h.database
+        assert h.delete(druids[3:], cascade=True) == 6
+        assert json.loads(h.database[key])["count"] == 1
+        assert h.retrieve(pat) == {"name": "Pat", "age": 38}
+
+    def test_index_items_off(self):
+        h = Henge({}, ["tests/data/family.yaml"], index_items=False)
+        druid = h.insert(self.fams[0], "family")
+        assert not [k for k in h.database if k.startswith("_henge:")]
+        with pytest.raises(ValueError):
+            h.delete([druid])
+        with pytest.raises(ValueError):
+            h.gc(roots=[druid])
+        assert h.retrieve(druid) == self.fams[0]
+        assert h.list()["items"] == []
+        h.reindex()
+        assert h.list(item_type="family")["items"] == [druid]
+
+    def test_delete_keeps_referenced_items(self):
+        h = self.henge()
+        h.insert(self.fams[0], "family")
+        pat = h.insert({"name": "Pat", "age": 38}, "person")
+        assert h.delete([pat]) == 0
+        assert h.retrieve(pat) == {"name": "Pat", "age": 38}
+
+    @pytest.mark.parametrize("packed_records", [True, False])
+    def test_delete_cascades_to_unshared_items(self, packed_records):
+        h = self.henge(packed_records)
+        keep = h.insert(self.fams[1], "family")
+        keys = self.item_keys(h)
+        stats = h.stats()
+        gone = h.insert(self.fams[0], "family")
+        assert h.delete([gone]) == 1
+        assert h.delete([gone], cascade=True) == 0
+        h.insert(self.fams[0], "family")
+        assert h.delete([gone], cascade=True) == 6
+        assert self.item_keys(h) == keys
+        assert h.stats() == stats
+        assert h.retrieve(keep) == self.fams[1]
+        assert len(h.list()["items"]) == len(h)
+
+    @pytest.mark.parametrize("packed_records", [True, False])
+    def test_gc_removes_unreachable_items(self, packed_records):
+        h = self.henge(packed_records)
+        keep = h.insert(self.fams[1], "family")
+        keys = self.item_keys(h)
+        listed = h.list()["items"]
+        h.insert(self.fams[0], "family")
+        h.insert({"name": "Kim", "age": 7}, "person")
+        assert h.gc(roots=[keep], batch_size=2) == 7
+        assert self.item_keys(h) == keys
+        assert h.retrieve(keep) == self.fams[1]
+        assert sorted(h.list()["items"]) == sorted(listed)
+        assert h.stats()["items"] == len(listed)
+        for item_type, header in h.stats()["item_types"].items():
+            index = json.loads(h.database["_henge:index:" + item_type])
+            assert index["entries"] == header["items"]
+        assert h.gc(roots=[keep]) == 0
+        assert h.insert(self.fams[0], "family") in h.list(limit=100)["items"]
+
+    def test_reindex_rebuilds_references(self):
+        h = self.henge()
+        h.insert_many(self.fams, "family")
+        refs = {k: v for k, v in h.database.items() if k.startswith("_henge:refs:")}
+        for key in refs:
+            del h.database[key]
+        h.reindex()
+        rebuilt = {k: v for k, v in h.database.items() if k.startswith("_henge:")}
+        assert {k: v for k, v in rebuilt.items() if k in refs} == refs
+
+
+class TestClean:
+    fams = TestRetrieveMany.fams
+
+    def test_clean_uses_backend_clear(self):
+        class ClearDict(dict):
+            cleared = False
+
+            def clear(self):
+                self.cleared = True
+                super(ClearDict, self).clear()
+
+        h = Henge(ClearDict(), ["tests/data/family.yaml"], cache_size=10)
+        h.retrieve(h.insert(self.fams[0], "family"))
+        h.clean()
+        assert h.database.cleared and len(h.database) == 0 and len(h) == 0
+        assert h.cache_info()["entries"] == 0
+
+    def test_clean_deletes_in_batches_without_clear(self):
+        from collections.abc import Mapping
+
+        class BulkMapping(Mapping):
+            def __init__(self):
+                self.data, self.deletes = {}, 0
+
+            def __getitem__(self, key):
+                return self.data[key]
+
+            def __iter__(self):
+                return iter(list(self.data))
+
+            def __len__(self):
+                return len(self.data)
+
+            def set_many(self, pairs):
+                self.data.update(pairs)
+
+            def delete_many(self, keys):
+                self.deletes += 1
+                for key in keys:
+                    self.data.pop(key, None)
+
+        h = Henge(BulkMapping(), ["tests/data/family.yaml"])
+        h.insert_many(self.fams, "family")
+        n_keys = len(h.database)
+        h.clean(batch_size=10)
+        assert len(h.database) == 0 and h.database.deletes == -(-n_keys // 10)
+
+    @pytest.mark.parametrize("packed_records", [True, False])
+    def test_clean_item_type(self, packed_records):
+        h = Henge({}, ["tests/data/family.yaml"], packed_records=packed_records)
+        h.index_page_size = 2
+        families = h.insert_many(self.fams, "family")
+        kim = h.insert({"name": "Kim", "age": 7}, "person")
+        stats = h.stats()["item_types"]
+        h.clean(item_type="family", batch_size=2)
+        assert h.list(item_type="family")["items"] == []
+        assert h.stats()["item_types"]["family"] == {"items": 0, "bytes": 0}
+        assert h.stats()["item_types"]["people"] == stats["people"]
+        assert not any(k.startswith(tuple(families)) for k in h.database)
+        assert kim in h.list(item_type="person")["items"]
+        # Sub-items of the removed families are no longer referenced
+        assert h.gc(roots=[kim]) == 8
+        h.clean(item_type="person")
+        assert [k for k in h.database if not k.startswith("_henge:")] == []
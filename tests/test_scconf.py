@@ -0,0 +1,232 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("pipestat")
+
+from psycopg2 import OperationalError
+from psycopg2.pool import PoolError
+
+from henge.scconf import PipestatMapping, RDBDict
+
+SCHEMA = """
+title: test
+description: test
+type: object
+properties:
+  pipeline_name: test
+  samples:
+    type: array
+    items:
+      type: object
+      properties:
+        value:
+          type: string
+          description: A value
+"""
+
+
+class TestPipestatMapping:
+    @pytest.fixture
+    def mapping(self, tmp_path):
+        schema = tmp_path / "schema.yaml"
+        schema.write_text(SCHEMA)
+        mapping = PipestatMapping(
+            schema_path=str(schema),
+            results_file_path=str(tmp_path / "results.yaml"),
+            record_identifier="r0",
+        )
+        for i in range(5):
+            mapping.report(record_identifier="r{}".format(i), values={"value": "v"})
+        return mapping
+
+    def test_iterates_file_backend_once(self, mapping):
+        # The file backend ignores cursors and always returns page token 0
+        mapping.fetch_size = 2
+        assert list(mapping) == ["r0", "r1", "r2", "r3", "r4"]
+        mapping.fetch_size = 100
+        assert list(mapping) == ["r0", "r1", "r2", "r3", "r4"]
+        assert len(mapping) == 5
+
+    def test_pages_with_cursor(self, mapping):
+        ids = ["r{}".format(i) for i in range(5)]
+        calls = []
+
+        def select_records(columns=None, limit=None, cursor=None):
+            calls.append((columns, limit, cursor))
+            start = cursor or 0
+            records = [{"record_identifier": r} for r in ids[start : start + limit]]
+            return {
+                "total_size": len(ids),
+                "next_page_token": start + len(records),
+                "records": records,
+            }
+
+        mapping.select_records = select_records
+        mapping.fetch_size = 2
+        assert list(mapping) == ids
+        assert calls == [
+            (["record_identifier"], 2, None),
+            (["record_identifier"], 2, 2),
+            (["record_identifier"], 2, 4),
+        ]
+
+
+class FakeStore(object):
+    """Rows of a key/value table, served to fake connections"""
+
+    def __init__(self, data):
+        self.data = dict(data)
+        self.delay = 0
+        self.fail = False
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def respond(self, params):
+        # Queries are told apart by their parameters
+        keys = sorted(self.data)
+        if not params:  # COUNT(*)
+            return [(len(keys),)]
+        if "keys" in params:
+            return [(k, self.data[k]) for k in params["keys"] if k in self.data]
+        if "last" in params:
+            keys = [k for k in keys if k > params["last"]]
+        return [(k, self.data[k]) for k in keys[: params["limit"]]]
+
+
+class FakeCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        store = self.connection.store
+        with store.lock:
+            store.active += 1
+            store.max_active = max(store.max_active, store.active)
+        time.sleep(store.delay)
+        with store.lock:
+            store.active -= 1
+        if store.fail:
+            self.connection.closed = 2
+            raise OperationalError("server closed the connection unexpectedly")
+        self.rows = store.respond(params or {})
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeConnection(object):
+    def __init__(self, store):
+        self.store = store
+        self.autocommit = True
+        self.closed = 0
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, *args):
+        if kind is None:
+            self.commits += 1
+
+
+class FakePool(object):
+    """Raises PoolError when exhausted, like ThreadedConnectionPool"""
+
+    def __init__(self, maxconn, store):
+        self.maxconn = maxconn
+        self.store = store
+        self.used = 0
+        self.returned = []  # (connection, close)
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def getconn(self):
+        with self.lock:
+            if self.used >= self.maxconn:
+                raise PoolError("connection pool exhausted")
+            self.used += 1
+        return FakeConnection(self.store)
+
+    def putconn(self, connection, close=False):
+        with self.lock:
+            self.used -= 1
+            self.returned.append((connection, close))
+
+    def closeall(self):
+        self.closed = True
+
+
+class TestRDBDict:
+    @pytest.fixture
+    def db(self, monkeypatch):
+        store = FakeStore({"k{}".format(i): "v{}".format(i) for i in range(7)})
+        monkeypatch.setattr(
+            RDBDict, "create_pool", lambda self, *args: FakePool(args[-1], store)
+        )
+        return RDBDict("db", "user", "password", max_connections=2, fetch_size=3)
+
+    def test_threads_wait_for_a_connection(self, db):
+        db.pool.store.delay = 0.01
+        errors = []
+
+        def read():
+            try:
+                assert db.get_many(["k1"]) == {"k1": "v1"}
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        assert db.pool.store.max_active == 2
+        assert db.pool.used == 0
+
+    def test_broken_connections_are_closed(self, db):
+        db.pool.store.fail = True
+        with pytest.raises(OperationalError):
+            db.get_many(["k1"])
+        assert db.pool.returned[-1][1] is True
+        db.pool.store.fail = False
+        assert db.get_many(["k1"]) == {"k1": "v1"}
+        assert db.pool.returned[-1][1] is False
+
+    def test_set_many_upserts_in_pages(self, db, monkeypatch):
+        calls = []
+
+        def execute_values(cursor, statement, rows, page_size):
+            calls.append((rows, page_size))
+            cursor.connection.store.data.update(rows)
+
+        monkeypatch.setattr("henge.scconf.execute_values", execute_values)
+        db.page_size = 2
+        db.set_many({"k1": "new", "k9": "v9"})
+        assert calls == [([("k1", "new"), ("k9", "v9")], 2)]
+        connection = db.pool.returned[-1][0]
+        assert connection.commits == 1 and connection.autocommit is True
+        assert db.get_many(["k1", "k9"]) == {"k1": "new", "k9": "v9"}
+
+    def test_keyset_scan(self, db):
+        keys = sorted(db.pool.store.data)
+        assert list(db) == keys
+        assert list(db.items()) == [(k, db.pool.store.data[k]) for k in keys]
+        assert list(db.values()) == [db.pool.store.data[k] for k in keys]
@@ -0,0 +1,94 @@
+import enum
+import json
+import uuid
+
+import pytest
+
+from henge import Henge, canonical_str, md5
+from henge.serializer import SERIALIZERS, Serializer, get_serializer
+
+from .test_henge import TestRetrieveMany
+
+with open("tests/data/canonical_corpus.json") as f:
+    CORPUS = json.load(f)
+
+
+def available():
+    names = []
+    for name in SERIALIZERS:
+        try:
+            get_serializer(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+@pytest.fixture(params=available())
+def serializer(request):
+    return get_serializer(request.param)
+
+
+class Color(enum.Enum):
+    RED = "red"
+
+
+class Name(str):
+    pass
+
+
+class TestConformance:
+    @pytest.mark.parametrize("entry", CORPUS, ids=range(len(CORPUS)))
+    def test_corpus(self, serializer, entry):
+        assert serializer.dumps(entry["item"]) == entry["canonical"]
+        assert md5(serializer.dumps(entry["item"])) == entry["md5"]
+        assert serializer.loads(entry["canonical"]) == entry["item"]
+
+    @pytest.mark.parametrize(
+        "item",
+        [
+            (1, "a"),
+            {"a": (1.5, 2**64)},
+            "\ud800 lone surrogate",
+            [Name("Pat"), True],
+            {1: "integer key"},
+            float("1e400"),
+        ],
+    )
+    def test_unusual_items_match_json(self, serializer, item):
+        try:
+            expected = canonical_str(item)
+        except ValueError as e:
+            with pytest.raises(type(e)):
+                serializer.dumps(item)
+        else:
+            assert serializer.dumps(item) == expected
+
+    @pytest.mark.parametrize("item", [uuid.uuid4(), Color.RED, {"a": {1, 2}}])
+    def test_rejects_what_json_rejects(self, serializer, item):
+        with pytest.raises(TypeError):
+            serializer.dumps(item)
+
+    @pytest.mark.parametrize("string", ['"\\ud800"', "[1e400]", "[" + "9" * 30 + "]"])
+    def test_loads_what_json_loads(self, serializer, string):
+        assert repr(serializer.loads(string)) == repr(json.loads(string))
+
+    def test_druids_match_across_serializers(self):
+        fams = TestRetrieveMany.fams
+        results = []
+        for name in available():
+            h = Henge({}, ["tests/data/family.yaml"], serializer=name)
+            druids = h.insert_many(fams, "family")
+            assert h.retrieve_many(druids) == fams
+            results.append((druids, h.database))
+        assert all(result == results[0] for result in results)
+
+
+class TestGetSerializer:
+    def test_choices(self):
+        custom = Serializer()
+        assert get_serializer(custom) is custom
+        assert get_serializer("json").name == "json"
+        assert get_serializer().name in available()
+        with pytest.raises(ValueError):
+            get_serializer("pickle")